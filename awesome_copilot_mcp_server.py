@@ -9,12 +9,605 @@ Based on: https://github.com/github/awesome-copilot
 """
 
 import asyncio
+import base64
+import cProfile
+import functools
+import hashlib
+import heapq
+import inspect
+import io
+import itertools
 import json
-from typing import Any, Dict, List, Optional
-from mcp.server.fastmcp import FastMCP
+import logging
+import math
+import mmap
+import operator
+import os
+import pstats
+import random
+import re
+import shutil
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict, defaultdict, deque
+from collections.abc import Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import anyio
+from mcp.server.fastmcp import Context, FastMCP
+from mcp.server.lowlevel import NotificationOptions
+from mcp.types import CallToolResult, GetPromptResult, ReadResourceResult
+
+logger = logging.getLogger(__name__)
+
+# Metrics for every tool, resource and prompt
+#
+# Each call records its latency in a fixed-bucket histogram, whether it
+# failed (raised, or returned an {"error": ...} result) and the size of its
+# response. Text responses are sized by length on every call; structured
+# responses are JSON-encoded for sizing only on every Nth call, to keep the
+# cost of leaving metrics on negligible.
+METRICS_ENABLED = os.environ.get("AWESOME_COPILOT_METRICS", "1").lower() not in ("0", "false", "no")
+METRICS_SIZE_SAMPLE_EVERY = 16
+METRICS_HTTP_PATH = os.environ.get("AWESOME_COPILOT_METRICS_PATH", "/metrics")
+LATENCY_BUCKETS_SECONDS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+class EndpointMetrics:
+    """Counters and latency histogram for one tool, resource or prompt."""
+
+    __slots__ = ("calls", "errors", "buckets", "latency_sum", "latency_max",
+                 "bytes_sum", "bytes_max", "bytes_samples", "lock")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        # One count per bucket plus a final +Inf bucket, not cumulative
+        self.buckets = [0] * (len(LATENCY_BUCKETS_SECONDS) + 1)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.bytes_sum = 0
+        self.bytes_max = 0
+        self.bytes_samples = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float, error: bool, size: Optional[int]) -> None:
+        bucket = bisect_left(LATENCY_BUCKETS_SECONDS, seconds)
+        with self.lock:
+            self.calls += 1
+            self.errors += error
+            self.buckets[bucket] += 1
+            self.latency_sum += seconds
+            if seconds > self.latency_max:
+                self.latency_max = seconds
+            if size is not None:
+                self.bytes_sum += size
+                self.bytes_samples += 1
+                if size > self.bytes_max:
+                    self.bytes_max = size
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a latency quantile as the upper bound of its bucket."""
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_SECONDS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.latency_max)
+        return self.latency_max
+
+class Metrics:
+    """Registry of per-endpoint metrics, keyed by (kind, name)."""
+
+    def __init__(self):
+        self.endpoints: Dict[Tuple[str, str], EndpointMetrics] = {}
+        self.started_at = time.time()
+
+    def endpoint(self, kind: str, name: str) -> EndpointMetrics:
+        key = (kind, name)
+        endpoint = self.endpoints.get(key)
+        if endpoint is None:
+            endpoint = self.endpoints.setdefault(key, EndpointMetrics())
+        return endpoint
+
+    def to_dict(self) -> Dict[str, Any]:
+        endpoints = []
+        for (kind, name), endpoint in sorted(self.endpoints.items()):
+            calls = endpoint.calls
+            endpoints.append({
+                "kind": kind,
+                "name": name,
+                "calls": calls,
+                "errors": endpoint.errors,
+                "latency_ms": {
+                    "mean": round(endpoint.latency_sum / calls * 1000, 3) if calls else None,
+                    "p50": _ms(endpoint.quantile(0.5)),
+                    "p90": _ms(endpoint.quantile(0.9)),
+                    "p99": _ms(endpoint.quantile(0.99)),
+                    "max": _ms(endpoint.latency_max) if calls else None,
+                },
+                "response_bytes": {
+                    "mean": round(endpoint.bytes_sum / endpoint.bytes_samples) if endpoint.bytes_samples else None,
+                    "max": endpoint.bytes_max,
+                    "samples": endpoint.bytes_samples,
+                },
+            })
+        return {"uptime_seconds": round(time.time() - self.started_at, 1), "endpoints": endpoints,
+                "result_cache": RESULT_CACHE.stats(),
+                "offload": {name: limiter.to_dict() for name, limiter in sorted(OFFLOAD_LIMITERS.items())}}
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP awesome_copilot_mcp_calls_total Calls per MCP endpoint.",
+            "# TYPE awesome_copilot_mcp_calls_total counter",
+        ]
+        items = sorted(self.endpoints.items())
+        labels = {key: f'kind="{_prometheus_escape(key[0])}",name="{_prometheus_escape(key[1])}"' for key, _ in items}
+        lines.extend(f"awesome_copilot_mcp_calls_total{{{labels[key]}}} {e.calls}" for key, e in items)
+        lines.extend([
+            "# HELP awesome_copilot_mcp_errors_total Failed calls per MCP endpoint.",
+            "# TYPE awesome_copilot_mcp_errors_total counter",
+        ])
+        lines.extend(f"awesome_copilot_mcp_errors_total{{{labels[key]}}} {e.errors}" for key, e in items)
+        lines.extend([
+            "# HELP awesome_copilot_mcp_latency_seconds Call latency per MCP endpoint.",
+            "# TYPE awesome_copilot_mcp_latency_seconds histogram",
+        ])
+        for key, endpoint in items:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS_SECONDS, endpoint.buckets):
+                cumulative += count
+                lines.append(f'awesome_copilot_mcp_latency_seconds_bucket{{{labels[key]},le="{bound}"}} {cumulative}')
+            lines.append(f'awesome_copilot_mcp_latency_seconds_bucket{{{labels[key]},le="+Inf"}} {endpoint.calls}')
+            lines.append(f"awesome_copilot_mcp_latency_seconds_sum{{{labels[key]}}} {endpoint.latency_sum}")
+            lines.append(f"awesome_copilot_mcp_latency_seconds_count{{{labels[key]}}} {endpoint.calls}")
+        lines.extend([
+            "# HELP awesome_copilot_mcp_response_bytes Sampled response sizes per MCP endpoint.",
+            "# TYPE awesome_copilot_mcp_response_bytes summary",
+        ])
+        for key, endpoint in items:
+            lines.append(f"awesome_copilot_mcp_response_bytes_sum{{{labels[key]}}} {endpoint.bytes_sum}")
+            lines.append(f"awesome_copilot_mcp_response_bytes_count{{{labels[key]}}} {endpoint.bytes_samples}")
+        offload = sorted(OFFLOAD_LIMITERS.items())
+        lines.extend([
+            "# HELP awesome_copilot_mcp_offload_waiting Calls queued for a worker thread slot.",
+            "# TYPE awesome_copilot_mcp_offload_waiting gauge",
+        ])
+        lines.extend(f'awesome_copilot_mcp_offload_waiting{{name="{_prometheus_escape(name)}"}} {limiter.waiting}'
+                     for name, limiter in offload)
+        lines.extend([
+            "# HELP awesome_copilot_mcp_offload_running Calls running on worker threads.",
+            "# TYPE awesome_copilot_mcp_offload_running gauge",
+        ])
+        lines.extend(f'awesome_copilot_mcp_offload_running{{name="{_prometheus_escape(name)}"}} '
+                     f'{int(limiter.limiter.borrowed_tokens)}' for name, limiter in offload)
+        cache = RESULT_CACHE.stats()
+        lines.extend([
+            "# HELP awesome_copilot_mcp_result_cache_lookups_total Result cache lookups by outcome.",
+            "# TYPE awesome_copilot_mcp_result_cache_lookups_total counter",
+            f'awesome_copilot_mcp_result_cache_lookups_total{{result="hit"}} {cache["hits"]}',
+            f'awesome_copilot_mcp_result_cache_lookups_total{{result="miss"}} {cache["misses"]}',
+            "# HELP awesome_copilot_mcp_result_cache_evictions_total Result cache entries dropped, by reason.",
+            "# TYPE awesome_copilot_mcp_result_cache_evictions_total counter",
+            f'awesome_copilot_mcp_result_cache_evictions_total{{reason="size"}} {cache["evictions"]}',
+            f'awesome_copilot_mcp_result_cache_evictions_total{{reason="ttl"}} {cache["expirations"]}',
+            "# HELP awesome_copilot_mcp_result_cache_bytes Size of the cached results.",
+            "# TYPE awesome_copilot_mcp_result_cache_bytes gauge",
+            f"awesome_copilot_mcp_result_cache_bytes {cache['bytes']}",
+            "# HELP awesome_copilot_mcp_result_cache_entries Number of cached results.",
+            "# TYPE awesome_copilot_mcp_result_cache_entries gauge",
+            f"awesome_copilot_mcp_result_cache_entries {cache['entries']}",
+        ])
+        return "\n".join(lines) + "\n"
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def _prometheus_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+METRICS = Metrics()
+
+def _response_size(result: Any, calls: int) -> Optional[int]:
+    if isinstance(result, (str, bytes)):
+        return len(result)
+    if calls % METRICS_SIZE_SAMPLE_EVERY:
+        return None
+    try:
+        return len(json.dumps(result, default=str))
+    except (TypeError, ValueError):
+        return None
+
+def _instrument(kind: str, name: str, fn: Callable) -> Callable:
+    """Wrap `fn` so every call is recorded under (kind, name)."""
+    endpoint = METRICS.endpoint(kind, name)
+
+    def record(start: float, result: Any, error: bool) -> None:
+        if not error and isinstance(result, dict) and "error" in result:
+            error = True
+        endpoint.observe(time.perf_counter() - start, error, _response_size(result, endpoint.calls))
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException:
+                record(start, None, True)
+                raise
+            record(start, result, False)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            record(start, None, True)
+            raise
+        record(start, result, False)
+        return result
+    return wrapper
+
+# Offloading slow tools from the event loop
+#
+# Handlers registered with offload=True run on worker threads, so a slow
+# call (a guide render over a large catalog, a prompt body download) does
+# not hold up the other requests multiplexed on the event loop. Each
+# handler has its own concurrency limit (AWESOME_COPILOT_TOOL_CONCURRENCY);
+# calls over it wait in a queue whose depth is reported in the metrics.
+# All offloaded calls share AWESOME_COPILOT_OFFLOAD_THREADS threads.
+# CPU-bound Python still holds the GIL, so threads keep the event loop
+# responsive rather than adding parallelism; serve with more HTTP workers
+# for that. AWESOME_COPILOT_OFFLOAD=0 runs every handler on the loop.
+OFFLOAD_ENABLED = os.environ.get("AWESOME_COPILOT_OFFLOAD", "1").lower() not in ("0", "false", "no")
+TOOL_CONCURRENCY = int(os.environ.get("AWESOME_COPILOT_TOOL_CONCURRENCY", "4"))
+OFFLOAD_THREADS = int(os.environ.get("AWESOME_COPILOT_OFFLOAD_THREADS", "8"))
+
+_offload_threads = anyio.CapacityLimiter(OFFLOAD_THREADS)
+
+class ToolLimiter:
+    """Concurrency limit and queue-depth counters for one offloaded handler."""
+
+    def __init__(self, limit: int):
+        self.limiter = anyio.CapacityLimiter(limit)
+        self.waiting = 0
+        self.max_waiting = 0
+        self.calls = 0
+        self.wait_seconds = 0.0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run `fn` on a worker thread once a slot is free."""
+        start = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self.limiter.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            self.calls += 1
+            self.wait_seconds += time.perf_counter() - start
+            return await anyio.to_thread.run_sync(
+                functools.partial(fn, *args, **kwargs), limiter=_offload_threads)
+        finally:
+            self.limiter.release()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limiter.total_tokens),
+            "running": int(self.limiter.borrowed_tokens),
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "calls": self.calls,
+            "mean_wait_ms": round(self.wait_seconds / self.calls * 1000, 3) if self.calls else None,
+        }
+
+OFFLOAD_LIMITERS: Dict[str, ToolLimiter] = {}
+
+def _offload(name: str, fn: Callable) -> Callable:
+    """Wrap synchronous `fn` in an async handler that runs it on a worker thread."""
+    limiter = OFFLOAD_LIMITERS.setdefault(name, ToolLimiter(TOOL_CONCURRENCY))
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if not OFFLOAD_ENABLED:
+            return fn(*args, **kwargs)
+        return await limiter.run(fn, *args, **kwargs)
+    return wrapper
+
+# Profiling individual calls
+#
+# Operators can capture cProfile stats and a tracemalloc snapshot of single
+# tool and resource calls in a running server: a random fraction of calls
+# (sample_rate), every call slower than slow_ms, or both. Profiling is
+# switched on with AWESOME_COPILOT_PROFILE=1 or toggled with PROFILE_SIGNAL
+# (kill -USR2 <pid>). The configure_profiling tool, which any client could
+# call, is only registered with AWESOME_COPILOT_PROFILE_TOOL=1. While
+# profiling is off, a handler call costs one attribute check.
+#
+# A slow call is only known to be slow once it ends, so with slow_ms set
+# every call is profiled and the fast ones are thrown away. Each capture is
+# a directory named after its time, handler, argument hash and registry
+# version. It holds profile.pstats, allocations.tracemalloc, summary.txt
+# and meta.json, and only the newest PROFILE_KEEP captures are kept.
+# cProfile sees only the calling thread, so synchronous handlers are
+# profiled, offloaded ones on their worker thread. tracemalloc traces the
+# whole process, so allocations by concurrent requests show up as well.
+PROFILE_SIGNAL = getattr(signal, "SIGUSR2", None)
+PROFILE_TRACEMALLOC_FRAMES = 16
+PROFILE_SUMMARY_LINES = 25
+
+class CallProfiler:
+    """Decides which handler calls to profile and writes their captures."""
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.0, slow_ms: float = 1000.0,
+                 directory: Optional[str] = None, keep: int = 100, memory: bool = True):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.slow_ms = 0.0
+        self.handlers: Optional[frozenset] = None
+        self.memory = memory
+        self.directory = directory
+        self.keep = keep
+        self.captures = 0
+        self._lock = threading.Lock()
+        self._tracing = 0
+        self._owns_tracemalloc = False
+        self.configure(enabled, sample_rate, slow_ms)
+
+    def configure(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None,
+                  slow_ms: Optional[float] = None, handlers: Optional[List[str]] = None,
+                  memory: Optional[bool] = None) -> None:
+        """Change the settings that are not None; an empty `handlers` list means all."""
+        if sample_rate is not None and not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        if slow_ms is not None and slow_ms < 0:
+            raise ValueError(f"slow_ms must not be negative, got {slow_ms}")
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if handlers is not None:
+            self.handlers = frozenset(handlers) or None
+        if memory is not None:
+            self.memory = memory
+        if enabled is not None:
+            self.enabled = enabled
+
+    def capture_directory(self) -> str:
+        return self.directory or os.path.join(_cache_dir(), "profiles")
+
+    def recent(self, limit: int = 10) -> List[str]:
+        """Names of the newest captures, newest first."""
+        try:
+            names = sorted((name for name in os.listdir(self.capture_directory())
+                            if not name.endswith(".tmp")), reverse=True)
+        except OSError:
+            return []
+        return names[:limit]
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "handlers": sorted(self.handlers) if self.handlers else None,
+            "memory": self.memory,
+            "directory": self.capture_directory(),
+            "keep": self.keep,
+            "captures": self.captures,
+            "recent": self.recent(),
+        }
+
+    def _start_tracing(self) -> None:
+        with self._lock:
+            if self._tracing == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                self._owns_tracemalloc = True
+            self._tracing += 1
+
+    def _stop_tracing(self) -> None:
+        with self._lock:
+            self._tracing -= 1
+            if self._tracing == 0 and self._owns_tracemalloc:
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+
+    def run(self, kind: str, name: str, fn: Callable, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        """Call `fn`, capturing a profile if the call is sampled or turns out slow."""
+        if self.handlers is not None and name not in self.handlers:
+            return fn(*args, **kwargs)
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_ms <= 0:
+            return fn(*args, **kwargs)
+
+        memory = self.memory
+        if memory:
+            self._start_tracing()
+        profile: Optional[cProfile.Profile] = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (one per process from Python 3.12)
+            profile = None
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+            allocations = tracemalloc.take_snapshot() if memory else None
+            if memory:
+                self._stop_tracing()
+            reason = "sampled" if sampled else "slow" if elapsed * 1000 >= self.slow_ms else None
+            if reason and profile is not None:
+                try:
+                    self._write(kind, name, args, kwargs, elapsed, reason, profile, allocations)
+                except OSError as e:
+                    logger.warning("Could not write the profile of %s %s: %s", kind, name, e)
+
+    def _write(self, kind: str, name: str, args: tuple, kwargs: Dict[str, Any], elapsed: float,
+               reason: str, profile: cProfile.Profile,
+               allocations: Optional[tracemalloc.Snapshot]) -> str:
+        version = get_snapshot().version
+        arguments_hash = hashlib.sha256(
+            json.dumps([args, kwargs], sort_keys=True, default=str).encode("utf-8")).hexdigest()[:8]
+        now = time.time()
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{now % 1:.6f}"[1:]
+        label = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+        root = self.capture_directory()
+        path = os.path.join(root, f"{stamp}-{label}-{arguments_hash}-{version}")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        os.makedirs(temp_path)
+
+        profile.dump_stats(os.path.join(temp_path, "profile.pstats"))
+        summary = io.StringIO()
+        summary.write(f"{kind} {name} took {elapsed * 1000:.1f} ms ({reason}), registry {version}\n\n")
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(PROFILE_SUMMARY_LINES)
+        if allocations is not None:
+            allocations.dump(os.path.join(temp_path, "allocations.tracemalloc"))
+            summary.write("Largest allocations still held when the call returned:\n")
+            for statistic in allocations.statistics("lineno")[:PROFILE_SUMMARY_LINES]:
+                summary.write(f"  {statistic}\n")
+        with open(os.path.join(temp_path, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        with open(os.path.join(temp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "kind": kind,
+                "name": name,
+                "arguments_hash": arguments_hash,
+                "argument_names": sorted(kwargs),
+                "registry_version": version,
+                "elapsed_ms": round(elapsed * 1000, 3),
+                "reason": reason,
+                "started_at": now - elapsed,
+                "thread": threading.current_thread().name,
+            }, f, indent=2)
+        os.rename(temp_path, path)
+
+        with self._lock:
+            self.captures += 1
+            for old in self.recent(limit=sys.maxsize)[self.keep:]:
+                shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+        return path
+
+PROFILER = CallProfiler(
+    enabled=os.environ.get("AWESOME_COPILOT_PROFILE", "").lower() in ("1", "true", "yes"),
+    sample_rate=float(os.environ.get("AWESOME_COPILOT_PROFILE_SAMPLE", "0")),
+    slow_ms=float(os.environ.get("AWESOME_COPILOT_PROFILE_SLOW_MS", "1000")),
+    directory=os.environ.get("AWESOME_COPILOT_PROFILE_DIR") or None,
+    keep=int(os.environ.get("AWESOME_COPILOT_PROFILE_KEEP", "100")),
+)
+PROFILE_TOOL_ENABLED = os.environ.get("AWESOME_COPILOT_PROFILE_TOOL", "").lower() in ("1", "true", "yes")
+
+def _profiled(kind: str, name: str, fn: Callable) -> Callable:
+    """Wrap synchronous `fn` so PROFILER can capture its calls."""
+    if inspect.iscoroutinefunction(fn):
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return fn(*args, **kwargs)
+        return PROFILER.run(kind, name, fn, args, kwargs)
+    return wrapper
+
+def _toggle_profiling(signum: int, frame: Any) -> None:
+    PROFILER.configure(enabled=not PROFILER.enabled)
+    logger.info("Profiling %s", "enabled" if PROFILER.enabled else "disabled")
+
+def install_profiling_signal() -> None:
+    """Toggle profiling on PROFILE_SIGNAL. Call from the main thread of a server process."""
+    if PROFILE_SIGNAL is not None and threading.current_thread() is threading.main_thread():
+        signal.signal(PROFILE_SIGNAL, _toggle_profiling)
+
+class InstrumentedFastMCP(FastMCP):
+    """FastMCP server that records metrics for every registered handler.
+
+    The decorators register an instrumented wrapper and hand back the
+    original function, so direct Python calls are not counted or profiled.
+    Tools and resources registered with `offload=True` are run on worker
+    threads.
+
+    Every request is also pinned to the registry version that was current
+    when it arrived (see `get_snapshot`), and tool, resource and prompt
+    results carry that version as `_meta.registry_version`.
+    """
+
+    VERSIONED_RESULTS = (CallToolResult, ReadResourceResult, GetPromptResult)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sessions are sent resources/list_changed when a reload publishes
+        self._mcp_server.create_initialization_options = functools.partial(
+            self._mcp_server.create_initialization_options,
+            NotificationOptions(resources_changed=True))
+        handlers = self._mcp_server.request_handlers
+        for request_type, handler in list(handlers.items()):
+            handlers[request_type] = self._pinned(handler)
+
+    def _pinned(self, handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        async def wrapper(request):
+            _track_session(self._mcp_server.request_context.session)
+            snapshot = get_snapshot()
+            token = _request_snapshot.set(snapshot)
+            try:
+                result = await handler(request)
+            finally:
+                _request_snapshot.reset(token)
+            if isinstance(result.root, self.VERSIONED_RESULTS):
+                result.root.meta = {**(result.root.meta or {}), "registry_version": snapshot.version}
+            return result
+        return wrapper
+
+    def tool(self, name: Optional[str] = None, *args, offload: bool = False, **kwargs):
+        register = super().tool(name, *args, **kwargs)
+        def decorator(fn):
+            handler = _profiled("tool", name or fn.__name__, fn)
+            handler = _offload(name or fn.__name__, handler) if offload else handler
+            register(_instrument("tool", name or fn.__name__, handler) if METRICS_ENABLED else handler)
+            return fn
+        return decorator
+
+    def resource(self, uri: str, offload: bool = False, **kwargs):
+        register = super().resource(uri, **kwargs)
+        def decorator(fn):
+            handler = _profiled("resource", uri, fn)
+            handler = _offload(uri, handler) if offload else handler
+            register(_instrument("resource", uri, handler) if METRICS_ENABLED else handler)
+            return fn
+        return decorator
+
+    def prompt(self, name: Optional[str] = None, *args, **kwargs):
+        register = super().prompt(name, *args, **kwargs)
+        def decorator(fn):
+            register(_instrument("prompt", name or fn.__name__, fn) if METRICS_ENABLED else fn)
+            return fn
+        return decorator
 
 # Create the MCP server
-mcp = FastMCP(
+mcp = InstrumentedFastMCP(
     "Awesome Copilot Prompts",
     dependencies=["requests", "pydantic"]
 )
@@ -234,288 +827,4449 @@ PROMPTS_REGISTRY = {
     }
 }
 
-# Resources for exposing prompt metadata and content
-@mcp.resource("copilot-prompts://list")
-def list_all_prompts() -> str:
-    """Get a list of all available GitHub Copilot prompts."""
-    prompts_info = []
-    for prompt_id, metadata in PROMPTS_REGISTRY.items():
-        prompts_info.append({
-            "id": prompt_id,
-            "title": metadata["title"],
-            "description": metadata["description"],
-            "category": metadata["category"],
-            "url": f"https://github.com/github/awesome-copilot/blob/main/prompts/{prompt_id}.prompt.md"
-        })
-    
-    return json.dumps(prompts_info, indent=2)
+# Registry snapshots and derived indexes
+#
+# PROMPTS_REGISTRY above is only the built-in source data. Tools never read
+# it directly: they grab the current RegistrySnapshot once per call and use
+# its compact records and the indexes cached on it, which are built lazily
+# the first time they are needed for a given registry version. Call
+# publish_registry() to replace the registry.
 
-@mcp.resource("copilot-prompts://categories")
-def list_prompt_categories() -> str:
-    """Get all prompt categories and their counts."""
-    categories = {}
-    for metadata in PROMPTS_REGISTRY.values():
-        category = metadata["category"]
-        categories[category] = categories.get(category, 0) + 1
-    
-    return json.dumps(categories, indent=2)
+# A snapshot built from a registry that differs from the previous version in
+# only a few prompts shares the unchanged records with it and patches its
+# indexes; diffs touching more than this fraction of the prompts rebuild
+SNAPSHOT_PATCH_MAX_RATIO = 0.1
 
-@mcp.resource("copilot-prompts://{category}")
-def get_prompts_by_category(category: str) -> str:
-    """Get all prompts in a specific category."""
-    filtered_prompts = []
-    for prompt_id, metadata in PROMPTS_REGISTRY.items():
-        if metadata["category"] == category:
-            filtered_prompts.append({
-                "id": prompt_id,
-                "title": metadata["title"],
-                "description": metadata["description"],
-                "tools": metadata["tools"],
-                "url": f"https://github.com/github/awesome-copilot/blob/main/prompts/{prompt_id}.prompt.md"
-            })
-    
-    return json.dumps(filtered_prompts, indent=2)
+# Bytes of each entry's digest; a registry version hashes their sum
+ENTRY_DIGEST_BYTES = 16
+_DIGEST_MODULUS = 1 << (8 * ENTRY_DIGEST_BYTES)
+_entry_encoder = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
 
-@mcp.resource("copilot-prompts://prompt/{prompt_id}")
-def get_prompt_details(prompt_id: str) -> str:
-    """Get detailed information about a specific prompt."""
-    if prompt_id not in PROMPTS_REGISTRY:
-        return json.dumps({"error": f"Prompt '{prompt_id}' not found"})
-    
-    metadata = PROMPTS_REGISTRY[prompt_id]
-    details = {
-        "id": prompt_id,
-        "title": metadata["title"],
-        "description": metadata["description"],
-        "category": metadata["category"],
-        "tools": metadata["tools"],
-        "url": f"https://github.com/github/awesome-copilot/blob/main/prompts/{prompt_id}.prompt.md",
-        "install_url": f"https://vscode.dev/redirect?url=vscode%3Achat-prompt%2Finstall%3Furl%3Dhttps%3A%2F%2Fraw.githubusercontent.com%2Fgithub%2Fawesome-copilot%2Fmain%2Fprompts%2F{prompt_id}.prompt.md"
-    }
-    
-    return json.dumps(details, indent=2)
+def _entry_digest(prompt_id: str, metadata: Dict[str, Any]) -> bytes:
+    encoded = _entry_encoder.encode([prompt_id, metadata])
+    return hashlib.sha256(encoded.encode("utf-8")).digest()[:ENTRY_DIGEST_BYTES]
 
-# Tools for working with prompts
-@mcp.tool()
-def search_prompts(query: str, category: Optional[str] = None) -> List[Dict[str, Any]]:
-    """
-    Search for prompts by title, description, or category.
-    
-    Args:
-        query: Search query to match against title and description
-        category: Optional category filter
-    
-    Returns:
-        List of matching prompts with their metadata
+def _digest_version(total: int) -> str:
+    return hashlib.sha256((total % _DIGEST_MODULUS).to_bytes(ENTRY_DIGEST_BYTES, "little")).hexdigest()[:12]
+
+def _registry_version(registry: Dict[str, Dict[str, Any]]) -> str:
+    """Content hash identifying a registry version.
+
+    Each entry is hashed on its own and the version is the hash of the sum
+    of those digests, so it does not depend on the order of the entries and
+    a patched snapshot only hashes the entries that changed.
     """
-    results = []
-    query_lower = query.lower()
-    
-    for prompt_id, metadata in PROMPTS_REGISTRY.items():
-        # Filter by category if specified
-        if category and metadata["category"] != category:
-            continue
-        
-        # Search in title and description
-        if (query_lower in metadata["title"].lower() or 
-            query_lower in metadata["description"].lower() or
-            query_lower in metadata["category"].lower()):
-            
-            results.append({
-                "id": prompt_id,
-                "title": metadata["title"],
-                "description": metadata["description"],
-                "category": metadata["category"],
-                "tools": metadata["tools"],
-                "url": f"https://github.com/github/awesome-copilot/blob/main/prompts/{prompt_id}.prompt.md"
-            })
-    
-    return results
+    return _digest_version(sum(
+        int.from_bytes(_entry_digest(prompt_id, metadata), "little")
+        for prompt_id, metadata in registry.items()))
 
-@mcp.tool()
-def get_prompt_installation_instructions(prompt_id: str) -> Dict[str, Any]:
+# Builders for the derived indexes, keyed by index name
+_INDEX_BUILDERS: Dict[str, Callable[["RegistrySnapshot"], Any]] = {}
+# Loaders for indexes that can be stored in a compiled snapshot
+_INDEX_LOADERS: Dict[str, Callable[["RegistrySnapshot", Dict[str, Any], Dict[str, memoryview]], Any]] = {}
+# Patchers for indexes that can be carried over to a patched snapshot:
+# (index, previous snapshot, patched snapshot, diff) -> index, or None to build it
+_INDEX_PATCHERS: Dict[str, Callable[[Any, "RegistrySnapshot", "RegistrySnapshot", "SnapshotDiff"], Any]] = {}
+
+class RenderedPayload:
+    """A response body rendered once per registry version.
+
+    `etag` is a hash of the UTF-8 encoded body, so it only changes when the
+    content does, even across registry versions.
     """
-    Get installation instructions for a specific prompt.
-    
-    Args:
-        prompt_id: The ID of the prompt to get installation instructions for
-    
-    Returns:
-        Installation instructions and URLs
+
+    __slots__ = ("text", "etag", "size")
+
+    def __init__(self, text: str):
+        data = text.encode("utf-8")
+        self.text = text
+        self.etag = hashlib.sha256(data).hexdigest()[:16]
+        self.size = len(data)
+
+    @classmethod
+    def stored(cls, data: memoryview, etag: str) -> "RenderedPayload":
+        """A payload whose UTF-8 body and etag were stored in a compiled snapshot."""
+        payload = cls.__new__(cls)
+        payload.text = str(data, "utf-8")
+        payload.etag = etag
+        payload.size = len(data)
+        return payload
+
+class PromptRecord:
+    """Compact registry entry.
+
+    Strings are interned and `tools` tuples are shared between every entry
+    with the same tool list, so a large catalog stores each distinct tool
+    name, category and tool list once.
     """
-    if prompt_id not in PROMPTS_REGISTRY:
-        return {"error": f"Prompt '{prompt_id}' not found"}
-    
-    metadata = PROMPTS_REGISTRY[prompt_id]
-    
-    return {
-        "prompt_id": prompt_id,
-        "title": metadata["title"],
-        "description": metadata["description"],
-        "installation": {
-            "vscode": f"https://vscode.dev/redirect?url=vscode%3Achat-prompt%2Finstall%3Furl%3Dhttps%3A%2F%2Fraw.githubusercontent.com%2Fgithub%2Fawesome-copilot%2Fmain%2Fprompts%2F{prompt_id}.prompt.md",
-            "vscode_insiders": f"https://insiders.vscode.dev/redirect?url=vscode-insiders%3Achat-prompt%2Finstall%3Furl%3Dhttps%3A%2F%2Fraw.githubusercontent.com%2Fgithub%2Fawesome-copilot%2Fmain%2Fprompts%2F{prompt_id}.prompt.md",
-            "raw_url": f"https://raw.githubusercontent.com/github/awesome-copilot/main/prompts/{prompt_id}.prompt.md"
-        },
-        "usage_instructions": [
-            f"Use `/{prompt_id}` in VS Code chat",
-            "Run `Chat: Run Prompt` command",
-            "Hit the run button while you have a prompt open"
-        ]
-    }
 
-@mcp.tool()
-def get_prompts_by_tools(required_tools: List[str]) -> List[Dict[str, Any]]:
+    __slots__ = ("id", "title", "description", "category_code", "tools", "tool_mask", "mode")
+
+    def __init__(self, prompt_id: str, title: str, description: str,
+                 category_code: int, tools: Tuple[str, ...], tool_mask: int, mode: str):
+        self.id = prompt_id
+        self.title = title
+        self.description = description
+        self.category_code = category_code
+        self.tools = tools
+        self.tool_mask = tool_mask
+        self.mode = mode
+
+# Postings with at least this many docs to renumber are renumbered with NumPy
+DIFF_VECTOR_MIN_DOCS = 64
+
+class SnapshotDiff:
+    """How the docs of a patched snapshot relate to those of the snapshot it was patched from.
+
+    `remap[old]` is the new doc of a prompt that was kept as it was, or -1,
+    and `origins[new]` is the old doc of a kept prompt, or -1. `removed`
+    lists the old docs of the prompts removed or changed and `added` the
+    new docs of the prompts added or changed, both in ascending order. Kept
+    prompts stay in the same order, and those before `first_moved` keep
+    their doc numbers.
     """
-    Find prompts that use specific tools.
-    
-    Args:
-        required_tools: List of tools that the prompts should support
-    
-    Returns:
-        List of prompts that use the specified tools
+
+    __slots__ = ("remap", "origins", "removed", "added", "first_moved", "removed_bits", "_remap_array")
+
+    def __init__(self, remap: array, origins: array, removed: List[int], added: List[int],
+                 first_moved: int):
+        self.remap = remap
+        self.origins = origins
+        self.removed = removed
+        self.added = added
+        self.first_moved = first_moved
+        self.removed_bits = _bitset(removed, len(remap))
+        self._remap_array = None
+
+    @property
+    def moved(self) -> bool:
+        return self.first_moved < len(self.remap)
+
+    def docs(self, docs: array) -> array:
+        """Renumber sorted old docs of kept prompts."""
+        start = bisect_left(docs, self.first_moved)
+        if start == len(docs):
+            return docs
+        tail = docs[start:]
+        if len(tail) < DIFF_VECTOR_MIN_DOCS:
+            remap = self.remap
+            return docs[:start] + array("I", [remap[doc] for doc in tail])
+        import numpy as np
+
+        if self._remap_array is None:
+            self._remap_array = np.frombuffer(self.remap, dtype=np.int32).astype(np.uint32)
+        renumbered = docs[:start]
+        renumbered.frombytes(self._remap_array[np.frombuffer(tail, dtype=np.uint32)].tobytes())
+        return renumbered
+
+    def bits(self, bits: int) -> int:
+        """Renumber a bitset over old docs; the bits of removed and added docs end up clear."""
+        if not self.moved:
+            return bits & ~self.removed_bits
+        for doc in reversed(self.removed):
+            bits = (bits & ((1 << doc) - 1)) | (bits >> (doc + 1) << doc)
+        for doc in self.added:
+            bits = (bits & ((1 << doc) - 1)) | (bits >> doc << (doc + 1))
+        return bits
+
+class RegistrySnapshot:
+    """An immutable, versioned view of the prompt registry.
+
+    Categories and tools are interned into vocabularies: records carry an
+    integer category code and a bitmask over tool codes alongside the shared
+    tool tuple, and per-category doc lists are kept as integer arrays.
     """
-    results = []
-    
-    for prompt_id, metadata in PROMPTS_REGISTRY.items():
-        prompt_tools = set(metadata["tools"])
-        required_tools_set = set(required_tools)
-        
-        # Check if all required tools are supported by this prompt
-        if required_tools_set.issubset(prompt_tools):
-            results.append({
-                "id": prompt_id,
-                "title": metadata["title"],
-                "description": metadata["description"],
-                "category": metadata["category"],
-                "tools": metadata["tools"],
-                "matching_tools": list(required_tools_set.intersection(prompt_tools)),
-                "url": f"https://github.com/github/awesome-copilot/blob/main/prompts/{prompt_id}.prompt.md"
-            })
-    
-    return results
 
-@mcp.tool()
-def generate_prompt_usage_guide(category: Optional[str] = None) -> str:
+    def __init__(self, registry: Dict[str, Dict[str, Any]]):
+        self.categories: List[str] = []
+        self.category_codes: Dict[str, int] = {}
+        self.tools: List[str] = []
+        self.tool_codes: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.records: List[PromptRecord] = []
+        self.positions: Dict[str, int] = {}
+        self._tool_lists: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        category_docs: Dict[int, array] = {}
+        digests = bytearray()
+        total = 0
+
+        for doc, (prompt_id, metadata) in enumerate(registry.items()):
+            record = self._record(prompt_id, metadata)
+            category_docs.setdefault(record.category_code, array("I")).append(doc)
+            self._append(record)
+            digest = _entry_digest(prompt_id, metadata)
+            digests += digest
+            total += int.from_bytes(digest, "little")
+        self._finish(category_docs, digests, total)
+
+    def _record(self, prompt_id: str, metadata: Dict[str, Any]) -> PromptRecord:
+        """Intern a registry entry, adding its category and tools to the vocabularies."""
+        category = sys.intern(metadata["category"])
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+
+        tools = tuple(sys.intern(tool) for tool in metadata["tools"])
+        tools = self._tool_lists.setdefault(tools, tools)
+        tool_mask = 0
+        for tool in tools:
+            tool_code = self.tool_codes.get(tool)
+            if tool_code is None:
+                tool_code = self.tool_codes[tool] = len(self.tools)
+                self.tools.append(tool)
+            tool_mask |= 1 << tool_code
+
+        return PromptRecord(
+            sys.intern(prompt_id), metadata["title"], metadata["description"], code, tools,
+            tool_mask, sys.intern(metadata.get("mode", "")))
+
+    def _append(self, record: PromptRecord) -> None:
+        self.positions[record.id] = len(self.ids)
+        self.ids.append(record.id)
+        self.records.append(record)
+
+    def _finish(self, category_docs: Dict[int, array], digests: bytearray, total: int) -> None:
+        self.version = _digest_version(total)
+        # Entry digests, ENTRY_DIGEST_BYTES per doc, and their sum
+        self._digests: Optional[bytes] = bytes(digests)
+        self._digest_total = total % _DIGEST_MODULUS
+        # Per-category doc lists, in registry order of first appearance
+        self.category_docs: Dict[str, array] = {
+            self.categories[code]: docs for code, docs in category_docs.items()
+        }
+        self._indexes: Dict[str, Any] = {}
+        # Serialized indexes from a compiled snapshot, decoded on first use
+        self._stored: Dict[str, Tuple[Dict[str, Any], Dict[str, memoryview]]] = {}
+        self._payloads: Dict[str, RenderedPayload] = {}
+        # Pre-rendered bodies and etags from a compiled snapshot, by payload key
+        self._stored_payloads: Dict[str, Tuple[memoryview, str]] = {}
+        self._lock = threading.RLock()
+
+    def patched(self, registry: Dict[str, Dict[str, Any]], changed: Iterable[str]) -> "RegistrySnapshot":
+        """Build the snapshot of `registry`, which differs from this one only in the `changed` prompts.
+
+        The records of the other prompts are shared with this snapshot, and
+        the indexes it has built are patched for the changed prompts instead
+        of being built again. Builds from scratch when this snapshot was
+        loaded from a compiled file, when more than SNAPSHOT_PATCH_MAX_RATIO
+        of the prompts changed, or when kept prompts or categories change
+        order.
+        """
+        changed = set(changed)
+        if self._digests is None or len(changed) > SNAPSHOT_PATCH_MAX_RATIO * len(registry):
+            return RegistrySnapshot(registry)
+
+        snapshot = RegistrySnapshot.__new__(RegistrySnapshot)
+        snapshot.categories = list(self.categories)
+        snapshot.category_codes = dict(self.category_codes)
+        snapshot.tools = list(self.tools)
+        snapshot.tool_codes = dict(self.tool_codes)
+        snapshot.ids, snapshot.records, snapshot.positions = [], [], {}
+        snapshot._tool_lists = dict(self._tool_lists)
+        category_docs: Dict[int, array] = {code: array("I") for code in range(len(self.categories))}
+        width = ENTRY_DIGEST_BYTES
+        digests = bytearray()
+        total = self._digest_total
+        remap = array("i", [-1]) * len(self)
+        origins = array("i")
+        added = []
+        last = -1
+        first_moved = len(self)
+
+        for doc, (prompt_id, metadata) in enumerate(registry.items()):
+            old = None if prompt_id in changed else self.positions.get(prompt_id)
+            if old is None:
+                record = snapshot._record(prompt_id, metadata)
+                digest = _entry_digest(prompt_id, metadata)
+                total += int.from_bytes(digest, "little")
+                origins.append(-1)
+                added.append(doc)
+            else:
+                if old < last:
+                    return RegistrySnapshot(registry)
+                if old != doc and first_moved == len(self):
+                    first_moved = old
+                last = old
+                record = self.records[old]
+                digest = self._digests[old * width:(old + 1) * width]
+                remap[old] = doc
+                origins.append(old)
+            category_docs.setdefault(record.category_code, array("I")).append(doc)
+            snapshot._append(record)
+            digests += digest
+
+        removed = [doc for doc, new in enumerate(remap) if new < 0]
+        for doc in removed:
+            total -= int.from_bytes(self._digests[doc * width:(doc + 1) * width], "little")
+        # Category codes follow the order categories first appear in
+        firsts = [docs[0] if docs else -1 for docs in category_docs.values()]
+        if -1 in firsts or firsts != sorted(firsts):
+            return RegistrySnapshot(registry)
+        snapshot._finish(category_docs, digests, total)
+
+        diff = SnapshotDiff(remap, origins, removed, added, first_moved)
+        for name, patch in _INDEX_PATCHERS.items():
+            index = self._indexes.get(name)
+            if index is not None:
+                index = patch(index, self, snapshot, diff)
+                if index is not None:
+                    snapshot._indexes[name] = index
+        return snapshot
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, prompt_id: str) -> bool:
+        return prompt_id in self.positions
+
+    def get(self, prompt_id: str) -> Optional[PromptRecord]:
+        """Return the record for `prompt_id`, or None if it is not registered."""
+        doc = self.positions.get(prompt_id)
+        return None if doc is None else self.records[doc]
+
+    def category(self, record: PromptRecord) -> str:
+        return self.categories[record.category_code]
+
+    def index(self, name: str) -> Any:
+        """Return the named derived index, loading or building it on first use."""
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(name)
+                if index is None:
+                    stored = self._stored.pop(name, None)
+                    if stored is not None:
+                        index = _INDEX_LOADERS[name](self, *stored)
+                    else:
+                        index = _INDEX_BUILDERS[name](self)
+                    self._indexes[name] = index
+        return index
+
+    def payload(self, key: str, render: Callable[[], Any]) -> RenderedPayload:
+        """Return the JSON payload cached under `key`, rendering it on first use.
+
+        Only cache payloads for keys that exist in this snapshot; anything
+        derived from arbitrary client input would grow the cache unbounded.
+        """
+        payload = self._payloads.get(key)
+        if payload is None:
+            stored = self._stored_payloads.get(key)
+            if stored is not None:
+                payload = RenderedPayload.stored(*stored)
+            else:
+                payload = RenderedPayload(json.dumps(render(), indent=2))
+            payload = self._payloads.setdefault(key, payload)
+        return payload
+
+_current_snapshot: Optional[RegistrySnapshot] = None
+# The snapshot a request was pinned to when it arrived; set per request task
+_request_snapshot: ContextVar[Optional[RegistrySnapshot]] = ContextVar("request_snapshot", default=None)
+
+def publish_registry(registry: Dict[str, Dict[str, Any]]) -> RegistrySnapshot:
+    """Make `registry` the current registry version and return its snapshot.
+
+    The snapshot keeps its own compact copy of the entries; `registry`
+    itself is not retained.
     """
-    Generate a comprehensive usage guide for prompts.
-    
-    Args:
-        category: Optional category to filter prompts
-    
-    Returns:
-        Markdown formatted usage guide
+    return publish_snapshot(RegistrySnapshot(registry))
+
+def publish_snapshot(snapshot: RegistrySnapshot) -> RegistrySnapshot:
+    """Make an already built snapshot the current registry version.
+
+    Publishing is a single reference swap: requests already running keep
+    the snapshot they started with, later ones see the new one.
     """
-    guide_lines = [
-        "# Awesome GitHub Copilot Prompts Usage Guide",
-        "",
-        "This guide provides information about available GitHub Copilot prompts from the awesome-copilot repository.",
-        ""
-    ]
-    
-    # Group prompts by category
-    categories = {}
-    for prompt_id, metadata in PROMPTS_REGISTRY.items():
-        if category and metadata["category"] != category:
+    global _current_snapshot
+    previous, _current_snapshot = _current_snapshot, snapshot
+    if previous is not None and previous.version != snapshot.version:
+        RESULT_CACHE.clear()
+        _notify_resource_list_changed()
+    return snapshot
+
+def get_snapshot() -> RegistrySnapshot:
+    """Return the snapshot of the current request, or else the current registry version."""
+    snapshot = _request_snapshot.get()
+    return _current_snapshot if snapshot is None else snapshot
+
+# MCP sessions that have made a request, with the event loop serving them
+_sessions: "weakref.WeakKeyDictionary[Any, asyncio.AbstractEventLoop]" = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+
+def _track_session(session: Any) -> None:
+    if session not in _sessions:
+        with _sessions_lock:
+            _sessions[session] = asyncio.get_running_loop()
+
+def _notify_resource_list_changed() -> None:
+    """Send resources/list_changed to every tracked session, from any thread."""
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    for session, loop in sessions:
+        if loop.is_closed():
             continue
-        
-        cat = metadata["category"]
-        if cat not in categories:
-            categories[cat] = []
-        categories[cat].append((prompt_id, metadata))
-    
-    # Generate guide content
-    for cat, prompts in sorted(categories.items()):
-        guide_lines.extend([
-            f"## {cat.title()} Prompts",
-            ""
-        ])
-        
-        for prompt_id, metadata in sorted(prompts, key=lambda x: x[1]["title"]):
-            guide_lines.extend([
-                f"### {metadata['title']}",
-                f"**ID:** `{prompt_id}`",
-                f"**Description:** {metadata['description']}",
-                ""
-            ])
-            
-            if metadata["tools"]:
-                guide_lines.extend([
-                    "**Required Tools:**",
-                    ", ".join(f"`{tool}`" for tool in metadata["tools"]),
-                    ""
-                ])
-            
-            guide_lines.extend([
-                "**Installation:**",
-                f"- [Install in VS Code](https://vscode.dev/redirect?url=vscode%3Achat-prompt%2Finstall%3Furl%3Dhttps%3A%2F%2Fraw.githubusercontent.com%2Fgithub%2Fawesome-copilot%2Fmain%2Fprompts%2F{prompt_id}.prompt.md)",
-                f"- [View Source](https://github.com/github/awesome-copilot/blob/main/prompts/{prompt_id}.prompt.md)",
-                "",
-                "**Usage:**",
-                f"Use `/{prompt_id}` in VS Code chat or run the `Chat: Run Prompt` command.",
-                "",
-                "---",
-                ""
-            ])
-    
-    guide_lines.extend([
-        "## General Usage Instructions",
-        "",
-        "1. **Install a prompt:** Click the installation link for any prompt above",
-        "2. **Use in VS Code:** Type `/prompt-name` in the chat interface",
-        "3. **Run command:** Use `Chat: Run Prompt` command from the command palette",
-        "4. **Direct execution:** Hit the run button while viewing a prompt file",
-        "",
-        "For more information, visit the [awesome-copilot repository](https://github.com/github/awesome-copilot)."
-    ])
-    
-    return "\n".join(guide_lines)
+        future = asyncio.run_coroutine_threadsafe(session.send_resource_list_changed(), loop)
 
-# Prompts for common workflows
-@mcp.prompt(title="Find Development Prompts")
-def find_development_prompts(language: str = "any", framework: str = "any") -> str:
-    """Find development-related prompts for specific languages or frameworks."""
-    return f"""Find GitHub Copilot prompts suitable for {language} development with {framework} framework.
+        def forget_closed(future, session=session):
+            if future.cancelled() or future.exception() is not None:
+                with _sessions_lock:
+                    _sessions.pop(session, None)
+        future.add_done_callback(forget_closed)
 
-Use the search_prompts tool to find relevant prompts in the "development", "best-practices", and "testing" categories.
+# Result cache
+#
+# Agent traffic repeats the same few hundred queries, so search_prompts,
+# get_prompts_by_tools and generate_prompt_usage_guide keep their results
+# in an LRU cache keyed on the tool, the registry version and the
+# normalised arguments. Entries expire after RESULT_CACHE_TTL_SECONDS, and
+# the least recently used are evicted once the cached results, sized as
+# their JSON encoding, exceed RESULT_CACHE_MAX_BYTES (0 disables the
+# cache). Publishing a new registry version clears it. Cached results are
+# shared between callers and must not be modified.
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("AWESOME_COPILOT_RESULT_CACHE_BYTES", str(32 << 20)))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("AWESOME_COPILOT_RESULT_CACHE_TTL", "300"))
 
-Consider prompts that might help with:
-- Project scaffolding and setup
-- Best practices and code quality
-- Testing frameworks and patterns
-- Documentation generation
-- Code review and refactoring
+def _result_size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, separators=(",", ":"), default=str))
 
-Provide installation instructions and usage examples for the most relevant prompts."""
+class ResultCache:
+    """Thread-safe LRU cache with a byte budget, a TTL and hit/miss counters."""
 
-@mcp.prompt(title="Setup GitHub Workflow Prompts")
-def setup_github_workflow_prompts() -> str:
-    """Find prompts for GitHub workflow automation and project management."""
-    return """Find GitHub Copilot prompts that help with GitHub workflows and project management.
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # key -> (value, size, expiry), least recently used first
+        self._entries: "OrderedDict[Any, Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
 
-Search for prompts in the "github" and "project-management" categories that can help with:
-- Creating and managing GitHub issues
-- Pull request workflows
-- Implementation planning
-- Specification documentation
-- Project organization
+    def get_or_compute(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, computing and caching it on a miss."""
+        if self.max_bytes <= 0:
+            return compute()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.bytes -= entry[1]
+                self.expirations += 1
+            self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
 
-Provide a curated list with installation instructions and explain how these prompts can streamline GitHub workflows."""
+    def put(self, key: Any, value: Any) -> None:
+        size = _result_size(value)
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (value, size, now + self.ttl)
+            self.bytes += size
+            # Expired entries collect at the least recently used end
+            while self._entries:
+                _, (_, oldest_size, expiry) = next(iter(self._entries.items()))
+                if expiry > now and self.bytes <= self.max_bytes:
+                    break
+                self._entries.popitem(last=False)
+                self.bytes -= oldest_size
+                if expiry > now:
+                    self.evictions += 1
+                else:
+                    self.expirations += 1
 
-@mcp.prompt(title="Documentation Prompts Setup")
-def documentation_prompts_setup() -> str:
-    """Find and recommend documentation-related prompts."""
-    return """Find GitHub Copilot prompts that help with documentation tasks.
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
 
-Search for prompts in the "documentation" category and recommend the best ones for:
-- API documentation
-- Code documentation
-- Project specifications
-- Architectural decisions
-- Component documentation
-- README and guide generation
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
 
-Provide installation instructions and examples of when to use each prompt type."""
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS)
 
-if __name__ == "__main__":
-    mcp.run()
+def cached_result(name: str, snapshot: RegistrySnapshot, arguments: Tuple[Any, ...],
+                  compute: Callable[[], Any]) -> Any:
+    """Look up the result of tool `name` for normalised `arguments` in RESULT_CACHE."""
+    return RESULT_CACHE.get_or_compute((name, snapshot.version, arguments), compute)
+
+# Search index: BM25F scoring over tokenized id/title/description/category
+SEARCH_FIELD_WEIGHTS = {
+    "title": 3.0,
+    "id": 2.0,
+    "category": 1.5,
+    "description": 1.0,
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Query terms at least this long also match longer terms they prefix
+# ("test" finds "testing"), at a reduced score and with a bounded fan-out
+SEARCH_PREFIX_MIN_LENGTH = 3
+SEARCH_PREFIX_PENALTY = 0.5
+SEARCH_PREFIX_MAX_EXPANSIONS = 64
+# With a filter applied first, postings this many times longer than the
+# filtered set are binary-searched for its docs rather than scanned
+SEARCH_PROBE_RATIO = 8
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+# Fields in the order their frequencies are stored in BM25Postings
+SEARCH_FIELDS = ("id", "title", "description", "category")
+
+def _term_frequencies(record: PromptRecord, category: str) -> Tuple[Dict[str, List[int]], List[int]]:
+    """Frequency of each term of a prompt per search field, and the field lengths."""
+    frequencies: Dict[str, List[int]] = {}
+    lengths = []
+    for field, text in enumerate((record.id, record.title, record.description, category)):
+        tokens = _tokenize(text)
+        lengths.append(len(tokens))
+        for token in tokens:
+            counts = frequencies.get(token)
+            if counts is None:
+                counts = frequencies[token] = [0] * len(SEARCH_FIELDS)
+            counts[field] += 1
+    return frequencies, lengths
+
+class BM25Postings(Mapping):
+    """Search postings kept as term frequencies and scored per term on first use.
+
+    `frequencies[term]` holds the docs containing the term and, for each of
+    them, its frequency in every search field. Scores depend on the number
+    of prompts and the average field lengths, which any change moves, so
+    keeping frequencies lets a patched snapshot share the postings of every
+    term its changes leave alone and only score them when queried.
+    """
+
+    def __init__(self, frequencies: Dict[str, Tuple[array, array]], field_lengths: List[array]):
+        self.frequencies = frequencies
+        self.field_lengths = field_lengths
+        self.doc_count = len(field_lengths[0])
+        self._fields = [
+            (field, SEARCH_FIELD_WEIGHTS[name], lengths,
+             (sum(lengths) / len(lengths) if lengths else 0.0) or 1.0)
+            for field, (name, lengths) in enumerate(zip(SEARCH_FIELDS, field_lengths))
+        ]
+        self._scored: Dict[str, Tuple[array, array]] = {}
+
+    def __getitem__(self, term: str) -> Tuple[array, array]:
+        scored = self._scored.get(term)
+        if scored is None:
+            doc_ids, counts = self.frequencies[term]
+            idf = math.log(1 + (self.doc_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            width = len(self._fields)
+            scores = array("f")
+            for position, doc in enumerate(doc_ids):
+                weighted_tf = 0.0
+                for field, weight, lengths, average in self._fields:
+                    tf = counts[position * width + field]
+                    if tf:
+                        norm = 1 - BM25_B + BM25_B * lengths[doc] / average
+                        weighted_tf += weight * tf / norm
+                scores.append(idf * weighted_tf * (BM25_K1 + 1) / (BM25_K1 + weighted_tf))
+            scored = self._scored.setdefault(term, (doc_ids, scores))
+        return scored
+
+    def __contains__(self, term: object) -> bool:
+        return term in self.frequencies
+
+    def __iter__(self):
+        return iter(self.frequencies)
+
+    def __len__(self) -> int:
+        return len(self.frequencies)
+
+class SearchIndex:
+    """Inverted index mapping terms to postings of (doc, BM25F score).
+
+    Doc numbers are positions in the snapshot's id list. The score stored in a
+    posting already includes the term's IDF, so a query only has to combine
+    the postings of its own terms.
+    """
+
+    def __init__(self, postings: Mapping, category_docs: Dict[str, array], size: int,
+                 vocabulary: Optional[Sequence] = None):
+        self.postings = postings
+        self.category_docs = category_docs
+        self.vocabulary = vocabulary if vocabulary is not None else sorted(postings)
+        self.size = size
+
+    @classmethod
+    def build(cls, snapshot: RegistrySnapshot) -> "SearchIndex":
+        frequencies: Dict[str, Tuple[array, array]] = {}
+        field_lengths = [array("I") for _ in SEARCH_FIELDS]
+        for doc, record in enumerate(snapshot.records):
+            counts, lengths = _term_frequencies(record, snapshot.category(record))
+            for column, length in zip(field_lengths, lengths):
+                column.append(length)
+            for term, term_counts in counts.items():
+                postings = frequencies.get(term)
+                if postings is None:
+                    postings = frequencies[term] = (array("I"), array("I"))
+                postings[0].append(doc)
+                postings[1].extend(term_counts)
+        return cls(BM25Postings(frequencies, field_lengths), snapshot.category_docs, len(snapshot))
+
+    def patch(self, previous: RegistrySnapshot, snapshot: RegistrySnapshot,
+              diff: "SnapshotDiff") -> Optional["SearchIndex"]:
+        """This index for `snapshot`, re-tokenizing only the changed prompts."""
+        if not isinstance(self.postings, BM25Postings):
+            return None
+        width = len(SEARCH_FIELDS)
+        removals: Dict[str, List[int]] = defaultdict(list)
+        for doc in diff.removed:
+            record = previous.records[doc]
+            for term in _term_frequencies(record, previous.category(record))[0]:
+                removals[term].append(doc)
+        field_lengths = [
+            array("I", [column[old] if old >= 0 else 0 for old in diff.origins])
+            for column in self.postings.field_lengths
+        ]
+        additions: Dict[str, List[Tuple[int, List[int]]]] = defaultdict(list)
+        for doc in diff.added:
+            record = snapshot.records[doc]
+            counts, lengths = _term_frequencies(record, snapshot.category(record))
+            for column, length in zip(field_lengths, lengths):
+                column[doc] = length
+            for term, term_counts in counts.items():
+                additions[term].append((doc, term_counts))
+
+        previous_frequencies = self.postings.frequencies
+        if diff.moved:
+            frequencies = {
+                term: (diff.docs(doc_ids), counts)
+                for term, (doc_ids, counts) in previous_frequencies.items() if term not in removals
+            }
+        else:
+            frequencies = dict(previous_frequencies)
+        for term in removals.keys() | additions.keys():
+            doc_ids, counts = previous_frequencies.get(term, ((), ()))
+            doc_ids, counts = array("I", doc_ids), array("I", counts)
+            for doc in reversed(removals.get(term, ())):
+                position = bisect_left(doc_ids, doc)
+                del doc_ids[position]
+                del counts[position * width:(position + 1) * width]
+            doc_ids = diff.docs(doc_ids)
+            for doc, term_counts in additions.get(term, ()):
+                position = bisect_left(doc_ids, doc)
+                doc_ids.insert(position, doc)
+                counts[position * width:position * width] = array("I", term_counts)
+            if doc_ids:
+                frequencies[term] = (doc_ids, counts)
+            else:
+                frequencies.pop(term, None)
+
+        vocabulary = self.vocabulary
+        new_terms = [term for term in additions if term not in previous_frequencies]
+        gone = [term for term in removals if term not in frequencies]
+        if new_terms or gone:
+            vocabulary = list(vocabulary)
+            for term in gone:
+                del vocabulary[bisect_left(vocabulary, term)]
+            for term in new_terms:
+                insort(vocabulary, term)
+        return SearchIndex(BM25Postings(frequencies, field_lengths), snapshot.category_docs,
+                           len(snapshot), vocabulary)
+
+    def dump(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        offsets = array("Q", [0])
+        docs = array("I")
+        scores = array("f")
+        for term in self.vocabulary:
+            doc_ids, term_scores = self.postings[term]
+            docs.extend(doc_ids)
+            scores.extend(term_scores)
+            offsets.append(len(docs))
+        terms, term_offsets = _string_table(self.vocabulary)
+        return {}, {"terms": terms, "term_offsets": term_offsets, "offsets": offsets,
+                    "docs": docs, "scores": scores}
+
+    @classmethod
+    def load(cls, snapshot: RegistrySnapshot, meta: Dict[str, Any],
+             blobs: Dict[str, memoryview]) -> "SearchIndex":
+        postings = PackedPostings(
+            StringTable(blobs["terms"], blobs["term_offsets"]), blobs["offsets"].cast("Q"),
+            blobs["docs"].cast("I"), blobs["scores"].cast("f"))
+        return cls(postings, snapshot.category_docs, len(snapshot), postings.keys)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Index terms matched by a query term, with their score multipliers."""
+        expansions = []
+        if term in self.postings:
+            expansions.append((term, 1.0))
+        if len(term) >= SEARCH_PREFIX_MIN_LENGTH:
+            start = bisect_left(self.vocabulary, term)
+            for candidate in self.vocabulary[start:start + SEARCH_PREFIX_MAX_EXPANSIONS + 1]:
+                if not candidate.startswith(term):
+                    break
+                if candidate != term:
+                    expansions.append((candidate, SEARCH_PREFIX_PENALTY))
+        return expansions
+
+    def scores(self, query: str, allowed: Optional[set] = None) -> Optional[Dict[int, float]]:
+        """Map every document matching all query terms (and in `allowed`) to its score.
+
+        Every query term has to match a document (exactly or as a prefix).
+        Returns None for a query without any terms.
+        """
+        terms = list(dict.fromkeys(_tokenize(query)))
+        if not terms:
+            return None
+
+        # Best score per document for each query term. Postings much longer
+        # than `allowed` are probed for the allowed docs instead of scanned.
+        term_scores = []
+        for term in terms:
+            best: Dict[int, float] = {}
+            for candidate, multiplier in self._expand(term):
+                doc_ids, scores = self.postings[candidate]
+                if allowed is not None and len(allowed) * SEARCH_PROBE_RATIO < len(doc_ids):
+                    pairs = []
+                    for doc in allowed:
+                        position = bisect_left(doc_ids, doc)
+                        if position < len(doc_ids) and doc_ids[position] == doc:
+                            pairs.append((doc, scores[position]))
+                else:
+                    pairs = zip(doc_ids, scores)
+                for doc, score in pairs:
+                    score *= multiplier
+                    if score > best.get(doc, 0.0):
+                        best[doc] = score
+            if not best:
+                return {}
+            term_scores.append(best)
+
+        # Intersect starting from the most selective term, then add up the
+        # scores in query order so they do not depend on the intersection
+        docs = min(term_scores, key=len).keys()
+        if allowed is not None:
+            docs = [doc for doc in docs if doc in allowed]
+        for best in sorted(term_scores, key=len)[1:]:
+            docs = [doc for doc in docs if doc in best]
+        return {doc: sum(best[doc] for best in term_scores) for doc in docs}
+
+    def estimate(self, query: str) -> Optional[int]:
+        """Upper bound on the number of matches of `query`, from posting lengths.
+
+        Returns None for a query without any terms.
+        """
+        terms = list(dict.fromkeys(_tokenize(query)))
+        if not terms:
+            return None
+        return min(
+            sum(len(self.postings[candidate][0]) for candidate, _ in self._expand(term))
+            for term in terms
+        )
+
+    def search(self, query: str, category: Optional[str] = None,
+               limit: int = 20) -> List[Tuple[int, float]]:
+        """Return up to `limit` (doc, score) pairs, best first.
+
+        A query without any terms matches every document, in registry order.
+        """
+        limit = max(limit, 0)
+        allowed = None
+        if category:
+            allowed = set(self.category_docs.get(category, ()))
+
+        totals = self.scores(query, allowed)
+        if totals is None:
+            docs = self.category_docs.get(category, []) if category else range(self.size)
+            return [(doc, 0.0) for doc in docs[:limit]]
+        return _top_scores(totals, limit)
+
+def _top_scores(scores: Dict[int, float], limit: int) -> List[Tuple[int, float]]:
+    """The `limit` best (doc, score) pairs, ties broken by registry order."""
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+_INDEX_BUILDERS["search"] = SearchIndex.build
+_INDEX_LOADERS["search"] = SearchIndex.load
+_INDEX_PATCHERS["search"] = SearchIndex.patch
+
+# Fuzzy search: character trigrams for candidates, edit distance to rank them
+FUZZY_CANDIDATES = 200
+# Trigrams found in more than this fraction of prompts carry little signal
+# and would make candidate generation linear in the registry size
+FUZZY_MAX_TRIGRAM_DF = 0.2
+# A query word counts as matched when its best similarity to a word of the
+# prompt (1 - edit distance / length) reaches this value
+FUZZY_MIN_SIMILARITY = 0.6
+
+def _trigrams(token: str) -> set:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _fuzzy_tokens(record: PromptRecord) -> Tuple[str, ...]:
+    """Words of a prompt's id, title and description, plus each pair of adjacent words joined."""
+    words = []
+    for text in (record.id, record.title, record.description):
+        tokens = _tokenize(text)
+        words.extend(tokens)
+        words.extend(a + b for a, b in zip(tokens, tokens[1:]))
+    return tuple(sorted(set(words)))
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between `a` and `b`, or `limit + 1` if it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class TrigramIndex:
+    """Character-trigram index over the words of prompt ids, titles and descriptions.
+
+    Each prompt's words also include every pair of adjacent words joined
+    together, so "multistage" matches "multi-stage".
+    """
+
+    def __init__(self, postings: Dict[str, array], doc_tokens: List[Tuple[str, ...]]):
+        self.postings = postings
+        self.doc_tokens = doc_tokens
+
+    @classmethod
+    def build(cls, snapshot: RegistrySnapshot) -> "TrigramIndex":
+        postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        token_sets: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        token_trigrams: Dict[str, set] = {}
+        doc_tokens = []
+        for doc, record in enumerate(snapshot.records):
+            tokens = _fuzzy_tokens(record)
+            doc_tokens.append(token_sets.setdefault(tokens, tokens))
+            trigrams = set()
+            for token in tokens:
+                cached = token_trigrams.get(token)
+                if cached is None:
+                    cached = token_trigrams[token] = _trigrams(token)
+                trigrams |= cached
+            for trigram in trigrams:
+                postings[trigram].append(doc)
+        return cls(dict(postings), doc_tokens)
+
+    def patch(self, previous: RegistrySnapshot, snapshot: RegistrySnapshot,
+              diff: "SnapshotDiff") -> Optional["TrigramIndex"]:
+        """This index for `snapshot`, updating only the trigrams of the changed prompts."""
+        if not isinstance(self.postings, dict):
+            return None
+        removals: Dict[str, List[int]] = defaultdict(list)
+        for doc in diff.removed:
+            for trigram in set().union(*map(_trigrams, self.doc_tokens[doc])):
+                removals[trigram].append(doc)
+        doc_tokens = [self.doc_tokens[old] if old >= 0 else () for old in diff.origins]
+        additions: Dict[str, List[int]] = defaultdict(list)
+        for doc in diff.added:
+            doc_tokens[doc] = _fuzzy_tokens(snapshot.records[doc])
+            for trigram in set().union(*map(_trigrams, doc_tokens[doc])):
+                additions[trigram].append(doc)
+
+        if diff.moved:
+            postings = {
+                trigram: diff.docs(docs) for trigram, docs in self.postings.items() if trigram not in removals
+            }
+        else:
+            postings = dict(self.postings)
+        for trigram in removals.keys() | additions.keys():
+            docs = array("I", self.postings.get(trigram, ()))
+            for doc in reversed(removals.get(trigram, ())):
+                del docs[bisect_left(docs, doc)]
+            docs = diff.docs(docs)
+            for doc in additions.get(trigram, ()):
+                docs.insert(bisect_left(docs, doc), doc)
+            if docs:
+                postings[trigram] = docs
+            else:
+                postings.pop(trigram, None)
+        return TrigramIndex(postings, doc_tokens)
+
+    def dump(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        trigrams = sorted(self.postings)
+        offsets = array("Q", [0])
+        docs = array("I")
+        for trigram in trigrams:
+            docs.extend(self.postings[trigram])
+            offsets.append(len(docs))
+        # Token tuples are shared between prompts, so store each one once
+        tokens = sorted(set().union(*self.doc_tokens))
+        token_codes = {token: code for code, token in enumerate(tokens)}
+        token_sets: Dict[Tuple[str, ...], int] = {}
+        set_offsets = array("Q", [0])
+        set_tokens = array("I")
+        doc_sets = array("I")
+        for doc_tokens in self.doc_tokens:
+            code = token_sets.get(doc_tokens)
+            if code is None:
+                code = token_sets[doc_tokens] = len(token_sets)
+                set_tokens.extend(token_codes[token] for token in doc_tokens)
+                set_offsets.append(len(set_tokens))
+            doc_sets.append(code)
+        blobs = {"offsets": offsets, "docs": docs, "set_offsets": set_offsets,
+                 "set_tokens": set_tokens, "doc_sets": doc_sets}
+        blobs["trigrams"], blobs["trigram_offsets"] = _string_table(trigrams)
+        blobs["tokens"], blobs["token_offsets"] = _string_table(tokens)
+        return {}, blobs
+
+    @classmethod
+    def load(cls, snapshot: RegistrySnapshot, meta: Dict[str, Any],
+             blobs: Dict[str, memoryview]) -> "TrigramIndex":
+        postings = PackedPostings(
+            StringTable(blobs["trigrams"], blobs["trigram_offsets"]), blobs["offsets"].cast("Q"),
+            blobs["docs"].cast("I"))
+        doc_tokens = PackedTokenSets(
+            StringTable(blobs["tokens"], blobs["token_offsets"]), blobs["set_offsets"].cast("Q"),
+            blobs["set_tokens"].cast("I"), blobs["doc_sets"].cast("I"))
+        return cls(postings, doc_tokens)
+
+    def search(self, query: str, allowed: Optional[set] = None,
+               limit: int = 20) -> List[Tuple[int, float]]:
+        """Return up to `limit` (doc, score) pairs for a possibly misspelled query.
+
+        The score is the sum over query words of their best similarity to a
+        word of the prompt, so it ranges up to the number of query words.
+        """
+        terms = list(dict.fromkeys(_tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+
+        # Candidates: prompts sharing the most trigrams with the query
+        query_trigrams = set().union(*map(_trigrams, terms))
+        doc_count = len(self.doc_tokens)
+        postings = sorted(
+            (self.postings[trigram] for trigram in query_trigrams if trigram in self.postings),
+            key=len)
+        selective = [docs for docs in postings if len(docs) <= FUZZY_MAX_TRIGRAM_DF * doc_count]
+        overlap: Dict[int, int] = defaultdict(int)
+        for docs in selective or postings[:1]:
+            for doc in docs:
+                overlap[doc] += 1
+        if allowed is not None:
+            overlap = {doc: count for doc, count in overlap.items() if doc in allowed}
+        candidates = heapq.nlargest(FUZZY_CANDIDATES, overlap.items(), key=lambda item: (item[1], -item[0]))
+
+        # Re-rank by edit distance, comparing each distinct word only once
+        similarity: Dict[Tuple[str, str], float] = {}
+        def best(term: str, tokens: Tuple[str, ...]) -> float:
+            limit_distance = max(1, len(term) * 2 // 5)
+            top = 0.0
+            for token in tokens:
+                key = (term, token)
+                value = similarity.get(key)
+                if value is None:
+                    distance = _edit_distance(term, token, limit_distance)
+                    value = 0.0 if distance > limit_distance else 1 - distance / max(len(term), len(token))
+                    similarity[key] = value
+                if value > top:
+                    top = value
+                    if top == 1.0:
+                        break
+            return top
+
+        scored = []
+        for doc, _ in candidates:
+            tokens = self.doc_tokens[doc]
+            sims = [best(term, tokens) for term in terms]
+            if all(sim >= FUZZY_MIN_SIMILARITY for sim in sims):
+                scored.append((doc, sum(sims)))
+        return heapq.nlargest(limit, scored, key=lambda item: (item[1], -item[0]))
+
+_INDEX_BUILDERS["trigrams"] = TrigramIndex.build
+_INDEX_LOADERS["trigrams"] = TrigramIndex.load
+_INDEX_PATCHERS["trigrams"] = TrigramIndex.patch
+
+# Set bit positions for every byte value, used to walk large bitsets
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+def _iter_bits(mask: int):
+    """Yield the positions of the set bits in `mask`, lowest first."""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index << 3
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+class ToolIndex:
+    """Tool postings stored as integer bitsets.
+
+    `postings[tool]` has bit `doc` set for every prompt that uses the tool, and
+    `doc_masks[doc]` has bit `codes[tool]` set for every tool the prompt uses,
+    so filters become a handful of big-integer ANDs/ORs and overlap counts a
+    popcount.
+    """
+
+    MATCH_MODES = ("all", "any")
+
+    def __init__(self, codes: Dict[str, int], postings: Dict[str, int],
+                 doc_masks: List[int]):
+        self.codes = codes
+        self.postings = postings
+        self.doc_masks = doc_masks
+        self.all_docs = (1 << len(doc_masks)) - 1
+
+    @classmethod
+    def build(cls, snapshot: RegistrySnapshot) -> "ToolIndex":
+        # Set bits in byte buffers first; OR-ing into Python ints one doc at a
+        # time would copy the growing integer on every update
+        size = (len(snapshot) + 7) // 8
+        bitsets = [bytearray(size) for _ in snapshot.tools]
+        doc_masks = []
+        for doc, record in enumerate(snapshot.records):
+            for tool in record.tools:
+                bitsets[snapshot.tool_codes[tool]][doc >> 3] |= 1 << (doc & 7)
+            doc_masks.append(record.tool_mask)
+        postings = {
+            tool: int.from_bytes(bitsets[code], "little")
+            for tool, code in snapshot.tool_codes.items()
+        }
+        return cls(snapshot.tool_codes, postings, doc_masks)
+
+    def patch(self, previous: RegistrySnapshot, snapshot: RegistrySnapshot,
+              diff: "SnapshotDiff") -> "ToolIndex":
+        """This index for `snapshot`, shifting the bitsets past the changed prompts."""
+        additions: Dict[str, int] = defaultdict(int)
+        for doc in diff.added:
+            for tool in snapshot.records[doc].tools:
+                additions[tool] |= 1 << doc
+        postings = {
+            tool: diff.bits(self.postings.get(tool, 0)) | additions.get(tool, 0)
+            for tool in snapshot.tool_codes
+        }
+        return ToolIndex(snapshot.tool_codes, postings, [record.tool_mask for record in snapshot.records])
+
+    def dump(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        size = (len(self.doc_masks) + 7) // 8
+        bitsets = b"".join(
+            self.postings[tool].to_bytes(size, "little")
+            for tool, _ in sorted(self.codes.items(), key=lambda item: item[1]))
+        return {"bytes": size}, {"bitsets": bitsets}
+
+    @classmethod
+    def load(cls, snapshot: RegistrySnapshot, meta: Dict[str, Any],
+             blobs: Dict[str, memoryview]) -> "ToolIndex":
+        size = meta["bytes"]
+        bitsets = blobs["bitsets"]
+        postings = {
+            tool: int.from_bytes(bitsets[code * size:(code + 1) * size], "little")
+            for tool, code in snapshot.tool_codes.items()
+        }
+        # Loaded snapshots keep tool masks as a coded column of the mapped file
+        return cls(snapshot.tool_codes, postings, snapshot.records.tool_masks)
+
+    def match(self, tools: List[str], match: str = "all",
+              min_overlap: int = 1) -> List[Tuple[int, int]]:
+        """Return (doc, overlap) pairs for prompts matching `tools`.
+
+        "all" keeps prompts that use every tool, in registry order. "any"
+        keeps prompts that use at least `min_overlap` of the tools, ranked by
+        how many they use.
+        """
+        if match not in self.MATCH_MODES:
+            raise ValueError(f"Unknown match mode '{match}', expected one of {self.MATCH_MODES}")
+        tools = list(dict.fromkeys(tools))
+
+        if match == "all":
+            docs = self.all_docs
+            for tool in tools:
+                docs &= self.postings.get(tool, 0)
+                if not docs:
+                    return []
+            return [(doc, len(tools)) for doc in _iter_bits(docs)]
+
+        docs = 0
+        query_mask = 0
+        for tool in tools:
+            if tool in self.codes:
+                docs |= self.postings[tool]
+                query_mask |= 1 << self.codes[tool]
+        min_overlap = max(min_overlap, 1)
+        ranked = []
+        for doc in _iter_bits(docs):
+            overlap = (self.doc_masks[doc] & query_mask).bit_count()
+            if overlap >= min_overlap:
+                ranked.append((doc, overlap))
+        ranked.sort(key=lambda item: -item[1])
+        return ranked
+
+_INDEX_BUILDERS["tools"] = ToolIndex.build
+_INDEX_LOADERS["tools"] = ToolIndex.load
+_INDEX_PATCHERS["tools"] = ToolIndex.patch
+
+def _bitset(docs: Iterable[int], size: int) -> int:
+    """Integer with bit `doc` set for every doc in `docs`."""
+    data = bytearray((size + 7) // 8)
+    for doc in docs:
+        data[doc >> 3] |= 1 << (doc & 7)
+    return int.from_bytes(data, "little")
+
+def _facet_counts(bitsets: Mapping, docs: int) -> Dict[str, int]:
+    """Non-zero counts of `docs` within each bitset, largest first."""
+    counts = [(name, (docs & bits).bit_count()) for name, bits in bitsets.items()]
+    return {name: count for name, count in sorted(counts, key=lambda item: (-item[1], item[0])) if count}
+
+class FacetIndex:
+    """Category and tool bitsets for counting how a set of prompts is spread.
+
+    Counting a result set is one pass over its docs to build a bitset, then
+    an AND and a popcount per category and per tool. The counts for the
+    whole registry are computed once per snapshot.
+    """
+
+    def __init__(self, category_bits: Dict[str, int], tool_bits: Mapping, size: int):
+        self.category_bits = category_bits
+        self.tool_bits = tool_bits
+        self.size = size
+        self.all_docs = (1 << size) - 1
+        self.category_counts = _facet_counts(category_bits, self.all_docs)
+        self.tool_counts = _facet_counts(tool_bits, self.all_docs)
+
+    @classmethod
+    def build(cls, snapshot: RegistrySnapshot) -> "FacetIndex":
+        category_bits = {
+            category: _bitset(docs, len(snapshot)) for category, docs in snapshot.category_docs.items()
+        }
+        return cls(category_bits, snapshot.index("tools").postings, len(snapshot))
+
+    def patch(self, previous: RegistrySnapshot, snapshot: RegistrySnapshot,
+              diff: "SnapshotDiff") -> "FacetIndex":
+        """This index for `snapshot`, shifting the category bitsets past the changed prompts."""
+        additions: Dict[str, int] = defaultdict(int)
+        for doc in diff.added:
+            additions[snapshot.category(snapshot.records[doc])] |= 1 << doc
+        category_bits = {
+            category: diff.bits(self.category_bits.get(category, 0)) | additions.get(category, 0)
+            for category in snapshot.category_docs
+        }
+        return FacetIndex(category_bits, snapshot.index("tools").postings, len(snapshot))
+
+    def bits(self, docs: Iterable[int]) -> int:
+        return _bitset(docs, self.size)
+
+    def categories(self, docs: int) -> Dict[str, int]:
+        """Per-category counts for the docs set in `docs`."""
+        return self.category_counts if docs == self.all_docs else _facet_counts(self.category_bits, docs)
+
+    def tools(self, docs: int) -> Dict[str, int]:
+        """Per-tool counts for the docs set in `docs`."""
+        return self.tool_counts if docs == self.all_docs else _facet_counts(self.tool_bits, docs)
+
+_INDEX_BUILDERS["facets"] = FacetIndex.build
+_INDEX_PATCHERS["facets"] = FacetIndex.patch
+
+# Similar prompts: TF-IDF vectors over title, description, category and tools
+#
+# Set AWESOME_COPILOT_SIMILAR_TOP_K to precompute that many neighbours per
+# prompt when the index is built, so unfiltered lookups become a table read.
+# Precomputing costs one similarity pass over the whole catalog. NumPy is
+# only imported once the index is needed, keeping it off the startup path.
+SIMILAR_TOP_K = int(os.environ.get("AWESOME_COPILOT_SIMILAR_TOP_K", "0"))
+# Terms used by more than this fraction of prompts are dropped from the
+# vectors: they say little about similarity and their long postings would
+# dominate the cost of every lookup
+SIMILAR_MAX_DF = 0.5
+# Seeds scored together are capped so the dense score block
+# (seeds x prompts) stays around this many float64 cells
+SIMILAR_BLOCK_CELLS = 1 << 22
+
+class SimilarityIndex:
+    """L2-normalised TF-IDF vectors for every prompt, stored both ways round.
+
+    The rows (CSR: `indptr`, `indices`, `data`) give each seed's terms; the
+    columns (CSC: `col_ptr`, `col_docs`, `col_data`) give each term's
+    prompts. Scoring a batch of seeds gathers the columns of all their terms
+    in one go and sums them into a seeds x prompts block with `np.bincount`,
+    a sparse-times-sparse matrix product that only touches prompts sharing
+    a term with some seed.
+    """
+
+    ARRAYS = ("indptr", "indices", "data", "col_ptr", "col_docs", "col_data")
+
+    def __init__(self, indptr: "np.ndarray", indices: "np.ndarray", data: "np.ndarray",
+                 col_ptr: "np.ndarray", col_docs: "np.ndarray", col_data: "np.ndarray",
+                 top_docs: Optional["np.ndarray"] = None, top_scores: Optional["np.ndarray"] = None):
+        self.size = len(indptr) - 1
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.col_ptr = col_ptr
+        self.col_docs = col_docs
+        self.col_data = col_data
+        self.top_docs = top_docs
+        self.top_scores = top_scores
+        # Term codes and the raw term counts per prompt (CSR, before frequent
+        # terms are dropped), kept by built indexes so they can be patched
+        self.vocabulary: Optional[Dict[str, int]] = None
+        self.counts: Optional[Tuple["np.ndarray", "np.ndarray", "np.ndarray"]] = None
+
+    @staticmethod
+    def _features(snapshot: RegistrySnapshot, record: PromptRecord) -> List[str]:
+        terms = _tokenize(record.title) + _tokenize(record.description)
+        terms.append("category:" + snapshot.category(record))
+        terms.extend("tool:" + tool for tool in record.tools)
+        return terms
+
+    @classmethod
+    def _term_counts(cls, snapshot: RegistrySnapshot, record: PromptRecord,
+                     vocabulary: Dict[str, int]) -> Dict[int, int]:
+        tf: Dict[int, int] = defaultdict(int)
+        for term in cls._features(snapshot, record):
+            tf[vocabulary.setdefault(term, len(vocabulary))] += 1
+        return tf
+
+    @classmethod
+    def build(cls, snapshot: RegistrySnapshot, top_k: Optional[int] = None) -> "SimilarityIndex":
+        import numpy as np
+
+        vocabulary: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+        for record in snapshot.records:
+            tf = cls._term_counts(snapshot, record, vocabulary)
+            indices.extend(tf)
+            counts.extend(tf.values())
+            indptr.append(len(indices))
+        return cls._weighted(vocabulary, np.array(indptr, dtype=np.int64),
+                             np.array(indices, dtype=np.int32), np.array(counts, dtype=np.int32), top_k)
+
+    @classmethod
+    def _weighted(cls, vocabulary: Dict[str, int], indptr: "np.ndarray", indices: "np.ndarray",
+                  counts: "np.ndarray", top_k: Optional[int] = None) -> "SimilarityIndex":
+        import numpy as np
+
+        size = len(indptr) - 1
+        raw = (indptr, indices, counts)
+        counts = counts.astype(np.float64)
+        df = np.bincount(indices, minlength=len(vocabulary))
+        keep = df[indices] <= SIMILAR_MAX_DF * size
+        if not keep.all():
+            kept = np.concatenate(([0], np.cumsum(keep)))
+            indptr = kept[indptr]
+            indices = indices[keep]
+            counts = counts[keep]
+        # Sublinear term frequency times smoothed idf, then unit-length rows.
+        # Prompts left with no terms keep an empty row, so they have no
+        # neighbours and are nobody's neighbour.
+        idf = np.log((1 + size) / (1 + df)) + 1
+        data = (1 + np.log(counts)) * idf[indices]
+        rows = np.repeat(np.arange(size, dtype=np.int32), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=size))
+        data /= np.where(norms > 0, norms, 1)[rows]
+        data = data.astype(np.float32)
+
+        # Transpose into columns
+        order = np.argsort(indices, kind="stable")
+        col_ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=len(vocabulary)), out=col_ptr[1:])
+        col_docs = rows[order]
+
+        index = cls(indptr, indices, data, col_ptr, col_docs, data[order])
+        index.vocabulary, index.counts = vocabulary, raw
+        top_k = SIMILAR_TOP_K if top_k is None else top_k
+        if top_k > 0:
+            index.top_docs, index.top_scores = index._precompute(top_k)
+        return index
+
+    def patch(self, previous: RegistrySnapshot, snapshot: RegistrySnapshot,
+              diff: "SnapshotDiff") -> Optional["SimilarityIndex"]:
+        """This index for `snapshot`, counting terms again only for the changed prompts.
+
+        The weights depend on every prompt's document frequencies, so they
+        are recomputed, but that part is vectorised. Terms first seen in the
+        changed prompts get new codes at the end of the vocabulary.
+        """
+        if self.counts is None:
+            return None
+        import numpy as np
+
+        vocabulary = dict(self.vocabulary)
+        indptr, indices, counts = self.counts
+        origins = np.frombuffer(diff.origins, dtype=np.int32).astype(np.int64)
+        kept = np.nonzero(origins >= 0)[0]
+        lengths = np.zeros(len(origins), dtype=np.int64)
+        lengths[kept] = np.diff(indptr)[origins[kept]]
+        added = {}
+        for doc in diff.added:
+            added[doc] = self._term_counts(snapshot, snapshot.records[doc], vocabulary)
+            lengths[doc] = len(added[doc])
+
+        new_indptr = np.zeros(len(origins) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_indptr[1:])
+        new_indices = np.empty(new_indptr[-1], dtype=np.int32)
+        new_counts = np.empty(new_indptr[-1], dtype=np.int32)
+        source = _ranges(indptr[origins[kept]], indptr[origins[kept] + 1])
+        target = _ranges(new_indptr[kept], new_indptr[kept + 1])
+        new_indices[target] = indices[source]
+        new_counts[target] = counts[source]
+        for doc, tf in added.items():
+            new_indices[new_indptr[doc]:new_indptr[doc + 1]] = list(tf)
+            new_counts[new_indptr[doc]:new_indptr[doc + 1]] = list(tf.values())
+        return self._weighted(vocabulary, new_indptr, new_indices, new_counts)
+
+    def dump(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        if self.top_docs is not None:
+            arrays.update(top_docs=self.top_docs, top_scores=self.top_scores)
+        meta = {name: [str(value.dtype), list(value.shape)] for name, value in arrays.items()}
+        return meta, arrays
+
+    @classmethod
+    def load(cls, snapshot: RegistrySnapshot, meta: Dict[str, Any],
+             blobs: Dict[str, memoryview]) -> "SimilarityIndex":
+        import numpy as np
+
+        arrays = {
+            name: np.frombuffer(blobs[name], dtype=dtype).reshape(shape)
+            for name, (dtype, shape) in meta.items()
+        }
+        return cls(**arrays)
+
+    def scores(self, seeds: "np.ndarray") -> "np.ndarray":
+        """Cosine similarity of every seed against every prompt, as a dense block."""
+        import numpy as np
+
+        starts, stops = self.indptr[seeds], self.indptr[seeds + 1]
+        seed_rows = np.repeat(np.arange(len(seeds)), stops - starts)
+        entries = _ranges(starts, stops)
+        terms = self.indices[entries]
+        weights = self.data[entries]
+
+        col_starts, col_stops = self.col_ptr[terms], self.col_ptr[terms + 1]
+        lengths = col_stops - col_starts
+        postings = _ranges(col_starts, col_stops)
+        cells = np.repeat(seed_rows, lengths) * self.size + self.col_docs[postings]
+        values = self.col_data[postings] * np.repeat(weights, lengths)
+        block = np.bincount(cells, weights=values, minlength=len(seeds) * self.size)
+        return block.reshape(len(seeds), self.size)
+
+    def neighbours(self, seeds: List[int], limit: int,
+                   allowed: Optional["np.ndarray"] = None) -> List[List[Tuple[int, float]]]:
+        """Return up to `limit` (doc, score) pairs per seed, most similar first.
+
+        Seeds never match themselves, and prompts sharing no term with the
+        seed are left out. `allowed` optionally masks the candidate prompts.
+        """
+        import numpy as np
+
+        if limit <= 0 or not seeds:
+            return [[] for _ in seeds]
+        if allowed is None and self.top_docs is not None and limit <= self.top_docs.shape[1]:
+            return [
+                [(int(doc), float(score))
+                 for doc, score in zip(self.top_docs[seed, :limit], self.top_scores[seed, :limit])
+                 if score > 0]
+                for seed in seeds
+            ]
+
+        results = []
+        block_size = max(1, SIMILAR_BLOCK_CELLS // max(self.size, 1))
+        for start in range(0, len(seeds), block_size):
+            batch = np.array(seeds[start:start + block_size], dtype=np.int64)
+            docs, scores = self._top(batch, limit, allowed)
+            for row_docs, row_scores in zip(docs, scores):
+                results.append([(int(doc), float(score))
+                                for doc, score in zip(row_docs, row_scores) if score > 0])
+        return results
+
+    def _top(self, seeds: "np.ndarray", limit: int,
+             allowed: Optional["np.ndarray"] = None) -> Tuple["np.ndarray", "np.ndarray"]:
+        import numpy as np
+
+        block = self.scores(seeds)
+        block[np.arange(len(seeds)), seeds] = 0
+        if allowed is not None:
+            block[:, ~allowed] = 0
+        limit = min(limit, self.size)
+        if limit < self.size:
+            candidates = np.argpartition(-block, limit - 1, axis=1)[:, :limit]
+        else:
+            candidates = np.broadcast_to(np.arange(self.size), block.shape)
+        candidate_scores = np.take_along_axis(block, candidates, axis=1)
+        # Highest score first, ties in registry order
+        order = np.lexsort((candidates, -candidate_scores), axis=1)
+        return (np.take_along_axis(candidates, order, axis=1),
+                np.take_along_axis(candidate_scores, order, axis=1))
+
+    def _precompute(self, top_k: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        import numpy as np
+
+        top_k = min(top_k, max(self.size - 1, 0))
+        top_docs = np.zeros((self.size, top_k), dtype=np.int32)
+        top_scores = np.zeros((self.size, top_k), dtype=np.float32)
+        block_size = max(1, SIMILAR_BLOCK_CELLS // max(self.size, 1))
+        for start in range(0, self.size, block_size):
+            seeds = np.arange(start, min(start + block_size, self.size))
+            docs, scores = self._top(seeds, top_k)
+            top_docs[seeds] = docs[:, :top_k]
+            top_scores[seeds] = scores[:, :top_k]
+        return top_docs, top_scores
+
+def _ranges(starts: "np.ndarray", stops: "np.ndarray") -> "np.ndarray":
+    """Concatenate arange(start, stop) for every pair, without a Python loop."""
+    import numpy as np
+
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+_INDEX_BUILDERS["similar"] = SimilarityIndex.build
+_INDEX_LOADERS["similar"] = SimilarityIndex.load
+_INDEX_PATCHERS["similar"] = SimilarityIndex.patch
+
+# Compiled snapshots
+#
+# `python awesome_copilot_mcp_server.py compile` writes the registry, its
+# derived indexes and its list/category resource bodies to one binary file.
+# Set AWESOME_COPILOT_SNAPSHOT to serve from it instead of building the
+# registry. The file is memory-mapped read-only: records, postings and
+# string tables are read from the mapping when used, not copied into
+# per-process dicts and lists. Worker processes that map the same file
+# therefore share one copy of it in the page cache. Indexes missing from
+# the file are built as usual.
+#
+# Layout: magic, format and header length, a JSON header, then 8-byte
+# aligned sections of raw array data. Sections are located by offsets in
+# the header, measured from the end of the (padded) header. Strings are
+# stored as string tables: UTF-8 text back to back plus an array of byte
+# offsets. Bump SNAPSHOT_FORMAT whenever the layout or the way an index is
+# built changes, so stale files are rebuilt instead of misread.
+SNAPSHOT_MAGIC = b"ACMCPSN\0"
+SNAPSHOT_FORMAT = 2
+_SNAPSHOT_PRELUDE = struct.Struct("<8sII")
+
+def _string_table(strings: Iterable[str]) -> Tuple[bytes, array]:
+    """Encode strings as (UTF-8 text, byte offsets) for a StringTable."""
+    offsets = array("Q", [0])
+    parts = []
+    for string in strings:
+        encoded = string.encode("utf-8")
+        parts.append(encoded)
+        offsets.append(offsets[-1] + len(encoded))
+    return b"".join(parts), offsets
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+class StringTable(Sequence):
+    """Read-only sequence of strings stored as UTF-8, decoded on access."""
+
+    def __init__(self, data: memoryview, offsets: memoryview):
+        self._data = data
+        self._offsets = offsets.cast("Q")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start, stop = self._offsets[index], self._offsets[index + 1]
+        return str(self._data[start:stop], "utf-8")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def find(self, key: str) -> int:
+        """Position of `key` in a sorted table, or -1."""
+        position = bisect_left(self, key)
+        return position if position < len(self) and self[position] == key else -1
+
+class CodedValues(Sequence):
+    """`values[codes[i]]` for every i, for columns with few distinct values."""
+
+    def __init__(self, values: List[Any], codes: memoryview):
+        self._values = values
+        self._codes = codes
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._values[code] for code in self._codes[index]]
+        return self._values[self._codes[index]]
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+class MappedRecords(Sequence):
+    """PromptRecords materialised from snapshot columns on access."""
+
+    def __init__(self, ids: StringTable, titles: StringTable, descriptions: StringTable,
+                 category_codes: memoryview, tools: CodedValues, tool_masks: CodedValues,
+                 modes: CodedValues):
+        self.tool_masks = tool_masks
+        self._columns = (ids, titles, descriptions, category_codes, tools, tool_masks, modes)
+
+    def __getitem__(self, doc):
+        if isinstance(doc, slice):
+            return [self[i] for i in range(*doc.indices(len(self)))]
+        return PromptRecord(*(column[doc] for column in self._columns))
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+class MappedPositions(Mapping):
+    """Prompt id -> doc lookup by binary search over docs sorted by id."""
+
+    def __init__(self, ids: StringTable, order: memoryview):
+        self._ids = ids
+        self._order = order
+
+    def __getitem__(self, prompt_id: str) -> int:
+        if isinstance(prompt_id, str):
+            low, high = 0, len(self._order)
+            while low < high:
+                middle = (low + high) // 2
+                if self._ids[self._order[middle]] < prompt_id:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low < len(self._order) and self._ids[self._order[low]] == prompt_id:
+                return self._order[low]
+        raise KeyError(prompt_id)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+class PackedPostings(Mapping):
+    """Read-only key -> postings mapping over concatenated arrays.
+
+    Keys are a sorted StringTable. Postings for the i-th key are
+    `column[offsets[i]:offsets[i + 1]]` of each column, sliced from the
+    snapshot on access; with several columns a tuple of slices is returned.
+    """
+
+    def __init__(self, keys: StringTable, offsets: memoryview, *columns: memoryview):
+        self.keys = keys
+        self._offsets = offsets
+        self._columns = columns
+
+    def __getitem__(self, key: str) -> Any:
+        position = self.keys.find(key)
+        if position < 0:
+            raise KeyError(key)
+        start, stop = self._offsets[position], self._offsets[position + 1]
+        if len(self._columns) == 1:
+            return self._columns[0][start:stop]
+        return tuple(column[start:stop] for column in self._columns)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.keys.find(key) >= 0
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+class PackedTokenSets(Sequence):
+    """Per-prompt token tuples, decoded from shared token sets on access."""
+
+    def __init__(self, tokens: StringTable, set_offsets: memoryview, set_tokens: memoryview,
+                 doc_sets: memoryview):
+        self._tokens = tokens
+        self._set_offsets = set_offsets
+        self._set_tokens = set_tokens
+        self._doc_sets = doc_sets
+
+    def __getitem__(self, doc: int) -> Tuple[str, ...]:
+        code = self._doc_sets[doc]
+        codes = self._set_tokens[self._set_offsets[code]:self._set_offsets[code + 1]]
+        return tuple(self._tokens[token] for token in codes)
+
+    def __len__(self) -> int:
+        return len(self._doc_sets)
+
+def _write_sectioned_file(path: str, magic: bytes, file_format: int, header: Dict[str, Any],
+                          sections: Dict[str, Any]) -> int:
+    """Write a prelude, a JSON header and 8-byte aligned binary sections to `path`.
+
+    The file is written to a temporary name and renamed into place, so
+    readers that have the old file mapped keep reading it undisturbed.
+    Returns the size of the file.
+    """
+    offset = 0
+    layout = {}
+    for name, section in sections.items():
+        length = memoryview(section).nbytes
+        layout[name] = [offset, length]
+        offset = _align(offset + length)
+    header = {**header, "byteorder": sys.byteorder, "sections": layout}
+    encoded_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_SNAPSHOT_PRELUDE.pack(magic, file_format, len(encoded_header)))
+        f.write(encoded_header)
+        f.write(b"\0" * (_align(f.tell()) - f.tell()))
+        start = f.tell()
+        for name, section in sections.items():
+            f.write(b"\0" * (start + layout[name][0] - f.tell()))
+            f.write(memoryview(section).cast("B"))
+        size = f.tell()
+    os.replace(temp_path, path)
+    return size
+
+def _read_sectioned_file(data: memoryview, magic: bytes, file_format: int,
+                         kind: str) -> Tuple[Dict[str, Any], Dict[str, memoryview]]:
+    """Parse a file written by _write_sectioned_file into (header, section views).
+
+    Raises ValueError naming the `kind` of file if it is not usable.
+    """
+    if len(data) < _SNAPSHOT_PRELUDE.size:
+        raise ValueError(f"Not a {kind}")
+    found_magic, found_format, header_length = _SNAPSHOT_PRELUDE.unpack_from(data)
+    if found_magic != magic:
+        raise ValueError(f"Not a {kind}")
+    if found_format != file_format:
+        raise ValueError(f"{kind.capitalize()} format {found_format} is not supported (expected {file_format})")
+    header_end = _SNAPSHOT_PRELUDE.size + header_length
+    header = json.loads(str(data[_SNAPSHOT_PRELUDE.size:header_end], "utf-8"))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f"{kind.capitalize()} was written on a {header['byteorder']}-endian machine")
+    start = _align(header_end)
+    if start + max((offset + length for offset, length in header["sections"].values()), default=0) > len(data):
+        raise ValueError(f"{kind.capitalize()} is truncated")
+    sections = {
+        name: data[start + offset:start + offset + length]
+        for name, (offset, length) in header["sections"].items()
+    }
+    return header, sections
+
+def compile_snapshot(snapshot: RegistrySnapshot, path: str,
+                     indexes: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Write `snapshot`, its storable indexes and resource bodies to `path`.
+
+    `indexes` limits which indexes are stored (by default all of them). The
+    file is replaced atomically, so servers that have the old file mapped
+    keep reading it undisturbed.
+    """
+    modes: Dict[str, int] = {}
+    tool_lists: Dict[Tuple[str, ...], int] = {}
+    mode_codes = array("I")
+    tool_list_codes = array("I")
+    category_codes = array("I")
+    for record in snapshot.records:
+        category_codes.append(record.category_code)
+        mode_codes.append(modes.setdefault(record.mode, len(modes)))
+        tool_list_codes.append(tool_lists.setdefault(record.tools, len(tool_lists)))
+
+    category_offsets = [0]
+    category_docs = array("I")
+    for category in snapshot.categories:
+        category_docs.extend(snapshot.category_docs[category])
+        category_offsets.append(len(category_docs))
+
+    header: Dict[str, Any] = {
+        "version": snapshot.version,
+        "size": len(snapshot),
+        "categories": snapshot.categories,
+        "category_offsets": category_offsets,
+        "tools": snapshot.tools,
+        "tool_lists": [[snapshot.tool_codes[tool] for tool in tools] for tools in tool_lists],
+        "modes": list(modes),
+        "indexes": {},
+        "payloads": {},
+    }
+    sections: Dict[str, Any] = {
+        "category_codes": category_codes,
+        "category_docs": category_docs,
+        "tool_list_codes": tool_list_codes,
+        "mode_codes": mode_codes,
+        "id_order": array("I", sorted(range(len(snapshot)), key=snapshot.ids.__getitem__)),
+    }
+    sections["ids"], sections["id_offsets"] = _string_table(snapshot.ids)
+    sections["titles"], sections["title_offsets"] = _string_table(
+        record.title for record in snapshot.records)
+    sections["descriptions"], sections["description_offsets"] = _string_table(
+        record.description for record in snapshot.records)
+
+    for name in indexes if indexes is not None else _INDEX_LOADERS:
+        meta, blobs = snapshot.index(name).dump()
+        header["indexes"][name] = meta
+        for blob_name, blob in blobs.items():
+            sections[f"{name}/{blob_name}"] = blob
+
+    payloads = [_list_payload(snapshot), _categories_payload(snapshot)]
+    payloads.extend(_category_payload(snapshot, category) for category in snapshot.categories)
+    keys = ["list", "categories"] + [f"category:{category}" for category in snapshot.categories]
+    for key, payload in zip(keys, payloads):
+        header["payloads"][key] = payload.etag
+        sections[f"payload/{key}"] = payload.text.encode("utf-8")
+
+    size = _write_sectioned_file(path, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, header, sections)
+    return {"version": snapshot.version, "prompt_count": len(snapshot),
+            "indexes": list(header["indexes"]), "bytes": size}
+
+def load_snapshot(path: str) -> RegistrySnapshot:
+    """Map a compiled snapshot read-only, raising ValueError if it cannot be used."""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _decode_snapshot(memoryview(data))
+
+def _decode_snapshot(data: memoryview) -> RegistrySnapshot:
+    header, sections = _read_sectioned_file(data, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, "compiled snapshot")
+    snapshot = RegistrySnapshot.__new__(RegistrySnapshot)
+    snapshot.version = header["version"]
+    snapshot.categories = [sys.intern(category) for category in header["categories"]]
+    snapshot.category_codes = {category: code for code, category in enumerate(snapshot.categories)}
+    snapshot.tools = [sys.intern(tool) for tool in header["tools"]]
+    snapshot.tool_codes = {tool: code for code, tool in enumerate(snapshot.tools)}
+    snapshot.ids = StringTable(sections["ids"], sections["id_offsets"])
+    snapshot.positions = MappedPositions(snapshot.ids, sections["id_order"].cast("I"))
+
+    tool_list_codes = sections["tool_list_codes"].cast("I")
+    snapshot.records = MappedRecords(
+        snapshot.ids,
+        StringTable(sections["titles"], sections["title_offsets"]),
+        StringTable(sections["descriptions"], sections["description_offsets"]),
+        sections["category_codes"].cast("I"),
+        CodedValues([tuple(snapshot.tools[code] for code in codes) for codes in header["tool_lists"]],
+                    tool_list_codes),
+        CodedValues([sum(1 << code for code in codes) for codes in header["tool_lists"]],
+                    tool_list_codes),
+        CodedValues([sys.intern(mode) for mode in header["modes"]], sections["mode_codes"].cast("I")),
+    )
+
+    category_docs = sections["category_docs"].cast("I")
+    offsets = header["category_offsets"]
+    snapshot.category_docs = {
+        category: category_docs[offsets[code]:offsets[code + 1]]
+        for code, category in enumerate(snapshot.categories)
+    }
+    # Without entry digests a compiled snapshot is never patched, only replaced
+    snapshot._digests = None
+    snapshot._digest_total = 0
+    snapshot._tool_lists = {}
+    snapshot._indexes = {}
+    snapshot._stored = {
+        name: (meta, {
+            section[len(name) + 1:]: view for section, view in sections.items()
+            if section.startswith(name + "/")
+        })
+        for name, meta in header["indexes"].items() if name in _INDEX_LOADERS
+    }
+    # Bodies of the list and category resources come from the file and are
+    # decoded once per process on first use; other payloads are rendered
+    # and cached as for a built snapshot
+    snapshot._stored_payloads = {
+        key: (sections[f"payload/{key}"], etag) for key, etag in header["payloads"].items()
+    }
+    snapshot._payloads = {}
+    snapshot._lock = threading.RLock()
+    return snapshot
+
+# Loading the registry from a local awesome-copilot checkout
+#
+# Set AWESOME_COPILOT_DIR to a clone of github/awesome-copilot to build the
+# registry from its prompts/*.prompt.md files instead of the built-in list.
+# A manifest of each file's mtime, size and hash is kept between runs so only
+# files that changed are parsed again.
+#
+# For a git clone, sync() goes further and skips the scan: the manifest
+# records the commit the registry was built from, and only the prompt files
+# that `git diff --name-status` lists between that commit and HEAD are read
+# again, from HEAD rather than the working tree. Diffs touching more than
+# GIT_SYNC_MAX_CHANGES files fall back to reading every prompt file at HEAD.
+MANIFEST_FORMAT = 1
+GIT_SYNC_MAX_CHANGES = int(os.environ.get("AWESOME_COPILOT_GIT_SYNC_MAX_CHANGES", "200"))
+
+# Categories are not part of the upstream front matter. Prompts we already
+# know keep their curated category; others are classified by keyword.
+CATEGORY_KEYWORDS = [
+    ("testing", ("test", "tests", "testing", "jest", "nunit", "xunit", "mstest", "pytest")),
+    ("github", ("pull", "pr", "prs", "issues", "github")),
+    ("cloud", ("azure", "aws", "gcp", "bicep", "terraform", "cloud")),
+    ("devops", ("docker", "dockerfile", "kubernetes", "pipeline", "ci", "cd")),
+    ("documentation", ("documentation", "docs", "readme", "tutorial", "llms", "comments")),
+    ("planning", ("plan", "planning", "roadmap")),
+    ("code-review", ("review", "reviews")),
+    ("best-practices", ("practices", "conventions", "guidelines")),
+]
+DEFAULT_CATEGORY = "development"
+
+_BUILTIN_CATEGORIES = {prompt_id: metadata["category"] for prompt_id, metadata in PROMPTS_REGISTRY.items()}
+
+def _parse_front_matter_value(value: str) -> Any:
+    value = value.strip()
+    if value.startswith("[") and value.endswith("]"):
+        items = re.findall(r"""'((?:[^']|'')*)'|"((?:[^"\\]|\\.)*)"|([^,\s][^,]*)""", value[1:-1])
+        return [
+            (single.replace("''", "'") if single else double or bare.strip())
+            for single, double, bare in items
+        ]
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"')
+    return value
+
+def parse_front_matter(text: str) -> Tuple[Dict[str, Any], str]:
+    """Split a prompt file into its YAML front matter and Markdown body.
+
+    Only the subset of YAML used by awesome-copilot is understood: scalar
+    `key: value` pairs, inline `[a, b]` lists and `- item` block lists.
+    """
+    lines = text.splitlines()
+    if not lines or lines[0].strip() != "---":
+        return {}, text
+    front_matter: Dict[str, Any] = {}
+    current_list: Optional[List[str]] = None
+    for number, line in enumerate(lines[1:], start=1):
+        if line.strip() == "---":
+            return front_matter, "\n".join(lines[number + 1:])
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped.startswith("- ") and current_list is not None:
+            current_list.append(_parse_front_matter_value(stripped[2:]))
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        key = key.strip()
+        if value.strip():
+            front_matter[key] = _parse_front_matter_value(value)
+            current_list = None
+        else:
+            current_list = front_matter[key] = []
+    return {}, text
+
+def _infer_category(prompt_id: str, description: str) -> str:
+    words = set(_tokenize(prompt_id)) | set(_tokenize(description))
+    for category, keywords in CATEGORY_KEYWORDS:
+        if words.intersection(keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+def parse_prompt_file(prompt_id: str, text: str) -> Dict[str, Any]:
+    """Build a registry entry from the contents of a .prompt.md file."""
+    front_matter, body = parse_front_matter(text)
+    title = front_matter.get("title")
+    if not title:
+        heading = re.search(r"^#\s+(.+?)\s*#*\s*$", body, re.MULTILINE)
+        title = heading.group(1) if heading else prompt_id.replace("-", " ").title()
+    description = str(front_matter.get("description", ""))
+    tools = front_matter.get("tools") or []
+    if isinstance(tools, str):
+        tools = [tools]
+    category = (
+        front_matter.get("category")
+        or _BUILTIN_CATEGORIES.get(prompt_id)
+        or _infer_category(prompt_id, description)
+    )
+    return {
+        "title": str(title),
+        "description": description,
+        "category": str(category),
+        "tools": [str(tool) for tool in tools],
+        "mode": str(front_matter.get("mode", "")),
+    }
+
+def _cache_dir() -> str:
+    return os.environ.get("AWESOME_COPILOT_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "awesome-copilot-mcp")
+
+def _default_manifest_path(checkout: str) -> str:
+    checkout_hash = hashlib.sha256(os.path.abspath(checkout).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(_cache_dir(), f"manifest-{checkout_hash}.json")
+
+# Changed file records are appended to a journal next to the manifest,
+# which is rewritten once the journal holds more than this share of the files
+MANIFEST_JOURNAL_MAX_RATIO = 0.25
+
+class PromptCheckoutLoader:
+    """Builds the registry from a checkout, re-parsing only changed files.
+
+    A file is re-read when its mtime or size differs from the manifest, and
+    re-parsed only when its content hash differs as well. `changed` holds
+    the ids of the prompts added, modified or removed by the last refresh()
+    or sync().
+
+    Each refresh() or sync() appends the records it changed to
+    `{manifest}.journal` as one JSON line, tagged with the `journal` id of
+    the manifest it applies to, instead of rewriting the whole manifest.
+    Reading stops at the first line that is cut short or belongs to another
+    manifest, which leaves the files as some earlier refresh() or sync()
+    wrote them.
+    """
+
+    def __init__(self, checkout: str, manifest_path: Optional[str] = None):
+        self.checkout = checkout
+        self.prompts_dir = os.path.join(checkout, "prompts")
+        self.manifest_path = manifest_path or _default_manifest_path(checkout)
+        self.journal_path = f"{self.manifest_path}.journal"
+        self.changed: set = set()
+        self._journal_id: Optional[str] = None
+        self._journal_records = 0
+        self.files, self.commit = self._read_manifest()
+
+    def _read_manifest(self) -> Tuple[Dict[str, Dict[str, Any]], Optional[str]]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}, None
+        if manifest.get("format") != MANIFEST_FORMAT:
+            return {}, None
+        files, commit = manifest.get("files", {}), manifest.get("commit")
+        self._journal_id = manifest.get("journal")
+        if self._journal_id is None:
+            return files, commit
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        update = json.loads(line)
+                    except ValueError:
+                        update = None
+                    if not isinstance(update, dict) or update.get("journal") != self._journal_id:
+                        # Lines appended after this one would never be read,
+                        # so the next write rewrites the manifest
+                        self._journal_id = None
+                        break
+                    for name, record in update["files"].items():
+                        if record is None:
+                            files.pop(name, None)
+                        else:
+                            files[name] = record
+                    commit = update["commit"]
+                    self._journal_records += len(update["files"])
+        except OSError:
+            pass
+        return files, commit
+
+    def _write_manifest(self, names: Optional[Iterable[str]] = None) -> None:
+        """Record the files named in `names` (all of them when None) and the commit."""
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        names = None if names is None else list(names)
+        if (names is not None and self._journal_id is not None
+                and self._journal_records + len(names) <= MANIFEST_JOURNAL_MAX_RATIO * len(self.files)):
+            update = {"journal": self._journal_id, "commit": self.commit,
+                      "files": {name: self.files.get(name) for name in names}}
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(update) + "\n")
+            self._journal_records += len(names)
+            return
+
+        # The journal goes first: should the rewrite fail, the old manifest
+        # on its own still describes the files as of an earlier commit
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+        self._journal_id = os.urandom(8).hex()
+        self._journal_records = 0
+        temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"format": MANIFEST_FORMAT, "journal": self._journal_id,
+                                "commit": self.commit, "files": self.files}))
+        os.replace(temp_path, self.manifest_path)
+
+    def _registry(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name[:-len(".prompt.md")]: self.files[name]["entry"]
+            for name in sorted(self.files)
+        }
+
+    def refresh(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+        """Scan the checkout and return the registry plus scan statistics."""
+        stats = {"scanned": 0, "parsed": 0, "rehashed": 0, "removed": 0}
+        seen = set()
+        touched = []
+        self.changed = set()
+
+        with os.scandir(self.prompts_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".prompt.md") or not entry.is_file():
+                    continue
+                stats["scanned"] += 1
+                seen.add(entry.name)
+                stat = entry.stat()
+                record = self.files.get(entry.name)
+                if record and record["mtime_ns"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+                    continue
+
+                with open(entry.path, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()
+                if record and record["sha256"] == digest:
+                    stats["rehashed"] += 1
+                else:
+                    prompt_id = entry.name[:-len(".prompt.md")]
+                    text = data.decode("utf-8", errors="replace")
+                    record = {"sha256": digest, "entry": parse_prompt_file(prompt_id, text)}
+                    stats["parsed"] += 1
+                    self.changed.add(prompt_id)
+                record.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                self.files[entry.name] = record
+                touched.append(entry.name)
+
+        for name in [name for name in self.files if name not in seen]:
+            del self.files[name]
+            stats["removed"] += 1
+            self.changed.add(name[:-len(".prompt.md")])
+            touched.append(name)
+
+        # The files now hold the working tree rather than the synced commit,
+        # so the next sync() rereads the commit instead of diffing from it.
+        # A rehash alone leaves the content as it was.
+        if stats["parsed"] or stats["removed"]:
+            self.commit = None
+        if touched:
+            self._write_manifest(touched)
+
+        return self._registry(), stats
+
+    def _git(self, *args: str) -> str:
+        try:
+            result = subprocess.run(["git", "-C", self.checkout, *args],
+                                    capture_output=True, text=True, check=False)
+        except FileNotFoundError as e:
+            raise OSError(f"git is not installed: {e}") from e
+        if result.returncode:
+            raise OSError(f"git {args[0]} failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def _git_changes(self, since: str, until: str) -> List[Tuple[str, Optional[str], Optional[str], str]]:
+        """(status, old file name, new file name, new blob id) for prompt files changed between two commits."""
+        fields = self._git("diff", "--raw", "--no-abbrev", "-z", "-M", since, until, "--", "prompts").split("\0")
+        changes = []
+        i = 0
+        while i < len(fields) - 1:
+            _, _, _, blob, status = fields[i].split(" ")
+            status = status[0]
+            paths = fields[i + 1:i + 3] if status in "RC" else fields[i + 1:i + 2]
+            i += 1 + len(paths)
+            # Only files directly in prompts/ are prompts
+            names = [path[len("prompts/"):] if path.startswith("prompts/") else "" for path in paths]
+            names = [name if name.endswith(".prompt.md") and "/" not in name else None for name in names]
+            old, new = (names[0], names[1]) if status in "RC" else (
+                (names[0], None) if status == "D" else (None, names[0]))
+            if old or new:
+                changes.append((status, old, new, blob))
+        return changes
+
+    def _git_tree(self, commit: str) -> Dict[str, str]:
+        """Blob ids of the prompt files directly in prompts/ at `commit`, by file name."""
+        blobs = {}
+        for line in self._git("ls-tree", "-z", commit, "prompts/").split("\0"):
+            info, _, path = line.partition("\t")
+            name = path[len("prompts/"):]
+            if info.split(" ")[1:2] == ["blob"] and name.endswith(".prompt.md"):
+                blobs[name] = info.split(" ")[2]
+        return blobs
+
+    def _git_blobs(self, blobs: Dict[str, str]) -> Dict[str, Optional[bytes]]:
+        """Contents of the given blob ids, read with one `git cat-file --batch`."""
+        if not blobs:
+            return {}
+        request = "".join(f"{blob}\n" for blob in blobs.values()).encode("ascii")
+        try:
+            result = subprocess.run(["git", "-C", self.checkout, "cat-file", "--batch"],
+                                    input=request, capture_output=True, check=False)
+        except FileNotFoundError as e:
+            raise OSError(f"git is not installed: {e}") from e
+        if result.returncode:
+            raise OSError(f"git cat-file failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+        contents: Dict[str, Optional[bytes]] = {}
+        output, position = result.stdout, 0
+        for name in blobs:
+            end = output.index(b"\n", position)
+            header = output[position:end].split()
+            position = end + 1
+            if header[-1] == b"missing" or header[1] != b"blob":
+                contents[name] = None
+                continue
+            size = int(header[2])
+            contents[name] = output[position:position + size]
+            position += size + 1
+        return contents
+
+    def _record(self, name: str, data: bytes) -> Dict[str, Any]:
+        # Read from git rather than the working tree, so there is no mtime;
+        # the next refresh() rehashes the file once instead of reparsing it
+        text = data.decode("utf-8", errors="replace")
+        return {"sha256": hashlib.sha256(data).hexdigest(),
+                "entry": parse_prompt_file(name[:-len(".prompt.md")], text),
+                "mtime_ns": None, "size": len(data)}
+
+    def sync(self, max_changes: int = GIT_SYNC_MAX_CHANGES) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+        """Apply the prompt files changed since the recorded commit and return the registry.
+
+        Files added, modified, renamed or deleted between the commit the
+        manifest was built from and HEAD are read from HEAD without scanning
+        the rest. Reads every prompt file at HEAD instead when no commit is
+        recorded, when git cannot diff against it (for example after a force
+        push) or when more than `max_changes` files changed. Files are read
+        from the commit, so changes that are not committed are not picked
+        up. Raises OSError if the checkout is not a git repository.
+        """
+        head = self._git("rev-parse", "HEAD").strip()
+        stats: Dict[str, Any] = {"commit": head, "previous_commit": self.commit, "full_rebuild": False,
+                                 "parsed": 0, "removed": 0, "added": 0, "modified": 0, "renamed": 0}
+        changes = None
+        previous_commit = self.commit
+        self.changed = set()
+        if self.commit and self.files:
+            try:
+                changes = self._git_changes(self.commit, head)
+            except OSError as e:
+                logger.warning("Could not diff %s against %s, rereading: %s", self.checkout, self.commit, e)
+
+        if changes is None or len(changes) > max_changes:
+            stats["full_rebuild"] = True
+            blobs = self._git_blobs(self._git_tree(head))
+            files = {}
+            for name in blobs:
+                data = blobs[name]
+                if data is None:
+                    continue
+                record = self.files.get(name)
+                if record is None or record["sha256"] != hashlib.sha256(data).hexdigest():
+                    stats["added" if record is None else "modified"] += 1
+                    stats["parsed"] += 1
+                    record = self._record(name, data)
+                    self.changed.add(name[:-len(".prompt.md")])
+                files[name] = record
+            removed = [name for name in self.files if name not in files]
+            stats["removed"] = len(removed)
+            self.changed.update(name[:-len(".prompt.md")] for name in removed)
+            self.files = files
+            touched = None
+        else:
+            blobs = self._git_blobs({new: blob for _, _, new, blob in changes if new})
+            touched = set()
+            for status, old, new, _ in changes:
+                renamed = False
+                if old and status in "RD" and self.files.pop(old, None) is not None:
+                    # A rename out of prompts/ removes the prompt
+                    renamed = status == "R" and new is not None
+                    stats["renamed" if renamed else "removed"] += 1
+                    touched.add(old)
+                if new:
+                    touched.add(new)
+                    data = blobs.get(new)
+                    if data is None:
+                        stats["removed"] += self.files.pop(new, None) is not None
+                        continue
+                    stats["parsed"] += 1
+                    # A rename into prompts/ from elsewhere adds a prompt
+                    if not renamed:
+                        stats["added" if new not in self.files else "modified"] += 1
+                    self.files[new] = self._record(new, data)
+            self.changed.update(name[:-len(".prompt.md")] for name in touched)
+
+        self.commit = head
+        if touched is None or touched or head != previous_commit:
+            self._write_manifest(touched)
+        return self._registry(), stats
+
+_checkout_loader: Optional[PromptCheckoutLoader] = None
+# Version of the registry the checkout loader last produced, or None while
+# the published registry came from a compiled snapshot rather than from a
+# scan of the checkout
+_checkout_version: Optional[str] = None
+
+def _publish_initial_registry() -> None:
+    global _checkout_loader, _checkout_version
+    if os.environ.get("AWESOME_COPILOT_DIR"):
+        _checkout_loader = PromptCheckoutLoader(
+            os.environ["AWESOME_COPILOT_DIR"], os.environ.get("AWESOME_COPILOT_MANIFEST"))
+
+    snapshot_path = os.environ.get("AWESOME_COPILOT_SNAPSHOT")
+    if snapshot_path:
+        try:
+            publish_snapshot(load_snapshot(snapshot_path))
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load the compiled snapshot %s, building the registry: %s",
+                           snapshot_path, e)
+
+    if _checkout_loader is not None:
+        try:
+            _checkout_version = publish_registry(_checkout_loader.refresh()[0]).version
+            return
+        except OSError as e:
+            logger.warning("Could not load prompts from %s, using the built-in registry: %s",
+                           _checkout_loader.checkout, e)
+            _checkout_loader = None
+    publish_registry(PROMPTS_REGISTRY)
+
+_publish_initial_registry()
+
+# Hot reload
+#
+# A reload builds the next registry version from its source (the checkout,
+# the compiled snapshot or the built-in PROMPTS_REGISTRY, in that order),
+# builds the indexes the current version has in use, and only then
+# publishes it. When the checkout loader reports a small set of changed
+# prompts, the next version is patched from the current one instead (see
+# RegistrySnapshot.patched). Reloads are serialised by a lock; readers never take it.
+# They are triggered by the refresh_registry tool, by SIGUSR1, or by
+# polling the source every AWESOME_COPILOT_WATCH_INTERVAL seconds (0, the
+# default, disables polling).
+RELOAD_SIGNAL = getattr(signal, "SIGUSR1", None)
+WATCH_INTERVAL_SECONDS = float(os.environ.get("AWESOME_COPILOT_WATCH_INTERVAL", "0"))
+
+_reload_lock = threading.Lock()
+
+def reload_registry(git: bool = False) -> Dict[str, Any]:
+    """Build the next registry version and publish it if its content changed.
+
+    With `git`, a checkout is brought up to date with PromptCheckoutLoader.sync
+    (only the files changed in its git history) instead of a scan.
+    """
+    global _checkout_version
+    with _reload_lock:
+        # The published version, not one a request may have pinned
+        current = _current_snapshot
+        stats: Dict[str, Any] = {}
+        snapshot = current
+        snapshot_path = os.environ.get("AWESOME_COPILOT_SNAPSHOT")
+        if _checkout_loader is not None:
+            # Cleared first: if the loader fails part way, its changes are
+            # lost and the next reload has to rebuild from scratch
+            base, _checkout_version = _checkout_version, None
+            registry, stats = _checkout_loader.sync() if git else _checkout_loader.refresh()
+            changed_ids = _checkout_loader.changed
+            if base is None:
+                # Started from a compiled snapshot, which may predate the checkout
+                if _registry_version(registry) != current.version:
+                    snapshot = RegistrySnapshot(registry)
+            elif changed_ids:
+                # The loader's changes are relative to the version it built last
+                snapshot = (current.patched(registry, changed_ids) if base == current.version
+                            else RegistrySnapshot(registry))
+            _checkout_version = snapshot.version if snapshot is not current else (base or current.version)
+        elif snapshot_path:
+            snapshot = load_snapshot(snapshot_path)
+        elif _registry_version(PROMPTS_REGISTRY) != current.version:
+            snapshot = RegistrySnapshot(PROMPTS_REGISTRY)
+
+        changed = snapshot.version != current.version
+        if changed:
+            for name in list(current._indexes):
+                snapshot.index(name)
+            publish_snapshot(snapshot)
+        # Body edits leave the registry version alone, so changed checkout
+        # files also send the body index back to check the mirror
+        if changed or stats.get("parsed") or stats.get("removed"):
+            invalidate_body_index()
+    return {"version": snapshot.version, "prompt_count": len(snapshot), "changed": changed, **stats}
+
+def _reload_in_background(reason: str) -> threading.Thread:
+    def run():
+        try:
+            result = reload_registry()
+        except Exception:
+            logger.exception("Registry reload (%s) failed; still serving the previous version", reason)
+            return
+        if result["changed"]:
+            logger.info("Registry reloaded (%s): version %s, %d prompts",
+                        reason, result["version"], result["prompt_count"])
+
+    thread = threading.Thread(target=run, name="registry-reload", daemon=True)
+    thread.start()
+    return thread
+
+def _source_signature() -> Any:
+    """Cheap fingerprint of the registry source, for change polling."""
+    if _checkout_loader is not None:
+        with os.scandir(_checkout_loader.prompts_dir) as entries:
+            return frozenset(
+                (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in entries if entry.name.endswith(".prompt.md"))
+    snapshot_path = os.environ.get("AWESOME_COPILOT_SNAPSHOT")
+    if snapshot_path:
+        stat = os.stat(snapshot_path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    return None
+
+def _watch_source(interval: float) -> None:
+    signature = None
+    while True:
+        try:
+            current = _source_signature()
+        except OSError:
+            current = signature
+        if signature is not None and current != signature:
+            _reload_in_background("source changed").join()
+        signature = current
+        time.sleep(interval)
+
+def install_reload_triggers(watch_interval: float = WATCH_INTERVAL_SECONDS) -> None:
+    """Reload on RELOAD_SIGNAL and, if `watch_interval` > 0, when the source changes.
+
+    Call from the main thread of a server process.
+    """
+    if RELOAD_SIGNAL is not None and threading.current_thread() is threading.main_thread():
+        signal.signal(RELOAD_SIGNAL, lambda signum, frame: _reload_in_background("signal"))
+    if watch_interval > 0:
+        threading.Thread(target=_watch_source, args=(watch_interval,),
+                         name="registry-watch", daemon=True).start()
+
+# Fetching prompt bodies
+#
+# Bodies are downloaded through one pooled HTTP session and kept in a
+# content-addressed cache on disk (objects/<sha256[:2]>/<sha256>), with an
+# index mapping each URL to its object, ETag and fetch time. Within the TTL
+# the cached body is served as-is; after that it is revalidated with
+# If-None-Match. In offline mode only the cache is used.
+RAW_BASE_URL = os.environ.get(
+    "AWESOME_COPILOT_RAW_BASE", "https://raw.githubusercontent.com/github/awesome-copilot/main")
+CONTENT_TTL_SECONDS = float(os.environ.get("AWESOME_COPILOT_CONTENT_TTL", "3600"))
+CONTENT_TIMEOUT_SECONDS = 10
+OFFLINE_MODE = os.environ.get("AWESOME_COPILOT_OFFLINE", "").lower() in ("1", "true", "yes")
+
+def _create_http_session(pool_size: int = 16) -> "requests.Session":
+    # Imported on first use so servers that never fetch bodies start faster
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retries = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504),
+                    allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = "awesome-copilot-mcp"
+    return session
+
+class PromptContentCache:
+    """Content-addressed disk cache of prompt bodies with HTTP revalidation."""
+
+    def __init__(self, directory: str, base_url: str = RAW_BASE_URL,
+                 ttl: float = CONTENT_TTL_SECONDS, offline: bool = OFFLINE_MODE,
+                 session: Optional["requests.Session"] = None):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.offline = offline
+        self._session = session
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, "index.json")
+        self._index = self._read_index()
+
+    @property
+    def session(self) -> "requests.Session":
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = _create_http_session()
+        return self._session
+
+    def url_for(self, prompt_id: str) -> str:
+        return f"{self.base_url}/prompts/{prompt_id}.prompt.md"
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _read_object(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._object_path(digest), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Treat a corrupted object as a cache miss
+        return data if hashlib.sha256(data).hexdigest() == digest else None
+
+    def _store(self, url: str, data: Optional[bytes], etag: Optional[str], digest: str) -> None:
+        with self._lock:
+            if data is not None:
+                path = self._object_path(digest)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(temp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(temp_path, path)
+            self._index[url] = {"sha256": digest, "etag": etag, "fetched_at": time.time()}
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{self._index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._index, f)
+            os.replace(temp_path, self._index_path)
+
+    def get(self, prompt_id: str) -> Dict[str, Any]:
+        """Return the body of a prompt, from the cache when possible.
+
+        `source` in the result is "cache", "network", "revalidated" (a 304
+        from the server) or "stale-cache" (refresh failed, stale copy served).
+        """
+        url = self.url_for(prompt_id)
+        entry = self._index.get(url)
+        cached = self._read_object(entry["sha256"]) if entry else None
+
+        def result(data: bytes, digest: str, source: str) -> Dict[str, Any]:
+            return {
+                "prompt_id": prompt_id,
+                "url": url,
+                "sha256": digest,
+                "source": source,
+                "content": data.decode("utf-8", errors="replace"),
+            }
+
+        if cached is not None and (self.offline or time.time() - entry["fetched_at"] < self.ttl):
+            return result(cached, entry["sha256"], "cache")
+        if self.offline:
+            return {"error": f"Prompt '{prompt_id}' is not cached and offline mode is enabled"}
+
+        headers = {}
+        if cached is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        import requests
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=CONTENT_TIMEOUT_SECONDS)
+        except requests.RequestException as e:
+            if cached is not None:
+                return result(cached, entry["sha256"], "stale-cache")
+            return {"error": f"Could not fetch prompt '{prompt_id}': {e}"}
+
+        if response.status_code == 304 and cached is not None:
+            self._store(url, None, entry.get("etag"), entry["sha256"])
+            return result(cached, entry["sha256"], "revalidated")
+        if response.status_code == 404:
+            return {"error": f"Prompt '{prompt_id}' not found at {url}"}
+        if response.status_code != 200:
+            if cached is not None:
+                return result(cached, entry["sha256"], "stale-cache")
+            return {"error": f"Could not fetch prompt '{prompt_id}': HTTP {response.status_code}"}
+
+        data = response.content
+        digest = hashlib.sha256(data).hexdigest()
+        self._store(url, data, response.headers.get("ETag"), digest)
+        return result(data, digest, "network")
+
+_content_cache: Optional[PromptContentCache] = None
+
+def get_content_cache() -> PromptContentCache:
+    """Return the process-wide prompt content cache."""
+    global _content_cache
+    if _content_cache is None:
+        _content_cache = PromptContentCache(os.path.join(_cache_dir(), "content"))
+    return _content_cache
+
+# Full-text index over prompt bodies in a local mirror
+#
+# The prompts/*.prompt.md files of a local mirror of awesome-copilot
+# (AWESOME_COPILOT_MIRROR, else the AWESOME_COPILOT_DIR checkout) are
+# indexed line by line, reading each file through mmap. For every term the
+# index keeps the prompts containing it, with the term's frequency and the
+# lines it occurs on, as delta-encoded varints. The index is written to the
+# cache directory and mapped read-only on later starts. It is rebuilt when
+# a file in the mirror changes. Snippets are cut from the mirror files when
+# a query is answered.
+BODY_INDEX_MAGIC = b"ACMCPBI\0"
+BODY_INDEX_FORMAT = 1
+# Lines of context on each side of the best matching line
+BODY_SNIPPET_CONTEXT = 1
+BODY_SNIPPET_MAX_CHARS = 400
+
+_BODY_TOKEN_RE = re.compile(rb"[a-z0-9]+")
+
+def _mirror_dir() -> Optional[str]:
+    return os.environ.get("AWESOME_COPILOT_MIRROR") or os.environ.get("AWESOME_COPILOT_DIR")
+
+def _body_index_path(mirror: str) -> str:
+    mirror_hash = hashlib.sha256(os.path.abspath(mirror).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(_cache_dir(), f"bodies-{mirror_hash}.index")
+
+def _mirror_files(mirror: str) -> Dict[str, List[int]]:
+    """Map each prompt file of the mirror to its [mtime_ns, size]."""
+    files = {}
+    with os.scandir(os.path.join(mirror, "prompts")) as entries:
+        for entry in entries:
+            if entry.name.endswith(".prompt.md") and entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = [stat.st_mtime_ns, stat.st_size]
+    return dict(sorted(files.items()))
+
+def _encode_varints(values: array) -> Tuple[bytes, "np.ndarray"]:
+    """LEB128-encode unsigned `values`: (bytes, end offset of each value's bytes)."""
+    import numpy as np
+    values = np.frombuffer(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += values >= np.uint64(1 << shift)
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for byte in range(int(sizes.max()) if len(sizes) else 0):
+        mask = sizes > byte
+        low = (values[mask] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        more = (sizes[mask] > byte + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + byte] = low | more
+    return out.tobytes(), ends
+
+def _decode_varints(data: memoryview) -> List[int]:
+    import numpy as np
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if not len(raw):
+        return []
+    last = raw < 0x80
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    position = np.arange(len(raw)) - np.repeat(starts, np.diff(np.append(starts, len(raw))))
+    payload = (raw & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.add.reduceat(payload, starts).tolist()
+
+def _decode_postings(data: memoryview) -> List[Tuple[int, int, List[int]]]:
+    """Decode the (doc, term frequency, lines) triples of one term."""
+    values = _decode_varints(data)
+    postings = []
+    doc = 0
+    i = 0
+    while i < len(values):
+        doc += values[i]
+        frequency, count = values[i + 1], values[i + 2]
+        lines = list(itertools.accumulate(values[i + 3:i + 3 + count]))
+        postings.append((doc, frequency, lines))
+        i += 3 + count
+    return postings
+
+def _index_body(path: str) -> Tuple[Counter, Dict[bytes, List[int]], int]:
+    """Tokenize one file through mmap: (term frequencies, lines per term, length in terms)."""
+    frequencies: Counter = Counter()
+    lines: Dict[bytes, List[int]] = {}
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return frequencies, lines, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            line = position = 0
+            while position < size:
+                end = data.find(b"\n", position)
+                if end < 0:
+                    end = size
+                line += 1
+                tokens = _BODY_TOKEN_RE.findall(data[position:end].lower())
+                frequencies.update(tokens)
+                for token in set(tokens):
+                    found = lines.get(token)
+                    if found is None:
+                        lines[token] = [line]
+                    else:
+                        found.append(line)
+                position = end + 1
+    return frequencies, lines, sum(frequencies.values())
+
+class BodyIndex:
+    """BM25 full-text index over the prompt files of a mirror, read from a mapped file."""
+
+    def __init__(self, mirror: str, files: Dict[str, List[int]], header: Dict[str, Any],
+                 sections: Dict[str, memoryview]):
+        self.mirror = mirror
+        self.files = files
+        self.version = header["version"]
+        self.ids = StringTable(sections["ids"], sections["id_offsets"])
+        self.terms = StringTable(sections["terms"], sections["term_offsets"])
+        self.lengths = sections["lengths"].cast("I")
+        self.average_length = header["average_length"]
+        self._posting_offsets = sections["posting_offsets"].cast("Q")
+        self._postings = sections["postings"]
+
+    @classmethod
+    def build(cls, mirror: str, path: str, files: Optional[Dict[str, List[int]]] = None) -> "BodyIndex":
+        """Index the mirror, write the index to `path` and map it."""
+        files = _mirror_files(mirror) if files is None else files
+        prompts_dir = os.path.join(mirror, "prompts")
+        ids = [name[:-len(".prompt.md")] for name in files]
+        lengths = array("I")
+        postings: Dict[bytes, List[Tuple[int, int, List[int]]]] = defaultdict(list)
+        for doc, name in enumerate(files):
+            frequencies, lines, length = _index_body(os.path.join(prompts_dir, name))
+            lengths.append(length)
+            for term, term_lines in lines.items():
+                postings[term].append((doc, frequencies[term], term_lines))
+
+        # Per document: doc gap, frequency, line count, then line gaps
+        values = array("Q")
+        boundaries = [0]
+        terms = sorted(postings)
+        for term in terms:
+            previous = 0
+            for doc, frequency, lines in postings[term]:
+                values.extend((doc - previous, frequency, len(lines), lines[0]))
+                values.extend(map(operator.sub, lines[1:], lines[:-1]))
+                previous = doc
+            boundaries.append(len(values))
+        encoded, ends = _encode_varints(values)
+        posting_offsets = array("Q", [0])
+        posting_offsets.extend(int(ends[boundary - 1]) for boundary in boundaries[1:])
+
+        sections: Dict[str, Any] = {"lengths": lengths, "posting_offsets": posting_offsets,
+                                    "postings": encoded}
+        sections["ids"], sections["id_offsets"] = _string_table(ids)
+        sections["terms"], sections["term_offsets"] = _string_table(term.decode("ascii") for term in terms)
+        header = {
+            "version": hashlib.sha256(json.dumps(files).encode("utf-8")).hexdigest()[:12],
+            "mirror": os.path.abspath(mirror),
+            "files": files,
+            "average_length": sum(lengths) / len(lengths) if lengths else 0.0,
+        }
+        _write_sectioned_file(path, BODY_INDEX_MAGIC, BODY_INDEX_FORMAT, header, sections)
+        return cls.load(path, mirror)
+
+    @classmethod
+    def load(cls, path: str, mirror: str) -> "BodyIndex":
+        """Map the index at `path`, raising ValueError if it is not one for `mirror`."""
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header, sections = _read_sectioned_file(memoryview(data), BODY_INDEX_MAGIC, BODY_INDEX_FORMAT,
+                                               "body index")
+        if header["mirror"] != os.path.abspath(mirror):
+            raise ValueError(f"Body index was built for {header['mirror']}")
+        return cls(mirror, header["files"], header, sections)
+
+    def postings(self, term: str) -> List[Tuple[int, int, List[int]]]:
+        position = self.terms.find(term)
+        if position < 0:
+            return []
+        return _decode_postings(self._postings[self._posting_offsets[position]:
+                                               self._posting_offsets[position + 1]])
+
+    def search(self, query: str) -> Dict[int, Tuple[float, List[int]]]:
+        """Map every prompt containing all query terms to (BM25 score, matching lines per term)."""
+        terms = list(dict.fromkeys(_tokenize(query)))
+        if not terms:
+            return {}
+        matches: Optional[Dict[int, Tuple[float, List[List[int]]]]] = None
+        size = len(self.ids)
+        for term in terms:
+            postings = self.postings(term)
+            idf = math.log(1 + (size - len(postings) + 0.5) / (len(postings) + 0.5))
+            found = {}
+            for doc, frequency, lines in postings:
+                if matches is not None and doc not in matches:
+                    continue
+                norm = 1 - BM25_B + BM25_B * self.lengths[doc] / (self.average_length or 1)
+                score = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+                previous, term_lines = matches[doc] if matches is not None else (0.0, [])
+                found[doc] = (previous + score, term_lines + [lines])
+            matches = found
+            if not matches:
+                break
+        return matches or {}
+
+    def snippet(self, doc: int, term_lines: List[List[int]]) -> Dict[str, Any]:
+        """The lines around the line matching the most query terms, from the mirror file."""
+        counts = Counter(line for lines in term_lines for line in lines)
+        best = min(counts, key=lambda line: (-counts[line], line))
+        with open(os.path.join(self.mirror, "prompts", f"{self.ids[doc]}.prompt.md"), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                lines = data[:].decode("utf-8", errors="replace").split("\n")
+        if lines[-1] == "":
+            lines.pop()
+        start = max(best - BODY_SNIPPET_CONTEXT, 1)
+        end = min(best + BODY_SNIPPET_CONTEXT, len(lines))
+        text = "\n".join(line.rstrip("\r") for line in lines[start - 1:end]).strip()
+        if len(text) > BODY_SNIPPET_MAX_CHARS:
+            text = text[:BODY_SNIPPET_MAX_CHARS - 1].rstrip() + "…"
+        return {"snippet": text, "lines": [start, end], "matched_lines": len(counts)}
+
+_body_index: Optional[BodyIndex] = None
+_body_index_checked = False
+_body_index_lock = threading.Lock()
+
+def get_body_index() -> Optional[BodyIndex]:
+    """The body index of the configured mirror, or None without a mirror.
+
+    The index is checked against the mirror's files on first use and after
+    invalidate_body_index(); a stale or missing index is rebuilt.
+    """
+    global _body_index, _body_index_checked
+    mirror = _mirror_dir()
+    if not mirror:
+        return None
+    with _body_index_lock:
+        if _body_index is not None and _body_index_checked and _body_index.mirror == mirror:
+            return _body_index
+        files = _mirror_files(mirror)
+        path = _body_index_path(mirror)
+        index = _body_index if _body_index is not None and _body_index.mirror == mirror else None
+        if index is None or index.files != files:
+            try:
+                index = BodyIndex.load(path, mirror)
+            except (OSError, ValueError):
+                index = None
+        if index is None or index.files != files:
+            start = time.perf_counter()
+            index = BodyIndex.build(mirror, path, files)
+            logger.info("Indexed %d prompt bodies from %s in %.0f ms",
+                        len(files), mirror, (time.perf_counter() - start) * 1000)
+        _body_index = index
+        _body_index_checked = True
+        return index
+
+def invalidate_body_index() -> None:
+    """Have the next get_body_index() check the mirror for changed files."""
+    global _body_index_checked
+    _body_index_checked = False
+
+def _source_url(prompt_id: str) -> str:
+    return f"https://github.com/github/awesome-copilot/blob/main/prompts/{prompt_id}.prompt.md"
+
+def _install_url(prompt_id: str) -> str:
+    return f"https://vscode.dev/redirect?url=vscode%3Achat-prompt%2Finstall%3Furl%3Dhttps%3A%2F%2Fraw.githubusercontent.com%2Fgithub%2Fawesome-copilot%2Fmain%2Fprompts%2F{prompt_id}.prompt.md"
+
+# Usage guide fragments
+#
+# The guide is assembled from Markdown fragments rendered once per registry
+# version: one per prompt and one heading per category. Joining them with
+# newlines gives the same text as rendering the guide line by line.
+GUIDE_HEADER = "\n".join([
+    "# Awesome GitHub Copilot Prompts Usage Guide",
+    "",
+    "This guide provides information about available GitHub Copilot prompts from the awesome-copilot repository.",
+    ""
+])
+GUIDE_FOOTER = "\n".join([
+    "## General Usage Instructions",
+    "",
+    "1. **Install a prompt:** Click the installation link for any prompt above",
+    "2. **Use in VS Code:** Type `/prompt-name` in the chat interface",
+    "3. **Run command:** Use `Chat: Run Prompt` command from the command palette",
+    "4. **Direct execution:** Hit the run button while viewing a prompt file",
+    "",
+    "For more information, visit the [awesome-copilot repository](https://github.com/github/awesome-copilot)."
+])
+
+def _render_guide_entry(record: PromptRecord) -> str:
+    prompt_id = record.id
+    lines = [
+        f"### {record.title}",
+        f"**ID:** `{prompt_id}`",
+        f"**Description:** {record.description}",
+        ""
+    ]
+    if record.tools:
+        lines.extend([
+            "**Required Tools:**",
+            ", ".join(f"`{tool}`" for tool in record.tools),
+            ""
+        ])
+    lines.extend([
+        "**Installation:**",
+        f"- [Install in VS Code]({_install_url(prompt_id)})",
+        f"- [View Source]({_source_url(prompt_id)})",
+        "",
+        "**Usage:**",
+        f"Use `/{prompt_id}` in VS Code chat or run the `Chat: Run Prompt` command.",
+        "",
+        "---",
+        ""
+    ])
+    return "\n".join(lines)
+
+class GuideFragments:
+    """Per-version cache of rendered usage guide fragments."""
+
+    def __init__(self, snapshot: RegistrySnapshot):
+        self.snapshot = snapshot
+        self._sections: Dict[str, List[str]] = {}
+        self._units: Dict[Optional[str], List[str]] = {}
+        self._guides: Dict[Optional[str], str] = {}
+
+    def patch(self, previous: RegistrySnapshot, snapshot: RegistrySnapshot,
+              diff: "SnapshotDiff") -> "GuideFragments":
+        """Fragments for `snapshot`, keeping the sections of categories without changed prompts."""
+        touched = {previous.category(previous.records[doc]) for doc in diff.removed}
+        touched.update(snapshot.category(snapshot.records[doc]) for doc in diff.added)
+        fragments = GuideFragments(snapshot)
+        fragments._sections = {
+            category: section for category, section in self._sections.items() if category not in touched
+        }
+        return fragments
+
+    def section(self, category: str) -> List[str]:
+        """Heading plus one fragment per prompt in `category`, sorted by title."""
+        section = self._sections.get(category)
+        if section is None:
+            records = sorted(
+                (self.snapshot.records[doc] for doc in self.snapshot.category_docs[category]),
+                key=lambda record: record.title)
+            section = [f"## {category.title()} Prompts\n"]
+            section.extend(_render_guide_entry(record) for record in records)
+            section = self._sections.setdefault(category, section)
+        return section
+
+    def units(self, category: Optional[str] = None) -> List[str]:
+        """The guide's fragments in order, header and footer included."""
+        if category and category not in self.snapshot.category_docs:
+            return [GUIDE_HEADER, GUIDE_FOOTER]
+        units = self._units.get(category)
+        if units is None:
+            categories = [category] if category else sorted(self.snapshot.category_docs)
+            units = [GUIDE_HEADER]
+            for name in categories:
+                units.extend(self.section(name))
+            units.append(GUIDE_FOOTER)
+            units = self._units.setdefault(category, units)
+        return units
+
+    def render(self, category: Optional[str] = None) -> str:
+        if category and category not in self.snapshot.category_docs:
+            return "\n".join(self.units(category))
+        guide = self._guides.get(category)
+        if guide is None:
+            guide = self._guides.setdefault(category, "\n".join(self.units(category)))
+        return guide
+
+_INDEX_BUILDERS["guide"] = GuideFragments
+_INDEX_PATCHERS["guide"] = GuideFragments.patch
+
+# Workspace scanning for stack-aware recommendations
+#
+# recommend_prompts_for_workspace walks a local directory with os.scandir,
+# one directory per task on a thread pool, skipping what .gitignore files
+# ignore. Files are matched by name and extension against STACK_FILE_SIGNALS,
+# and manifests are read for the frameworks they reference. The walk stops
+# at a file budget or a deadline and then reports what it has seen so far,
+# flagged as partial.
+#
+# The tool reads directories on the machine running the server. Over stdio
+# that is the client's own machine; over HTTP it is not, so scans are then
+# refused unless AWESOME_COPILOT_WORKSPACE_ROOTS (os.pathsep-separated)
+# names the directories clients may scan. When set, it applies to stdio too.
+WORKSPACE_ROOTS = [root for root in os.environ.get("AWESOME_COPILOT_WORKSPACE_ROOTS", "").split(os.pathsep) if root]
+WORKSPACE_MAX_FILES = int(os.environ.get("AWESOME_COPILOT_WORKSPACE_MAX_FILES", "50000"))
+WORKSPACE_SCAN_SECONDS = float(os.environ.get("AWESOME_COPILOT_WORKSPACE_SCAN_SECONDS", "0.5"))
+WORKSPACE_SCAN_THREADS = 8
+# Directories skipped even without a .gitignore saying so
+WORKSPACE_SKIP_DIRS = frozenset({".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv"})
+WORKSPACE_MANIFEST_MAX_BYTES = 256 * 1024
+# Progress is reported to the client after this many directories
+WORKSPACE_PROGRESS_EVERY = 256
+
+# File names and extensions (lowercase) to the stacks they indicate
+STACK_FILE_SIGNALS: Dict[str, Tuple[str, ...]] = {
+    ".sln": ("dotnet",),
+    ".csproj": ("dotnet", "csharp"),
+    ".cs": ("csharp",),
+    "pom.xml": ("java", "maven"),
+    "build.gradle": ("java",),
+    "build.gradle.kts": ("kotlin",),
+    ".java": ("java",),
+    ".kt": ("kotlin",),
+    "package.json": ("node",),
+    ".ts": ("typescript",),
+    ".tsx": ("typescript",),
+    ".js": ("javascript",),
+    ".jsx": ("javascript",),
+    "dockerfile": ("docker",),
+    ".dockerfile": ("docker",),
+    "docker-compose.yml": ("docker",),
+    "compose.yaml": ("docker",),
+    ".bicep": ("bicep", "azure"),
+    "azure.yaml": ("azure",),
+    ".md": ("markdown",),
+    ".py": ("python",),
+    "pyproject.toml": ("python",),
+    "requirements.txt": ("python",),
+}
+# Manifests whose contents name frameworks: a manifest matches a key by
+# file name or extension, and each pattern found in it adds its stack
+STACK_MANIFEST_SIGNALS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "package.json": (('"jest"', "jest"), ('"next"', "nextjs"), ('"next-intl"', "next-intl"),
+                     ('"typescript"', "typescript")),
+    ".csproj": (("xunit", "xunit"), ("nunit", "nunit"), ("mstest", "mstest"),
+                ("entityframeworkcore", "ef-core"), ("microsoft.net.sdk.web", "aspnet")),
+    "pom.xml": (("spring-boot", "spring-boot"),),
+    "build.gradle": (("spring-boot", "spring-boot"),),
+    "build.gradle.kts": (("spring-boot", "spring-boot"),),
+}
+# Search query run for each detected stack; every stack the signal tables
+# above can emit needs one, or it is detected but never recommended for
+STACK_QUERIES: Dict[str, str] = {
+    "dotnet": ".net c#",
+    "csharp": "c#",
+    "aspnet": "asp.net",
+    "ef-core": "entity framework",
+    "xunit": "xunit",
+    "nunit": "nunit",
+    "mstest": "mstest",
+    "java": "java",
+    "maven": "java",
+    "kotlin": "kotlin",
+    "spring-boot": "spring boot",
+    "typescript": "typescript",
+    "javascript": "javascript",
+    "node": "javascript",
+    "jest": "jest",
+    "nextjs": "next",
+    "next-intl": "next intl",
+    "docker": "dockerfile",
+    "bicep": "bicep",
+    "azure": "azure",
+    "markdown": "markdown",
+    "python": "python",
+    "github": "github",
+}
+
+def _gitignore_regex(pattern: str) -> str:
+    """Translate a .gitignore glob into a regex over slash-separated paths."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            members = pattern[i + 1:end]
+            parts.append("[^" + members[1:] + "]" if members.startswith("!") else "[" + members + "]")
+            i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "".join(parts) + "(?:/.*)?$"
+
+class GitIgnore:
+    """The rules of one .gitignore file, matched against paths below its directory."""
+
+    __slots__ = ("base", "rules", "combined")
+
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = base
+        rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            line = line[1:] if negate else line
+            directory_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # A pattern with a slash before its end is relative to the
+            # .gitignore directory; otherwise it matches at any depth
+            anchored = "/" in line
+            rules.append((_gitignore_regex(line.lstrip("/")), anchored, negate, directory_only))
+        self.rules = [(re.compile(source), anchored, negate, directory_only)
+                      for source, anchored, negate, directory_only in rules]
+
+        # Without negations any matching rule ignores a path, so the rules
+        # are joined into one name regex and one path regex per entry kind
+        self.combined = None
+        if not any(negate for _, _, negate, _ in rules):
+            def join(is_dir, anchored):
+                sources = [source for source, rule_anchored, _, directory_only in rules
+                           if rule_anchored == anchored and (is_dir or not directory_only)]
+                return re.compile("|".join(f"(?:{source})" for source in sources)) if sources else None
+            self.combined = {is_dir: (join(is_dir, False), join(is_dir, True)) for is_dir in (False, True)}
+
+    def match(self, path: str, name: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included, None if no rule applies."""
+        relative = path[len(self.base):].lstrip("/") if self.base else path
+        if self.combined is not None:
+            by_name, by_path = self.combined[is_dir]
+            if (by_name and by_name.match(name)) or (by_path and by_path.match(relative)):
+                return True
+            return None
+        # The last matching rule decides
+        for regex, anchored, negate, directory_only in reversed(self.rules):
+            if directory_only and not is_dir:
+                continue
+            if regex.match(relative if anchored else name):
+                return not negate
+        return None
+
+def _ignored(ignores: Tuple[GitIgnore, ...], path: str, name: str, is_dir: bool) -> bool:
+    # Rules in deeper .gitignore files, and later rules, take precedence
+    for ignore in reversed(ignores):
+        result = ignore.match(path, name, is_dir)
+        if result is not None:
+            return result
+    return False
+
+def _scan_directory(root: str, path: str, ignores: Tuple[GitIgnore, ...]):
+    """List one directory: (files, stack evidence, subdirectories to visit, ignores for them)."""
+    directory = os.path.join(root, path) if path else root
+    try:
+        with os.scandir(directory) as iterator:
+            entries = list(iterator)
+    except OSError:
+        return 0, Counter(), [], ignores
+
+    if any(entry.name == ".gitignore" for entry in entries):
+        try:
+            with open(os.path.join(directory, ".gitignore"), encoding="utf-8", errors="replace") as f:
+                ignores = ignores + (GitIgnore(path, f),)
+        except OSError:
+            pass
+
+    files = 0
+    evidence: Counter = Counter()
+    subdirectories = []
+    for entry in entries:
+        name = entry.name
+        relative = f"{path}/{name}" if path else name
+        try:
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            continue
+        if is_dir:
+            if name in WORKSPACE_SKIP_DIRS or _ignored(ignores, relative, name, True):
+                continue
+            if name == ".github":
+                evidence["github"] += 1
+            subdirectories.append(relative)
+            continue
+        if ignores and _ignored(ignores, relative, name, False):
+            continue
+        files += 1
+        lowered = name.lower()
+        dot = lowered.rfind(".")
+        extension = lowered[dot:] if dot > 0 else ""
+        stacks = STACK_FILE_SIGNALS.get(lowered) or STACK_FILE_SIGNALS.get(extension)
+        if stacks:
+            evidence.update(stacks)
+        manifest = lowered if lowered in STACK_MANIFEST_SIGNALS else extension
+        if manifest in STACK_MANIFEST_SIGNALS:
+            try:
+                with open(entry.path, "rb") as f:
+                    text = f.read(WORKSPACE_MANIFEST_MAX_BYTES).decode("utf-8", "replace").lower()
+            except OSError:
+                continue
+            evidence.update(stack for pattern, stack in STACK_MANIFEST_SIGNALS[manifest] if pattern in text)
+    return files, evidence, subdirectories, ignores
+
+def _allowed_workspace(path: str) -> str:
+    """Resolve `path`, checking it lies under WORKSPACE_ROOTS when those are set."""
+    resolved = os.path.realpath(os.path.expanduser(path))
+    if not WORKSPACE_ROOTS:
+        if _serving_http:
+            raise ValueError("Workspace scans over HTTP need AWESOME_COPILOT_WORKSPACE_ROOTS on the server")
+        return resolved
+    for root in WORKSPACE_ROOTS:
+        root = os.path.realpath(os.path.expanduser(root))
+        if os.path.commonpath([resolved, root]) == root:
+            return resolved
+    raise ValueError(f"Not under a configured workspace root: {path}")
+
+def scan_workspace(root: str, max_files: int = WORKSPACE_MAX_FILES,
+                   max_seconds: float = WORKSPACE_SCAN_SECONDS,
+                   on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Fingerprint the stack of the workspace at `root`.
+
+    Directories are listed concurrently, breadth first. Stops early once
+    `max_files` files are counted or `max_seconds` have passed; the result
+    then covers what was scanned and has `partial` set. `on_progress` is
+    called with the running result every WORKSPACE_PROGRESS_EVERY directories.
+    """
+    root = os.path.abspath(os.path.expanduser(root))
+    if not os.path.isdir(root):
+        raise ValueError(f"Not a directory: {root}")
+
+    start = time.perf_counter()
+    deadline = start + max_seconds
+    evidence: Counter = Counter()
+    files = directories = 0
+    partial = False
+
+    def state():
+        return {
+            "root": root,
+            "files_scanned": files,
+            "directories_scanned": directories,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            "partial": partial,
+            "stacks": dict(evidence.most_common()),
+        }
+
+    # Only a couple of directories per thread are in flight at a time, so
+    # the walk stops promptly at the budget and waiting stays cheap
+    executor = ThreadPoolExecutor(WORKSPACE_SCAN_THREADS, thread_name_prefix="workspace-scan")
+    queue = deque([("", ())])
+    pending = set()
+    try:
+        while queue or pending:
+            while queue and len(pending) < WORKSPACE_SCAN_THREADS * 2:
+                pending.add(executor.submit(_scan_directory, root, *queue.popleft()))
+            done, pending = wait(pending, timeout=max(deadline - time.perf_counter(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                partial = True
+                break
+            for future in done:
+                count, found, subdirectories, ignores = future.result()
+                files += count
+                directories += 1
+                evidence.update(found)
+                queue.extend((subdirectory, ignores) for subdirectory in subdirectories)
+                if on_progress and directories % WORKSPACE_PROGRESS_EVERY == 0:
+                    on_progress(state())
+            if files >= max_files:
+                partial = bool(queue or pending)
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return state()
+
+def rank_for_stacks(snapshot: RegistrySnapshot, stacks: Dict[str, int],
+                    limit: int) -> List[Tuple[int, float, List[str]]]:
+    """Rank prompts for a stack fingerprint: (doc, score, matched stacks), best first.
+
+    Each stack's search scores are normalised to at most 1 and weighted by
+    the log of how much evidence there is for the stack and by how specific
+    its query is: a framework matching two prompts counts for more than a
+    language matching ten.
+    """
+    index = snapshot.index("search")
+    totals: Dict[int, float] = defaultdict(float)
+    matched: Dict[int, List[str]] = defaultdict(list)
+    for stack, count in stacks.items():
+        query = STACK_QUERIES.get(stack)
+        scores = index.scores(query) if query else None
+        if not scores:
+            continue
+        best = max(scores.values())
+        weight = math.log1p(count) * math.log1p(len(snapshot) / len(scores))
+        for doc, score in scores.items():
+            totals[doc] += weight * score / best
+            matched[doc].append(stack)
+    return [(doc, score, matched[doc]) for doc, score in _top_scores(totals, limit)]
+
+# Field projection and cursor pagination for tool results
+PROMPT_FIELD_GETTERS: Dict[str, Callable[[RegistrySnapshot, PromptRecord], Any]] = {
+    "id": lambda snapshot, record: record.id,
+    "title": lambda snapshot, record: record.title,
+    "description": lambda snapshot, record: record.description,
+    "category": lambda snapshot, record: snapshot.category(record),
+    "tools": lambda snapshot, record: list(record.tools),
+    "url": lambda snapshot, record: _source_url(record.id),
+    "install_url": lambda snapshot, record: _install_url(record.id),
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def _select_fields(fields: Optional[List[str]], default: Tuple[str, ...],
+                   extras: Tuple[str, ...] = ()) -> Tuple[str, ...]:
+    """Validate a `fields` projection, falling back to `default`."""
+    if not fields:
+        return default
+    unknown = [field for field in fields if field not in PROMPT_FIELD_GETTERS and field not in extras]
+    if unknown:
+        known = ", ".join([*PROMPT_FIELD_GETTERS, *extras])
+        raise ValueError(f"Unknown fields {unknown}, expected any of: {known}")
+    return tuple(dict.fromkeys(fields))
+
+def _project(snapshot: RegistrySnapshot, record: PromptRecord, fields: Tuple[str, ...],
+             extras: Optional[Dict[str, Callable[[], Any]]] = None) -> Dict[str, Any]:
+    """Build a result dict holding only the requested fields."""
+    item = {}
+    for field in fields:
+        getter = PROMPT_FIELD_GETTERS.get(field)
+        item[field] = getter(snapshot, record) if getter else extras[field]()
+    return item
+
+def _query_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+def _encode_cursor(snapshot: RegistrySnapshot, query_key: str, offset: int) -> str:
+    state = json.dumps({"v": snapshot.version, "q": query_key, "o": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(state.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(snapshot: RegistrySnapshot, query_key: str, cursor: Optional[str]) -> int:
+    """Return the offset encoded in `cursor`.
+
+    Cursors are only valid for the registry version and query they were
+    issued for, so pages never shift or overlap under a client.
+    """
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        version, key, offset = state["v"], state["q"], int(state["o"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if version != snapshot.version:
+        raise ValueError("Cursor has expired: the registry changed, restart from the first page")
+    if key != query_key or offset < 0:
+        raise ValueError("Cursor does not belong to this query")
+    return offset
+
+# Resource payloads, rendered once per registry version
+def _list_payload(snapshot: RegistrySnapshot) -> RenderedPayload:
+    def render():
+        return [
+            {
+                "id": record.id,
+                "title": record.title,
+                "description": record.description,
+                "category": snapshot.category(record),
+                "url": _source_url(record.id)
+            }
+            for record in snapshot.records
+        ]
+    return snapshot.payload("list", render)
+
+def _categories_payload(snapshot: RegistrySnapshot) -> RenderedPayload:
+    def render():
+        return {category: len(docs) for category, docs in snapshot.category_docs.items()}
+    return snapshot.payload("categories", render)
+
+def _category_payload(snapshot: RegistrySnapshot, category: str) -> Optional[RenderedPayload]:
+    docs = snapshot.category_docs.get(category)
+    if docs is None:
+        return None
+    def render():
+        prompts = []
+        for doc in docs:
+            record = snapshot.records[doc]
+            prompts.append({
+                "id": record.id,
+                "title": record.title,
+                "description": record.description,
+                "tools": list(record.tools),
+                "url": _source_url(record.id)
+            })
+        return prompts
+    return snapshot.payload(f"category:{category}", render)
+
+def _prompt_details(snapshot: RegistrySnapshot, record: PromptRecord) -> Dict[str, Any]:
+    return {
+        "id": record.id,
+        "title": record.title,
+        "description": record.description,
+        "category": snapshot.category(record),
+        "tools": list(record.tools),
+        "url": _source_url(record.id),
+        "install_url": _install_url(record.id)
+    }
+
+def _prompt_payload(snapshot: RegistrySnapshot, prompt_id: str) -> Optional[RenderedPayload]:
+    record = snapshot.get(prompt_id)
+    if record is None:
+        return None
+    return snapshot.payload(f"prompt:{prompt_id}", lambda: _prompt_details(snapshot, record))
+
+def _resource_payload(snapshot: RegistrySnapshot, uri: str) -> Optional[RenderedPayload]:
+    """Resolve a copilot-prompts:// URI to its cached payload."""
+    scheme = "copilot-prompts://"
+    if not uri.startswith(scheme):
+        return None
+    path = uri[len(scheme):]
+    if path == "list":
+        return _list_payload(snapshot)
+    if path == "categories":
+        return _categories_payload(snapshot)
+    if path.startswith("prompt/"):
+        return _prompt_payload(snapshot, path[len("prompt/"):])
+    return _category_payload(snapshot, path)
+
+# Resources for exposing prompt metadata and content
+@mcp.resource("copilot-prompts://list")
+def list_all_prompts() -> str:
+    """Get a list of all available GitHub Copilot prompts.
+
+    The list is not paginated; clients that want pages should call the
+    `list_prompts` tool instead.
+    """
+    return _list_payload(get_snapshot()).text
+
+@mcp.resource("copilot-prompts://categories")
+def list_prompt_categories() -> str:
+    """Get all prompt categories and their counts."""
+    return _categories_payload(get_snapshot()).text
+
+@mcp.resource("copilot-prompts://version")
+def get_registry_version() -> str:
+    """Get the current registry version and the ETags of the top-level resources."""
+    snapshot = get_snapshot()
+    return json.dumps({
+        "version": snapshot.version,
+        "prompt_count": len(snapshot),
+        "etags": {
+            "copilot-prompts://list": _list_payload(snapshot).etag,
+            "copilot-prompts://categories": _categories_payload(snapshot).etag
+        }
+    }, indent=2)
+
+@mcp.resource("copilot-prompts://metrics")
+def get_server_metrics() -> str:
+    """Get call counts, error counts, latency and response size per tool, resource and prompt."""
+    return json.dumps(METRICS.to_dict(), indent=2)
+
+if METRICS_HTTP_PATH:
+    @mcp.custom_route(METRICS_HTTP_PATH, methods=["GET"])
+    async def prometheus_metrics(request):
+        """Prometheus scrape endpoint, served when running over HTTP."""
+        from starlette.responses import PlainTextResponse
+        return PlainTextResponse(METRICS.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+@mcp.resource("copilot-prompts://{category}")
+def get_prompts_by_category(category: str) -> str:
+    """Get all prompts in a specific category.
+
+    The list is not paginated; `list_prompts(category=...)` returns the
+    same prompts page by page.
+    """
+    payload = _category_payload(get_snapshot(), category)
+    if payload is None:
+        return json.dumps([], indent=2)
+    return payload.text
+
+@mcp.resource("copilot-prompts://prompt/{prompt_id}")
+def get_prompt_details(prompt_id: str) -> str:
+    """Get detailed information about a specific prompt."""
+    payload = _prompt_payload(get_snapshot(), prompt_id)
+    if payload is None:
+        return json.dumps({"error": f"Prompt '{prompt_id}' not found"})
+    return payload.text
+
+@mcp.resource("copilot-prompts://prompt/{prompt_id}/content", mime_type="text/markdown", offload=True)
+def get_prompt_body(prompt_id: str) -> str:
+    """Get the Markdown body of a specific prompt."""
+    if prompt_id not in get_snapshot():
+        return json.dumps({"error": f"Prompt '{prompt_id}' not found"})
+    result = get_content_cache().get(prompt_id)
+    if "error" in result:
+        return json.dumps(result)
+    return result["content"]
+
+# Tools for working with prompts
+@mcp.tool(offload=True)
+def search_prompts(
+    query: str,
+    category: Optional[str] = None,
+    limit: int = 20,
+    fields: Optional[List[str]] = None,
+    fuzzy: Optional[bool] = None,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Search for prompts by title, description, or category.
+    
+    Results are ranked by relevance (BM25 over id, title, description and
+    category, with title matches weighted highest). Every word of the query
+    has to match, either exactly or as the start of a longer word.
+    
+    Fuzzy matching tolerates typos and joined or split words ("kotln",
+    "multistage"): candidates come from a character-trigram index and are
+    ranked by edit distance.
+    
+    Args:
+        query: Search query to match against title and description
+        category: Optional category filter
+        limit: Number of results per page (at most 500)
+        fields: Optional fields to include in each result, e.g. ["id", "title"]
+        fuzzy: True for fuzzy matching only, False for exact matching only;
+            by default fuzzy matching is used when nothing matches exactly
+        cursor: Cursor from the previous page's `next_cursor`; omit for the first page
+    
+    Returns:
+        The registry version, the number of matching prompts, a page of them
+        with their metadata, best match first, and a `next_cursor` for the
+        following page (null on the last page)
+    """
+    snapshot = get_snapshot()
+    selected = _select_fields(
+        fields, ("id", "title", "description", "category", "tools", "url", "score"), ("score",))
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    # Both indexes only see the query's distinct lowercase words
+    terms = tuple(dict.fromkeys(_tokenize(query)))
+    normalized = (terms, category or None, fuzzy)
+    query_key = _query_key("search_prompts", *normalized)
+    offset = _decode_cursor(snapshot, query_key, cursor)
+    
+    def search():
+        end = offset + limit
+        allowed = set(snapshot.category_docs.get(category, ())) if category else None
+        matches, total = [], 0
+        if not fuzzy:
+            scores = snapshot.index("search").scores(query, allowed)
+            if scores is None:
+                # No query words: every prompt, in registry order
+                docs = snapshot.category_docs.get(category, array("I")) if category else range(len(snapshot))
+                matches, total = [(doc, 0.0) for doc in docs[offset:end]], len(docs)
+            else:
+                matches, total = _top_scores(scores, end)[offset:], len(scores)
+        if not total and fuzzy is not False:
+            # Fuzzy matches are bounded by the candidate count, so rank them all
+            fuzzy_matches = snapshot.index("trigrams").search(query, allowed, FUZZY_CANDIDATES)
+            matches, total = fuzzy_matches[offset:end], len(fuzzy_matches)
+        
+        items = []
+        for doc, score in matches:
+            extras = {"score": lambda: round(score, 4)}
+            items.append(_project(snapshot, snapshot.records[doc], selected, extras))
+        return {
+            "version": snapshot.version,
+            "total": total,
+            "items": items,
+            "next_cursor": _encode_cursor(snapshot, query_key, end) if end < total else None
+        }
+    
+    return cached_result("search_prompts", snapshot, (normalized, offset, limit, selected), search)
+
+@mcp.tool(offload=True)
+def search_prompts_faceted(
+    query: str = "",
+    category: Optional[str] = None,
+    limit: int = 20,
+    fields: Optional[List[str]] = None,
+    fuzzy: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Search for prompts and count how the matches spread over categories and tools.
+    
+    Use the facet counts to choose a category or tool to narrow down by,
+    instead of searching once per category. Matching and ranking work as in
+    search_prompts; an empty query matches every prompt, in registry order.
+    
+    Args:
+        query: Search query to match against title and description
+        category: Optional category filter for the results
+        limit: Maximum number of results to return
+        fields: Optional fields to include in each result, e.g. ["id", "title"]
+        fuzzy: True for fuzzy matching only, False for exact matching only;
+            by default fuzzy matching is used when nothing matches exactly
+    
+    Returns:
+        The registry version, the number of matches, the best `limit` of
+        them and the facet counts, largest first: `categories` counts every
+        prompt matching the query whatever `category` is, so it shows what
+        each category would leave; `tools` counts the matches in `category`
+    """
+    snapshot = get_snapshot()
+    selected = _select_fields(
+        fields, ("id", "title", "description", "category", "tools", "url", "score"), ("score",))
+    
+    def search():
+        facets = snapshot.index("facets")
+        scores = {} if fuzzy else snapshot.index("search").scores(query)
+        if scores == {} and fuzzy is not False:
+            scores = dict(snapshot.index("trigrams").search(query, None, FUZZY_CANDIDATES))
+        
+        if scores is None:
+            matched = facets.all_docs
+            docs = snapshot.category_docs.get(category, ()) if category else range(len(snapshot))
+            total = len(docs)
+            matches = [(doc, 0.0) for doc in docs[:max(limit, 0)]]
+        else:
+            matched = facets.bits(scores)
+            if category:
+                allowed = set(snapshot.category_docs.get(category, ()))
+                scores = {doc: score for doc, score in scores.items() if doc in allowed}
+            total = len(scores)
+            matches = _top_scores(scores, max(limit, 0))
+        in_category = matched & facets.category_bits.get(category, 0) if category else matched
+        
+        results = []
+        for doc, score in matches:
+            extras = {"score": lambda: round(score, 4)}
+            results.append(_project(snapshot, snapshot.records[doc], selected, extras))
+        return {
+            "version": snapshot.version,
+            "total": total,
+            "results": results,
+            "facets": {"categories": facets.categories(matched), "tools": facets.tools(in_category)},
+        }
+    
+    terms = tuple(dict.fromkeys(_tokenize(query)))
+    return cached_result("search_prompts_faceted", snapshot,
+                         (terms, category or None, max(limit, 0), selected, fuzzy), search)
+
+@mcp.tool()
+def get_prompt_installation_instructions(prompt_id: str) -> Dict[str, Any]:
+    """
+    Get installation instructions for a specific prompt.
+    
+    Args:
+        prompt_id: The ID of the prompt to get installation instructions for
+    
+    Returns:
+        Installation instructions and URLs
+    """
+    record = get_snapshot().get(prompt_id)
+    if record is None:
+        return {"error": f"Prompt '{prompt_id}' not found"}
+    
+    return _installation_instructions(record)
+
+def _installation_instructions(record: PromptRecord) -> Dict[str, Any]:
+    prompt_id = record.id
+    return {
+        "prompt_id": prompt_id,
+        "title": record.title,
+        "description": record.description,
+        "installation": {
+            "vscode": f"https://vscode.dev/redirect?url=vscode%3Achat-prompt%2Finstall%3Furl%3Dhttps%3A%2F%2Fraw.githubusercontent.com%2Fgithub%2Fawesome-copilot%2Fmain%2Fprompts%2F{prompt_id}.prompt.md",
+            "vscode_insiders": f"https://insiders.vscode.dev/redirect?url=vscode-insiders%3Achat-prompt%2Finstall%3Furl%3Dhttps%3A%2F%2Fraw.githubusercontent.com%2Fgithub%2Fawesome-copilot%2Fmain%2Fprompts%2F{prompt_id}.prompt.md",
+            "raw_url": f"https://raw.githubusercontent.com/github/awesome-copilot/main/prompts/{prompt_id}.prompt.md"
+        },
+        "usage_instructions": [
+            f"Use `/{prompt_id}` in VS Code chat",
+            "Run `Chat: Run Prompt` command",
+            "Hit the run button while you have a prompt open"
+        ]
+    }
+
+MAX_BATCH_SIZE = 500
+
+def _batch(prompt_ids: List[str], build: Callable[[RegistrySnapshot, PromptRecord], Dict[str, Any]]) -> Dict[str, Any]:
+    """Look up every id against one snapshot, reporting misses per item."""
+    if len(prompt_ids) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} prompt ids per batch, got {len(prompt_ids)}")
+    snapshot = get_snapshot()
+    results = []
+    missing = []
+    for prompt_id in prompt_ids:
+        record = snapshot.get(prompt_id)
+        if record is None:
+            missing.append(prompt_id)
+            results.append({"id": prompt_id, "error": f"Prompt '{prompt_id}' not found"})
+        else:
+            results.append(build(snapshot, record))
+    return {"version": snapshot.version, "results": results, "missing": missing}
+
+@mcp.tool(offload=True)
+def get_prompt_details_batch(prompt_ids: List[str]) -> Dict[str, Any]:
+    """
+    Get detailed information about several prompts in one call.
+    
+    Args:
+        prompt_ids: IDs of the prompts, at most 500
+    
+    Returns:
+        One result per requested id, in order: the same details as
+        copilot-prompts://prompt/{prompt_id}, or an error for unknown ids
+        (also listed under `missing`)
+    """
+    return _batch(prompt_ids, _prompt_details)
+
+@mcp.tool(offload=True)
+def get_prompt_installation_instructions_batch(prompt_ids: List[str]) -> Dict[str, Any]:
+    """
+    Get installation instructions for several prompts in one call.
+    
+    Args:
+        prompt_ids: IDs of the prompts, at most 500
+    
+    Returns:
+        One result per requested id, in order: the same instructions as
+        get_prompt_installation_instructions, or an error for unknown ids
+        (also listed under `missing`)
+    """
+    return _batch(prompt_ids, lambda snapshot, record: _installation_instructions(record))
+
+@mcp.tool(offload=True)
+def find_similar_prompts(
+    prompt_ids: List[str],
+    limit: int = 5,
+    category: Optional[str] = None,
+    fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Find the prompts most similar to one or more given prompts.
+    
+    Similarity is the cosine between TF-IDF vectors of the prompts' titles,
+    descriptions, categories and tools. All seeds are scored together in
+    one batched pass.
+    
+    Args:
+        prompt_ids: IDs of the prompts to find neighbours for, at most 500
+        limit: Maximum number of similar prompts per seed
+        category: Optional category the similar prompts must belong to
+        fields: Optional fields to include in each similar prompt, e.g. ["id", "score"]
+    
+    Returns:
+        One result per requested id, in order, with its `similar` prompts
+        (most similar first), or an error for unknown ids (also listed
+        under `missing`)
+    """
+    if len(prompt_ids) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} prompt ids per batch, got {len(prompt_ids)}")
+    snapshot = get_snapshot()
+    selected = _select_fields(fields, ("id", "title", "category", "url", "score"), ("score",))
+    index = snapshot.index("similar")
+    allowed = None
+    if category:
+        import numpy as np
+
+        allowed = np.zeros(len(snapshot), dtype=bool)
+        allowed[np.array(snapshot.category_docs.get(category, ()), dtype=np.int64)] = True
+    
+    seeds = [snapshot.positions[prompt_id] for prompt_id in prompt_ids if prompt_id in snapshot]
+    neighbours = iter(index.neighbours(seeds, limit, allowed))
+    results = []
+    missing = []
+    for prompt_id in prompt_ids:
+        if prompt_id not in snapshot:
+            missing.append(prompt_id)
+            results.append({"id": prompt_id, "error": f"Prompt '{prompt_id}' not found"})
+            continue
+        similar = []
+        for doc, score in next(neighbours):
+            extras = {"score": lambda: round(score, 4)}
+            similar.append(_project(snapshot, snapshot.records[doc], selected, extras))
+        results.append({"id": prompt_id, "similar": similar})
+    return {"version": snapshot.version, "results": results, "missing": missing}
+
+@mcp.tool(offload=True)
+def get_prompt_content(prompt_id: str) -> Dict[str, Any]:
+    """
+    Get the full Markdown content of a specific prompt.
+    
+    Bodies are cached on disk and revalidated with the server after the
+    cache TTL; in offline mode only cached bodies are returned.
+    
+    Args:
+        prompt_id: The ID of the prompt to fetch
+    
+    Returns:
+        The prompt content, its source URL, content hash and where it was
+        served from ("cache", "network", "revalidated" or "stale-cache")
+    """
+    if prompt_id not in get_snapshot():
+        return {"error": f"Prompt '{prompt_id}' not found"}
+    
+    return get_content_cache().get(prompt_id)
+
+@mcp.tool(offload=True)
+def search_prompt_bodies(
+    query: str,
+    category: Optional[str] = None,
+    limit: int = 10,
+    fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Search the full Markdown bodies of prompts, not just their titles and descriptions.
+    
+    Finds framework names, APIs and checklist items that only appear in the
+    prompt text. Every word of the query has to occur in a prompt, and
+    results are ranked by BM25. Each result carries the snippet around its
+    best matching line and that snippet's line range, so relevance can be
+    judged without fetching the prompt. Needs a local mirror of
+    awesome-copilot (AWESOME_COPILOT_MIRROR or AWESOME_COPILOT_DIR).
+    
+    Args:
+        query: Words to find in prompt bodies
+        category: Optional category filter
+        limit: Maximum number of results to return
+        fields: Optional fields to include in each result, e.g. ["id", "snippet"]
+    
+    Returns:
+        The registry version, the number of matching prompts and the best
+        `limit` of them, each with `score`, `snippet`, `lines` (first and
+        last line of the snippet, 1-based) and `matched_lines`
+    """
+    snapshot = get_snapshot()
+    selected = _select_fields(
+        fields, ("id", "title", "category", "url", "score", "snippet", "lines", "matched_lines"),
+        ("score", "snippet", "lines", "matched_lines"))
+    try:
+        index = get_body_index()
+    except OSError as e:
+        return {"error": f"Could not index the prompt mirror: {e}"}
+    if index is None:
+        return {"error": "No local mirror configured: set AWESOME_COPILOT_MIRROR or AWESOME_COPILOT_DIR"}
+    
+    def search():
+        allowed = set(snapshot.category_docs.get(category, ())) if category else None
+        matches = {}
+        for body_doc, (score, term_lines) in index.search(query).items():
+            # Mirror files without a registry entry are not returned
+            doc = snapshot.positions.get(index.ids[body_doc])
+            if doc is not None and (allowed is None or doc in allowed):
+                matches[doc] = (score, body_doc, term_lines)
+        best = _top_scores({doc: match[0] for doc, match in matches.items()}, max(limit, 0))
+        
+        results = []
+        wants_snippet = {"snippet", "lines", "matched_lines"} & set(selected)
+        for doc, score in best:
+            _, body_doc, term_lines = matches[doc]
+            snippet = index.snippet(body_doc, term_lines) if wants_snippet else {}
+            extras = {
+                "score": lambda: round(score, 4),
+                "snippet": lambda: snippet["snippet"],
+                "lines": lambda: snippet["lines"],
+                "matched_lines": lambda: snippet["matched_lines"],
+            }
+            results.append(_project(snapshot, snapshot.records[doc], selected, extras))
+        return {"version": snapshot.version, "total": len(matches), "results": results}
+    
+    terms = tuple(dict.fromkeys(_tokenize(query)))
+    return cached_result("search_prompt_bodies", snapshot,
+                         (index.version, terms, category or None, max(limit, 0), selected), search)
+
+@mcp.tool(offload=True)
+def refresh_registry(git: bool = False) -> Dict[str, Any]:
+    """
+    Reload the registry from its source and publish the new version.
+    
+    The source is the local awesome-copilot checkout (AWESOME_COPILOT_DIR),
+    else the compiled snapshot (AWESOME_COPILOT_SNAPSHOT), else the built-in
+    registry. For a checkout, only prompt files whose size, modification
+    time and content changed since the last scan are parsed again. Requests
+    already running finish on the previous version.
+    
+    Args:
+        git: For a checkout that is a git clone, skip the scan and apply only
+            the prompt files changed between the commit of the last sync and
+            HEAD (committed changes only)
+    
+    Returns:
+        The registry version, whether it changed, and scan statistics
+    """
+    try:
+        return reload_registry(git)
+    except (OSError, ValueError) as e:
+        return {"error": f"Could not reload the registry: {e}"}
+
+def configure_profiling(
+    enabled: Optional[bool] = None,
+    sample_rate: Optional[float] = None,
+    slow_ms: Optional[float] = None,
+    handlers: Optional[List[str]] = None,
+    memory: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Turn on-demand profiling of tool and resource calls on or off.
+    
+    Profiled calls are written as cProfile stats, a tracemalloc snapshot and
+    a text summary to a capture directory on the server. Arguments left out
+    keep their current value; call without arguments to see the settings
+    and the newest captures.
+    
+    Args:
+        enabled: Switch profiling on or off
+        sample_rate: Fraction of calls to capture, between 0 and 1
+        slow_ms: Also capture every call slower than this many milliseconds
+            (0 turns this off; while on, every call runs under the profiler)
+        handlers: Only profile these tool names or resource URI templates;
+            an empty list profiles all of them
+        memory: Also take tracemalloc snapshots
+    
+    Returns:
+        The profiling settings, the number of captures written and the
+        names of the newest ones
+    """
+    PROFILER.configure(enabled, sample_rate, slow_ms, handlers, memory)
+    return PROFILER.state()
+
+# Any connected client can call a tool, so this one is for operator
+# deployments only
+if PROFILE_TOOL_ENABLED:
+    mcp.tool()(configure_profiling)
+
+@mcp.tool()
+def revalidate_resource(uri: str, etag: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Check whether a cached copilot-prompts:// resource is still current.
+    
+    Args:
+        uri: Resource URI, e.g. "copilot-prompts://list"
+        etag: ETag of the copy the client holds, if any
+    
+    Returns:
+        The current ETag and registry version, plus the content when it
+        differs from the client's copy
+    """
+    snapshot = get_snapshot()
+    payload = _resource_payload(snapshot, uri)
+    if payload is None:
+        return {"error": f"Resource '{uri}' not found"}
+    
+    result = {
+        "uri": uri,
+        "version": snapshot.version,
+        "etag": payload.etag,
+        "modified": payload.etag != etag
+    }
+    if result["modified"]:
+        result["content"] = payload.text
+    return result
+
+@mcp.tool(offload=True)
+def get_prompts_by_tools(
+    required_tools: List[str],
+    match: str = "all",
+    min_overlap: int = 1,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Find prompts that use specific tools.
+    
+    Args:
+        required_tools: List of tools that the prompts should support
+        match: "all" to require every tool, or "any" to accept prompts using
+            at least `min_overlap` of the tools, ranked by how many they use
+        min_overlap: Minimum number of matching tools in "any" mode
+        limit: Optional number of results per page; by default every match
+            is returned in one page
+        fields: Optional fields to include in each result, e.g. ["id", "matching_tools"]
+        cursor: Cursor from the previous page's `next_cursor`; omit for the first page
+    
+    Returns:
+        The registry version, the number of matching prompts, a page of the
+        prompts that use the specified tools and a `next_cursor` for the
+        following page (null on the last page)
+    """
+    snapshot = get_snapshot()
+    selected = _select_fields(
+        fields,
+        ("id", "title", "description", "category", "tools", "matching_tools", "url"),
+        ("matching_tools",))
+    requested = tuple(dict.fromkeys(required_tools))
+    normalized = (requested, match, min_overlap)
+    query_key = _query_key("get_prompts_by_tools", *normalized)
+    offset = _decode_cursor(snapshot, query_key, cursor)
+    
+    def match_tools():
+        matches = snapshot.index("tools").match(list(requested), match, min_overlap)
+        end = len(matches) if limit is None else offset + max(limit, 1)
+        
+        items = []
+        for doc, _ in matches[offset:end]:
+            record = snapshot.records[doc]
+            extras = {"matching_tools": lambda: [tool for tool in requested if tool in record.tools]}
+            items.append(_project(snapshot, record, selected, extras))
+        return {
+            "version": snapshot.version,
+            "total": len(matches),
+            "items": items,
+            "next_cursor": _encode_cursor(snapshot, query_key, end) if end < len(matches) else None
+        }
+    
+    return cached_result("get_prompts_by_tools", snapshot,
+                         (normalized, offset, limit, selected), match_tools)
+
+QUERY_SORT_ORDERS = ("relevance", "registry", "id", "title")
+
+def _plan_query(snapshot: RegistrySnapshot, query: str, categories: Tuple[str, ...],
+                all_tools: Tuple[str, ...], any_tools: Tuple[str, ...],
+                exclude_tools: Tuple[str, ...]) -> Tuple[Sequence, Optional[Dict[int, float]], List[Dict[str, Any]]]:
+    """Evaluate the filters of a query_prompts call, most selective first.
+
+    Category and tool filters are bitsets: they are intersected smallest
+    first, stopping as soon as nothing is left. The text query then either
+    scans its postings and has its matches checked against the bitset, or,
+    when the filters leave fewer prompts than its rarest term matches,
+    probes its postings for just those prompts. Returns the matching docs
+    in registry order, their text scores (None without a text query) and
+    the steps taken.
+    """
+    facets = snapshot.index("facets")
+    filters = []
+    if categories:
+        bits = 0
+        for category in categories:
+            bits |= facets.category_bits.get(category, 0)
+        filters.append((f"categories={','.join(categories)}", bits))
+    for tool in all_tools:
+        filters.append((f"tool={tool}", facets.tool_bits.get(tool, 0)))
+    if any_tools:
+        bits = 0
+        for tool in any_tools:
+            bits |= facets.tool_bits.get(tool, 0)
+        filters.append((f"any_tools={','.join(any_tools)}", bits))
+    if exclude_tools:
+        bits = 0
+        for tool in exclude_tools:
+            bits |= facets.tool_bits.get(tool, 0)
+        filters.append((f"exclude_tools={','.join(exclude_tools)}", facets.all_docs & ~bits))
+
+    plan = []
+    candidates = None
+    for name, bits in sorted(filters, key=lambda item: item[1].bit_count()):
+        candidates = bits if candidates is None else candidates & bits
+        plan.append({"step": name, "matches": candidates.bit_count()})
+        if not candidates:
+            return [], None, plan
+
+    index = snapshot.index("search")
+    estimate = index.estimate(query)
+    if estimate is None:
+        docs = range(len(snapshot)) if candidates is None else list(_iter_bits(candidates))
+        return docs, None, plan
+    if candidates is not None and plan[-1]["matches"] <= estimate:
+        strategy = "probe"
+        scores = index.scores(query, set(_iter_bits(candidates)))
+    else:
+        strategy = "scan"
+        scores = index.scores(query)
+        if candidates is not None:
+            mask = candidates.to_bytes((len(snapshot) + 7) // 8, "little")
+            scores = {doc: score for doc, score in scores.items() if mask[doc >> 3] >> (doc & 7) & 1}
+    plan.append({"step": f"text={' '.join(dict.fromkeys(_tokenize(query)))}", "strategy": strategy,
+                 "matches": len(scores)})
+    return sorted(scores), scores, plan
+
+@mcp.tool(offload=True)
+def query_prompts(
+    query: str = "",
+    categories: Optional[List[str]] = None,
+    all_tools: Optional[List[str]] = None,
+    any_tools: Optional[List[str]] = None,
+    exclude_tools: Optional[List[str]] = None,
+    sort: str = "relevance",
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Find prompts matching a text query and category and tool filters in one call.
+    
+    The filters are planned together: the most selective one is evaluated
+    first and the others only narrow its matches, so combining them costs
+    less than running search_prompts and get_prompts_by_tools separately.
+    Every filter given has to match.
+    
+    Args:
+        query: Optional text query; every word has to match, as in search_prompts
+        categories: Optional categories, any of which a prompt may be in
+        all_tools: Optional tools a prompt has to use, all of them
+        any_tools: Optional tools a prompt has to use at least one of
+        exclude_tools: Optional tools a prompt must not use
+        sort: "relevance" (text score, then registry order), "registry", "id" or "title"
+        limit: Number of prompts per page (at most 500)
+        cursor: Cursor from the previous page's `next_cursor`; omit for the first page
+        fields: Optional fields to include for each prompt, e.g. ["id", "title", "score"]
+    
+    Returns:
+        The registry version, the total number of matches, the page of
+        prompts, a `next_cursor` for the following page (null on the last
+        page) and the `plan`: the filters in the order they were evaluated,
+        with the number of prompts left after each
+    """
+    if sort not in QUERY_SORT_ORDERS:
+        raise ValueError(f"Unknown sort order '{sort}', expected one of {QUERY_SORT_ORDERS}")
+    snapshot = get_snapshot()
+    selected = _select_fields(
+        fields, ("id", "title", "description", "category", "tools", "url", "score"), ("score",))
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    terms = tuple(dict.fromkeys(_tokenize(query)))
+    filters = tuple(tuple(sorted(set(values or ()))) for values in
+                    (categories, all_tools, any_tools, exclude_tools))
+    # The short hash only binds cursors to their query; results are cached
+    # under the normalised query itself, which cannot collide
+    normalized = (terms, *filters, sort)
+    query_key = _query_key("query_prompts", *normalized)
+    offset = _decode_cursor(snapshot, query_key, cursor)
+    
+    def run():
+        docs, scores, plan = _plan_query(snapshot, query, *filters)
+        end = offset + limit
+        if sort == "relevance" and scores is not None:
+            page = [doc for doc, _ in _top_scores(scores, end)[offset:]]
+        elif sort == "id":
+            page = heapq.nsmallest(end, docs, key=lambda doc: snapshot.ids[doc])[offset:]
+        elif sort == "title":
+            page = heapq.nsmallest(end, docs, key=lambda doc: (snapshot.records[doc].title.lower(), doc))[offset:]
+        else:
+            page = docs[offset:end]
+        
+        items = []
+        for doc in page:
+            extras = {"score": lambda: round(scores[doc], 4) if scores is not None else 0.0}
+            items.append(_project(snapshot, snapshot.records[doc], selected, extras))
+        return {
+            "version": snapshot.version,
+            "total": len(docs),
+            "items": items,
+            "next_cursor": _encode_cursor(snapshot, query_key, end) if end < len(docs) else None,
+            "plan": plan,
+        }
+    
+    return cached_result("query_prompts", snapshot, (normalized, offset, limit, selected), run)
+
+@mcp.tool()
+def list_prompts(
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    List prompts one page at a time, optionally within a category.
+    
+    Args:
+        category: Optional category to list
+        cursor: Cursor from the previous page's `next_cursor`; omit for the first page
+        page_size: Number of prompts per page (at most 500)
+        fields: Optional fields to include for each prompt, e.g. ["id", "title"]
+    
+    Returns:
+        The page of prompts, the total count, the registry version and a
+        `next_cursor` for the following page (null on the last page)
+    """
+    snapshot = get_snapshot()
+    selected = _select_fields(fields, ("id", "title", "description", "category", "url"))
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    query_key = _query_key("list_prompts", category)
+    offset = _decode_cursor(snapshot, query_key, cursor)
+    
+    if category:
+        docs = snapshot.category_docs.get(category, array("I"))
+    else:
+        docs = range(len(snapshot))
+    page = docs[offset:offset + page_size]
+    end = offset + len(page)
+    
+    return {
+        "version": snapshot.version,
+        "total": len(docs),
+        "items": [_project(snapshot, snapshot.records[doc], selected) for doc in page],
+        "next_cursor": _encode_cursor(snapshot, query_key, end) if end < len(docs) else None
+    }
+
+@mcp.tool(offload=True)
+def generate_prompt_usage_guide(category: Optional[str] = None, max_chars: Optional[int] = None) -> str:
+    """
+    Generate a comprehensive usage guide for prompts.
+    
+    Args:
+        category: Optional category to filter prompts
+        max_chars: Optional size budget; the guide is cut at a prompt
+            boundary and ends with a note when it would exceed it. It must
+            leave room for the guide header and that note.
+    
+    Returns:
+        Markdown formatted usage guide
+    """
+    snapshot = get_snapshot()
+    return cached_result("generate_prompt_usage_guide", snapshot, (category, max_chars),
+                         lambda: _render_usage_guide(snapshot, category, max_chars))
+
+def _render_usage_guide(snapshot: RegistrySnapshot, category: Optional[str],
+                        max_chars: Optional[int]) -> str:
+    guide = snapshot.index("guide")
+    rendered = guide.render(category)
+    if max_chars is None or len(rendered) <= max_chars:
+        return rendered
+    
+    units = guide.units(category)
+    note = f"_Guide truncated to {max_chars} characters. Use get_prompt_usage_guide_chunks to read the rest._"
+    budget = max_chars - len(note) - 1
+    if len(units[0]) > budget:
+        raise ValueError(f"max_chars must be at least {len(units[0]) + len(note) + 1} "
+                         f"to fit the guide header and truncation note")
+    kept = [units[0]]
+    size = len(units[0])
+    for unit in units[1:]:
+        size += len(unit) + 1
+        if size > budget:
+            # Don't end on a category heading without any of its prompts
+            if kept[-1].startswith("## ") and len(kept) > 1:
+                kept.pop()
+            kept.append(note)
+            break
+        kept.append(unit)
+    return "\n".join(kept)
+
+@mcp.tool(offload=True)
+def get_prompt_usage_guide_chunks(
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    max_chars: int = 20000
+) -> Dict[str, Any]:
+    """
+    Read the usage guide in chunks of at most `max_chars` characters.
+    
+    Chunks break between categories or prompts, so concatenating every chunk
+    with a newline reproduces generate_prompt_usage_guide.
+    
+    Args:
+        category: Optional category to filter prompts
+        cursor: Cursor from the previous chunk's `next_cursor`; omit for the first chunk
+        max_chars: Size budget for a chunk (a single oversized prompt entry is
+            still returned whole)
+    
+    Returns:
+        The Markdown chunk, the registry version and a `next_cursor` (null on
+        the last chunk)
+    """
+    snapshot = get_snapshot()
+    units = snapshot.index("guide").units(category)
+    query_key = _query_key("guide", category, max_chars)
+    start = _decode_cursor(snapshot, query_key, cursor)
+    
+    end = start
+    size = -1
+    while end < len(units) and (end == start or size + len(units[end]) + 1 <= max_chars):
+        size += len(units[end]) + 1
+        end += 1
+    
+    return {
+        "version": snapshot.version,
+        "chunk": "\n".join(units[start:end]),
+        "next_cursor": _encode_cursor(snapshot, query_key, end) if end < len(units) else None
+    }
+
+# An async handler, so it is offloaded here rather than with offload=True
+_workspace_limiter = OFFLOAD_LIMITERS.setdefault("recommend_prompts_for_workspace", ToolLimiter(TOOL_CONCURRENCY))
+
+@mcp.tool()
+async def recommend_prompts_for_workspace(
+    path: str,
+    limit: int = 10,
+    max_files: int = WORKSPACE_MAX_FILES,
+    fields: Optional[List[str]] = None,
+    ctx: Optional[Context] = None
+) -> Dict[str, Any]:
+    """
+    Recommend prompts for the project in a local directory, in one call.
+    
+    Scans the directory (skipping what .gitignore ignores), fingerprints its
+    stack from manifests and file types (.csproj, pom.xml, package.json,
+    Dockerfile, *.bicep, ...) and ranks the prompts matching that stack.
+    Large repositories are scanned for at most half a second; the result then
+    covers the part scanned and has `partial` set. Clients that send a
+    progress token receive the stacks and top prompts found so far as
+    progress notifications.
+    
+    Args:
+        path: Directory to scan, on the machine running this server (under
+            AWESOME_COPILOT_WORKSPACE_ROOTS when the server sets it)
+        limit: Maximum number of prompts to return
+        max_files: Stop scanning after this many files
+        fields: Optional fields to include in each result, e.g. ["id", "stacks"]
+    
+    Returns:
+        The scan summary (files and directories scanned, elapsed time,
+        whether it was partial), the evidence count per detected stack and
+        the recommended prompts, best first, with the stacks each one matched
+    """
+    snapshot = get_snapshot()
+    selected = _select_fields(
+        fields, ("id", "title", "category", "url", "install_url", "score", "stacks"), ("score", "stacks"))
+    
+    def report(state):
+        ranked = rank_for_stacks(snapshot, state["stacks"], 3)
+        message = (f"{state['files_scanned']} files: {', '.join(list(state['stacks'])[:5]) or 'no stack yet'}"
+                   f" -> {', '.join(snapshot.records[doc].id for doc, _, _ in ranked) or 'no prompts yet'}")
+        anyio.from_thread.run(ctx.report_progress, state["files_scanned"], max_files, message)
+    
+    root = _allowed_workspace(path)
+    
+    def recommend():
+        result = scan_workspace(root, max_files, on_progress=report if ctx is not None else None)
+        items = []
+        for doc, score, stacks in rank_for_stacks(snapshot, result["stacks"], max(limit, 0)):
+            extras = {"score": lambda: round(score, 4), "stacks": lambda: stacks}
+            items.append(_project(snapshot, snapshot.records[doc], selected, extras))
+        return {"version": snapshot.version, **result, "results": items}
+    
+    # Always on a worker thread, since progress is reported back to the loop
+    return await _workspace_limiter.run(recommend)
+
+# Prompts for common workflows
+@mcp.prompt(title="Find Development Prompts")
+def find_development_prompts(language: str = "any", framework: str = "any") -> str:
+    """Find development-related prompts for specific languages or frameworks."""
+    return f"""Find GitHub Copilot prompts suitable for {language} development with {framework} framework.
+
+If the project is in a local directory, call the recommend_prompts_for_workspace tool with its path first.
+Otherwise use the search_prompts tool to find relevant prompts in the "development", "best-practices", and "testing" categories.
+
+Consider prompts that might help with:
+- Project scaffolding and setup
+- Best practices and code quality
+- Testing frameworks and patterns
+- Documentation generation
+- Code review and refactoring
+
+Provide installation instructions and usage examples for the most relevant prompts."""
+
+@mcp.prompt(title="Setup GitHub Workflow Prompts")
+def setup_github_workflow_prompts() -> str:
+    """Find prompts for GitHub workflow automation and project management."""
+    return """Find GitHub Copilot prompts that help with GitHub workflows and project management.
+
+Search for prompts in the "github" and "project-management" categories that can help with:
+- Creating and managing GitHub issues
+- Pull request workflows
+- Implementation planning
+- Specification documentation
+- Project organization
+
+Provide a curated list with installation instructions and explain how these prompts can streamline GitHub workflows."""
+
+@mcp.prompt(title="Documentation Prompts Setup")
+def documentation_prompts_setup() -> str:
+    """Find and recommend documentation-related prompts."""
+    return """Find GitHub Copilot prompts that help with documentation tasks.
+
+Search for prompts in the "documentation" category and recommend the best ones for:
+- API documentation
+- Code documentation
+- Project specifications
+- Architectural decisions
+- Component documentation
+- README and guide generation
+
+Provide installation instructions and examples of when to use each prompt type."""
+
+# Serving over streamable HTTP
+#
+# `serve` runs the server over streamable HTTP with uvicorn. With more than
+# one worker, uvicorn's supervisor forks worker processes that share one
+# listening socket. SIGHUP replaces the workers one at a time, each new one
+# taking over before the old one is retired, so reloading the registry (for
+# example after `compile`) drops no requests. Workers share no session
+# state, so multi-worker mode is stateless: every request stands alone and
+# may be served by any worker.
+#
+# Workers are started by importing this module, so their settings are
+# passed through environment variables read by create_http_app().
+HTTP_HOST = os.environ.get("AWESOME_COPILOT_HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("AWESOME_COPILOT_HTTP_PORT", "8000"))
+HTTP_WORKERS = int(os.environ.get("AWESOME_COPILOT_HTTP_WORKERS", "1"))
+# Longer than the idle timeout of common load balancers (60 s), so the
+# server is not the side closing pooled connections under them
+HTTP_KEEP_ALIVE_SECONDS = 75
+HTTP_GRACEFUL_SHUTDOWN_SECONDS = 30
+# Set in HTTP worker processes, where clients are not on this machine
+_serving_http = False
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return default if value is None else value.lower() in ("1", "true", "yes")
+
+def _http_transport_security(host: str):
+    """DNS rebinding protection for a server bound to `host`.
+
+    Host and Origin headers are checked against
+    AWESOME_COPILOT_HTTP_ALLOWED_HOSTS when it is set, otherwise against the
+    bind address and the loopback names. A server bound to every interface
+    has no address to derive them from, so it needs the list.
+    """
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    allowed_hosts = [name.strip() for name in os.environ.get("AWESOME_COPILOT_HTTP_ALLOWED_HOSTS", "").split(",")
+                     if name.strip()]
+    if not allowed_hosts:
+        if host in ("", "0.0.0.0", "::"):
+            raise ValueError(
+                f"Serving on {host or 'every interface'} requires AWESOME_COPILOT_HTTP_ALLOWED_HOSTS, "
+                f"the host names clients connect to (for example prompts.example.com:8000)")
+        names = ["127.0.0.1", "localhost", "[::1]"]
+        if host not in ("127.0.0.1", "localhost", "::1"):
+            names.append(f"[{host}]" if ":" in host else host)
+        allowed_hosts = names + [f"{name}:*" for name in names]
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True, allowed_hosts=allowed_hosts,
+        allowed_origins=[f"{scheme}://{name}" for name in allowed_hosts for scheme in ("http", "https")])
+
+def create_http_app():
+    """Return the streamable HTTP ASGI app, configured from the environment.
+
+    This is the uvicorn app factory for worker processes:
+    `uvicorn awesome_copilot_mcp_server:create_http_app --factory`.
+    """
+    global _serving_http
+    _serving_http = True
+    host = os.environ.get("AWESOME_COPILOT_HTTP_HOST", HTTP_HOST)
+    mcp.settings.host = host
+    mcp.settings.port = int(os.environ.get("AWESOME_COPILOT_HTTP_PORT", HTTP_PORT))
+    mcp.settings.stateless_http = _env_flag("AWESOME_COPILOT_HTTP_STATELESS", True)
+    mcp.settings.json_response = _env_flag("AWESOME_COPILOT_HTTP_JSON_RESPONSE", False)
+    mcp.settings.transport_security = _http_transport_security(host)
+    install_reload_triggers()
+    install_profiling_signal()
+    return mcp.streamable_http_app()
+
+def serve_http(host: str = HTTP_HOST, port: int = HTTP_PORT, workers: int = HTTP_WORKERS,
+               keep_alive: int = HTTP_KEEP_ALIVE_SECONDS,
+               graceful_timeout: int = HTTP_GRACEFUL_SHUTDOWN_SECONDS,
+               limit_concurrency: Optional[int] = None, stateless: bool = True,
+               json_response: bool = False) -> None:
+    """Serve over streamable HTTP with `workers` processes on one socket."""
+    if workers < 1:
+        raise ValueError("At least one worker is required")
+    if workers > 1 and not stateless:
+        raise ValueError("Stateful sessions cannot be shared between workers; use one worker")
+    _http_transport_security(host)
+    os.environ.update({
+        "AWESOME_COPILOT_HTTP_HOST": host,
+        "AWESOME_COPILOT_HTTP_PORT": str(port),
+        "AWESOME_COPILOT_HTTP_STATELESS": "1" if stateless else "0",
+        "AWESOME_COPILOT_HTTP_JSON_RESPONSE": "1" if json_response else "0",
+    })
+    options = [
+        "--host", host, "--port", str(port),
+        "--timeout-keep-alive", str(keep_alive),
+        "--timeout-graceful-shutdown", str(graceful_timeout),
+        "--log-level", "warning",
+    ]
+    if limit_concurrency:
+        options += ["--limit-concurrency", str(limit_concurrency)]
+
+    if workers == 1:
+        import uvicorn
+
+        uvicorn.run(create_http_app(), host=host, port=port, timeout_keep_alive=keep_alive,
+                    timeout_graceful_shutdown=graceful_timeout, limit_concurrency=limit_concurrency,
+                    log_level="warning")
+        return
+    # Hand over to the uvicorn CLI so each worker imports this module once,
+    # rather than once as the spawned __main__ and again for the app factory
+    app_dir, filename = os.path.split(os.path.abspath(__file__))
+    module = os.path.splitext(filename)[0]
+    os.execv(sys.executable, [
+        sys.executable, "-m", "uvicorn", f"{module}:create_http_app", "--factory",
+        "--app-dir", app_dir, "--workers", str(workers), *options,
+    ])
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the server over stdio or HTTP, sync a checkout or compile a registry snapshot."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Awesome GitHub Copilot MCP Server")
+    commands = parser.add_subparsers(dest="command")
+    compile_parser = commands.add_parser(
+        "compile", help="write the registry and its indexes to a binary snapshot")
+    compile_parser.add_argument(
+        "--output", default=os.environ.get("AWESOME_COPILOT_SNAPSHOT") or "awesome-copilot.snapshot",
+        help="snapshot path (default: $AWESOME_COPILOT_SNAPSHOT or ./awesome-copilot.snapshot)")
+    compile_parser.add_argument(
+        "--checkout", default=os.environ.get("AWESOME_COPILOT_DIR"),
+        help="awesome-copilot checkout to read prompts from (default: $AWESOME_COPILOT_DIR, "
+             "or the built-in registry)")
+    compile_parser.add_argument(
+        "--manifest", default=os.environ.get("AWESOME_COPILOT_MANIFEST"),
+        help="manifest of the checkout's files (default: $AWESOME_COPILOT_MANIFEST, "
+             "or one per checkout in the cache directory)")
+    sync_parser = commands.add_parser(
+        "sync", help="apply the prompt files changed in a git checkout since the last sync")
+    sync_parser.add_argument(
+        "--checkout", default=os.environ.get("AWESOME_COPILOT_DIR"),
+        help="awesome-copilot git clone (default: $AWESOME_COPILOT_DIR)")
+    sync_parser.add_argument(
+        "--manifest", default=os.environ.get("AWESOME_COPILOT_MANIFEST"),
+        help="manifest recording the last synced commit (default: $AWESOME_COPILOT_MANIFEST, "
+             "or one per checkout in the cache directory)")
+    sync_parser.add_argument(
+        "--output", default=None, help="also compile the synced registry into this snapshot")
+    sync_parser.add_argument(
+        "--max-changes", type=int, default=GIT_SYNC_MAX_CHANGES,
+        help="rescan the whole checkout when more files than this changed")
+    serve_parser = commands.add_parser(
+        "serve", help="serve over streamable HTTP with one or more worker processes")
+    serve_parser.add_argument("--host", default=HTTP_HOST)
+    serve_parser.add_argument("--port", type=int, default=HTTP_PORT)
+    serve_parser.add_argument("--workers", type=int, default=HTTP_WORKERS,
+                              help="worker processes sharing the listening socket")
+    serve_parser.add_argument("--keep-alive", type=int, default=HTTP_KEEP_ALIVE_SECONDS,
+                              help="seconds an idle connection is kept open")
+    serve_parser.add_argument("--graceful-timeout", type=int, default=HTTP_GRACEFUL_SHUTDOWN_SECONDS,
+                              help="seconds a stopping worker waits for in-flight requests")
+    serve_parser.add_argument("--limit-concurrency", type=int, default=None,
+                              help="per-worker connection limit before answering 503")
+    serve_parser.add_argument("--stateful", action="store_true",
+                              help="keep MCP sessions on the server (single worker only)")
+    serve_parser.add_argument("--json-response", action="store_true",
+                              help="answer with JSON bodies instead of SSE streams")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            serve_http(args.host, args.port, args.workers, args.keep_alive, args.graceful_timeout,
+                       args.limit_concurrency, not args.stateful, args.json_response)
+        except ValueError as e:
+            parser.error(str(e))
+        return 0
+
+    if args.command == "sync":
+        if not args.checkout:
+            parser.error("sync needs --checkout or AWESOME_COPILOT_DIR")
+        start = time.perf_counter()
+        try:
+            registry, stats = PromptCheckoutLoader(args.checkout, args.manifest).sync(args.max_changes)
+        except OSError as e:
+            parser.error(str(e))
+        how = "read in full" if stats["full_rebuild"] else (
+            f"{stats['added']} added, {stats['modified']} modified, {stats['renamed']} renamed, "
+            f"{stats['removed']} removed")
+        print(f"Synced {len(registry)} prompts to {stats['commit'][:12]} from "
+              f"{(stats['previous_commit'] or 'nothing')[:12]} ({how}) in "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+        if args.output:
+            result = compile_snapshot(RegistrySnapshot(registry), args.output)
+            print(f"Compiled version {result['version']} into {args.output} ({result['bytes']} bytes)")
+        return 0
+
+    if args.command == "compile":
+        registry = PROMPTS_REGISTRY
+        if args.checkout:
+            registry = PromptCheckoutLoader(args.checkout, args.manifest).refresh()[0]
+        result = compile_snapshot(RegistrySnapshot(registry), args.output)
+        print(f"Compiled {result['prompt_count']} prompts (version {result['version']}, "
+              f"indexes: {', '.join(result['indexes'])}) into {args.output} ({result['bytes']} bytes)")
+        return 0
+
+    install_reload_triggers()
+    install_profiling_signal()
+    mcp.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
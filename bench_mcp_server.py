@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the Awesome Copilot MCP Server
+
+Generates synthetic prompt registries of increasing size, with category,
+tool and vocabulary distributions modelled on the built-in registry, and
+measures latency, throughput and peak memory of every tool and
+copilot-prompts:// resource, both called in-process and through an
+in-memory MCP client session.
+
+Results are written as JSON. A baseline file stores per-benchmark p50
+latencies with a regression threshold; --check compares a run against it.
+
+--startup measures cold start instead: the time from spawning the server
+over stdio to its first tool response, with the built-in registry and with
+compiled snapshots of each size.
+
+--concurrency N runs N in-memory MCP client sessions at once against a
+mixed workload, first with slow tools offloaded to worker threads and then
+with everything on the event loop, and reports per-tool p50/p99 latency and
+how long the event loop was blocked.
+
+Usage:
+    python bench_mcp_server.py --sizes 100,1000,10000
+    python bench_mcp_server.py --sizes 100,1000 --update-baseline
+    python bench_mcp_server.py --sizes 100,1000 --check
+    python bench_mcp_server.py --startup --sizes 1000,100000
+    python bench_mcp_server.py --concurrency 200 --sizes 10000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.memory import create_connected_server_and_client_session
+
+import awesome_copilot_mcp_server as server
+
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_ITERATIONS = 50
+DEFAULT_BASELINE = "bench_baseline.json"
+DEFAULT_THRESHOLD = 0.5
+
+def generate_registry(size: int, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """Generate a synthetic registry shaped like the built-in one.
+
+    Categories and tool lists are drawn with the frequencies they have in
+    PROMPTS_REGISTRY, and titles and descriptions use its vocabulary with a
+    Zipf-like word distribution.
+    """
+    rng = random.Random(seed)
+    builtin = list(server.PROMPTS_REGISTRY.values())
+    categories = Counter(meta["category"] for meta in builtin)
+    tool_lists = [meta["tools"] for meta in builtin]
+    words = Counter(
+        word for meta in builtin
+        for word in re.findall(r"[A-Za-z][A-Za-z0-9#.+]*", f"{meta['title']} {meta['description']}")
+    )
+    vocabulary = [word for word, _ in words.most_common()]
+    word_weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    category_names = list(categories)
+    category_weights = [categories[name] for name in category_names]
+
+    registry = {}
+    for index in range(size):
+        title_words = rng.choices(vocabulary, word_weights, k=rng.randint(2, 6))
+        description_words = rng.choices(vocabulary, word_weights, k=rng.randint(8, 30))
+        prompt_id = "-".join(word.lower() for word in title_words[:3]) + f"-{index}"
+        registry[prompt_id] = {
+            "title": " ".join(word.capitalize() for word in title_words),
+            "description": " ".join(description_words).capitalize(),
+            "category": rng.choices(category_names, category_weights)[0],
+            "tools": list(rng.choice(tool_lists)),
+        }
+    return registry
+
+def _workloads(registry: Dict[str, Dict[str, Any]], seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """Argument sets for each benchmark, derived from the registry contents."""
+    rng = random.Random(seed)
+    entries = list(registry.items())
+    tools = sorted({tool for meta in registry.values() for tool in meta["tools"]})
+    categories = sorted({meta["category"] for meta in registry.values()})
+
+    def query():
+        title = rng.choice(entries)[1]["title"].split()
+        return " ".join(rng.sample(title, min(len(title), rng.randint(1, 2)))).lower()
+
+    return {
+        "search_prompts": [{"query": query()} for _ in range(32)],
+        "get_prompts_by_tools[all]": [
+            {"required_tools": rng.sample(tools, rng.randint(1, 3))} for _ in range(32)
+        ],
+        "get_prompts_by_tools[any]": [
+            {"required_tools": rng.sample(tools, min(len(tools), rng.randint(5, 20))),
+             "match": "any", "min_overlap": 2}
+            for _ in range(32)
+        ],
+        "find_similar_prompts": [{"prompt_ids": [rng.choice(entries)[0]]} for _ in range(32)],
+        "find_similar_prompts[batch]": [
+            {"prompt_ids": [rng.choice(entries)[0] for _ in range(16)]} for _ in range(8)
+        ],
+        "generate_prompt_usage_guide": [{}],
+        "generate_prompt_usage_guide[category]": [{"category": name} for name in categories],
+        "resource:list": [{"uri": "copilot-prompts://list"}],
+        "resource:categories": [{"uri": "copilot-prompts://categories"}],
+        "resource:category": [{"uri": f"copilot-prompts://{name}"} for name in categories],
+        "resource:prompt": [
+            {"uri": f"copilot-prompts://prompt/{rng.choice(entries)[0]}"} for _ in range(32)
+        ],
+    }
+
+def _in_process_call(name: str, args: Dict[str, Any]) -> Any:
+    if name.startswith("resource:"):
+        path = args["uri"][len("copilot-prompts://"):]
+        if path == "list":
+            return server.list_all_prompts()
+        if path == "categories":
+            return server.list_prompt_categories()
+        if path.startswith("prompt/"):
+            return server.get_prompt_details(path[len("prompt/"):])
+        return server.get_prompts_by_category(path)
+    tool = getattr(server, name.split("[")[0])
+    return tool(**args)
+
+def _response_size(result: Any) -> int:
+    if isinstance(result, str):
+        return len(result.encode("utf-8"))
+    return len(json.dumps(result).encode("utf-8"))
+
+def _summarize(latencies: List[float], sizes: List[int], cold: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    total = sum(latencies)
+    return {
+        "calls": len(latencies),
+        "cold_ms": round(cold * 1000, 4),
+        "p50_ms": round(percentile(0.50) * 1000, 4),
+        "p95_ms": round(percentile(0.95) * 1000, 4),
+        "p99_ms": round(percentile(0.99) * 1000, 4),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 4),
+        "throughput_per_s": round(len(latencies) / total, 1) if total else None,
+        "response_bytes": round(statistics.fmean(sizes)),
+    }
+
+def bench_in_process(workloads: Dict[str, List[Dict[str, Any]]], iterations: int) -> Dict[str, Any]:
+    """Call each tool and resource function directly."""
+    results = {}
+    for name, arg_sets in workloads.items():
+        start = time.perf_counter()
+        _in_process_call(name, arg_sets[0])
+        cold = time.perf_counter() - start
+
+        latencies, sizes = [], []
+        for i in range(iterations):
+            args = arg_sets[i % len(arg_sets)]
+            start = time.perf_counter()
+            result = _in_process_call(name, args)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(_response_size(result))
+
+        tracemalloc.start()
+        for args in arg_sets[:8]:
+            _in_process_call(name, args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = {**_summarize(latencies, sizes, cold), "peak_kib": round(peak / 1024, 1)}
+    return results
+
+async def bench_session(workloads: Dict[str, List[Dict[str, Any]]], iterations: int) -> Dict[str, Any]:
+    """Call each tool and resource through an in-memory MCP client session."""
+    results = {}
+    async with create_connected_server_and_client_session(server.mcp._mcp_server) as client:
+        async def call(name, args):
+            if name.startswith("resource:"):
+                result = await client.read_resource(args["uri"])
+                return result.contents[0].text
+            result = await client.call_tool(name.split("[")[0], args)
+            return "".join(block.text for block in result.content)
+
+        for name, arg_sets in workloads.items():
+            start = time.perf_counter()
+            await call(name, arg_sets[0])
+            cold = time.perf_counter() - start
+
+            latencies, sizes = [], []
+            for i in range(iterations):
+                args = arg_sets[i % len(arg_sets)]
+                start = time.perf_counter()
+                result = await call(name, args)
+                latencies.append(time.perf_counter() - start)
+                sizes.append(_response_size(result))
+            results[name] = _summarize(latencies, sizes, cold)
+    return results
+
+def run_benchmarks(sizes: List[int], iterations: int = DEFAULT_ITERATIONS,
+                   session: bool = True, seed: int = 0) -> Dict[str, Any]:
+    """Run every benchmark against synthetic registries of the given sizes."""
+    original = server.get_snapshot()
+    report = {"python": sys.version.split()[0], "iterations": iterations, "sizes": {}}
+    try:
+        for size in sizes:
+            registry = generate_registry(size, seed)
+            workloads = _workloads(registry, seed)
+
+            start = time.perf_counter()
+            snapshot = server.RegistrySnapshot(registry)
+            for name in ("search", "tools", "guide"):
+                snapshot.index(name)
+            build_seconds = time.perf_counter() - start
+
+            tracemalloc.start()
+            peak_snapshot = server.RegistrySnapshot(registry)
+            for name in ("search", "tools", "guide"):
+                peak_snapshot.index(name)
+            build_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del registry, snapshot, peak_snapshot
+
+            # Start from a fresh snapshot so cold timings include index builds
+            server.publish_snapshot(server.RegistrySnapshot(generate_registry(size, seed)))
+            entry = {
+                "build_ms": round(build_seconds * 1000, 2),
+                "build_peak_kib": round(build_peak / 1024, 1),
+                "in_process": bench_in_process(workloads, iterations),
+            }
+            if session:
+                entry["session"] = asyncio.run(bench_session(workloads, iterations))
+            report["sizes"][str(size)] = entry
+    finally:
+        server.publish_snapshot(original)
+    return report
+
+async def _spawn_and_query(env: Dict[str, str]) -> Dict[str, float]:
+    """Start the server over stdio and time its first responses."""
+    params = StdioServerParameters(command=sys.executable, args=[server.__file__], env=env)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as errlog:
+        async with stdio_client(params, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as client:
+                await client.initialize()
+                initialized = time.perf_counter()
+                await client.call_tool("search_prompts", {"query": "test", "limit": 5})
+                responded = time.perf_counter()
+    return {"initialize_ms": (initialized - start) * 1000, "first_tool_ms": (responded - start) * 1000}
+
+def bench_startup(sizes: List[int], runs: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """Time process spawn to first tool response, with and without a compiled snapshot."""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("AWESOME_COPILOT_")}
+    env["AWESOME_COPILOT_METRICS_PATH"] = ""
+
+    def measure(case_env):
+        timings = [asyncio.run(_spawn_and_query(case_env)) for _ in range(runs)]
+        return {key: round(statistics.median(t[key] for t in timings), 1) for key in timings[0]}
+
+    # The interpreter plus the MCP SDK imports are a floor no registry work can beat
+    floor = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import mcp.server.fastmcp"], env=env, check=True)
+        floor.append((time.perf_counter() - start) * 1000)
+
+    report = {"runs": runs, "import_floor_ms": round(statistics.median(floor), 1),
+              "builtin": measure(env), "snapshots": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            registry = generate_registry(size, seed)
+            start = time.perf_counter()
+            snapshot = server.RegistrySnapshot(registry)
+            build_seconds = time.perf_counter() - start
+            del registry
+            path = os.path.join(directory, f"registry-{size}.snapshot")
+            compiled = server.compile_snapshot(snapshot, path)
+            del snapshot
+
+            start = time.perf_counter()
+            server.load_snapshot(path)
+            load_seconds = time.perf_counter() - start
+            report["snapshots"][str(size)] = {
+                "bytes": compiled["bytes"],
+                "registry_build_ms": round(build_seconds * 1000, 1),
+                "snapshot_load_ms": round(load_seconds * 1000, 1),
+                **measure({**env, "AWESOME_COPILOT_SNAPSHOT": path}),
+            }
+    return report
+
+def _print_startup(report: Dict[str, Any]) -> None:
+    print(f"\n🥶 Cold start (median of {report['runs']} runs, import floor {report['import_floor_ms']} ms)")
+    builtin = report["builtin"]
+    print(f"    {'built-in registry':24} initialize {builtin['initialize_ms']:>8.1f} ms"
+          f"  first tool {builtin['first_tool_ms']:>8.1f} ms")
+    for size, entry in report["snapshots"].items():
+        print(f"    {size + ' prompt snapshot':24} initialize {entry['initialize_ms']:>8.1f} ms"
+              f"  first tool {entry['first_tool_ms']:>8.1f} ms"
+              f"  (load {entry['snapshot_load_ms']} ms vs build {entry['registry_build_ms']} ms,"
+              f" {entry['bytes']} B)")
+
+LOOP_PROBE_INTERVAL = 0.005
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50_ms": round(values[len(values) // 2] * 1000, 3),
+        "p99_ms": round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+async def _concurrent_sessions(calls: List[tuple], sessions: int, calls_per_session: int) -> Dict[str, Any]:
+    """Run `sessions` client sessions concurrently while probing event loop lag."""
+    latencies: Dict[str, List[float]] = {}
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(LOOP_PROBE_INTERVAL)
+            lags.append(max(0.0, time.perf_counter() - start - LOOP_PROBE_INTERVAL))
+
+    async def client_session(offset):
+        async with create_connected_server_and_client_session(server.mcp._mcp_server) as client:
+            for i in range(calls_per_session):
+                name, args = calls[(offset + i) % len(calls)]
+                start = time.perf_counter()
+                await client.call_tool(name.split("[")[0], args)
+                latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(client_session(i * 7) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "duration_s": round(elapsed, 2),
+        "calls_per_s": round(total / elapsed, 1),
+        "loop_lag": _percentiles(lags or [0.0]),
+        "tools": {name: _percentiles(values) for name, values in sorted(latencies.items())},
+    }
+
+def bench_concurrency(size: int, sessions: int, calls_per_session: int = 5, seed: int = 0) -> Dict[str, Any]:
+    """Compare offloaded and on-loop tool handlers under many concurrent sessions.
+
+    The result cache is disabled for the run so every call does its work.
+    """
+    registry = generate_registry(size, seed)
+    workloads = _workloads(registry, seed)
+    calls = [
+        (name, args) for name, arg_sets in workloads.items() if not name.startswith("resource:")
+        for args in arg_sets
+    ]
+    random.Random(seed).shuffle(calls)
+
+    original = server.get_snapshot()
+    offload, cache_bytes = server.OFFLOAD_ENABLED, server.RESULT_CACHE.max_bytes
+    report = {"size": size, "sessions": sessions, "calls_per_session": calls_per_session}
+    try:
+        snapshot = server.RegistrySnapshot(registry)
+        for name in ("search", "tools", "guide", "similar", "facets"):
+            snapshot.index(name)
+        server.publish_snapshot(snapshot)
+        server.RESULT_CACHE.max_bytes = 0
+        for mode, enabled in (("offload", True), ("event_loop", False)):
+            server.OFFLOAD_ENABLED = enabled
+            report[mode] = asyncio.run(_concurrent_sessions(calls, sessions, calls_per_session))
+    finally:
+        server.OFFLOAD_ENABLED = offload
+        server.RESULT_CACHE.max_bytes = cache_bytes
+        server.publish_snapshot(original)
+    return report
+
+def _print_concurrency(report: Dict[str, Any]) -> None:
+    print(f"\n🔀 {report['sessions']} concurrent sessions x {report['calls_per_session']} calls"
+          f" over {report['size']} prompts")
+    for mode in ("offload", "event_loop"):
+        entry = report[mode]
+        lag = entry["loop_lag"]
+        print(f"  {mode}: {entry['calls_per_s']} calls/s, loop lag p50 {lag['p50_ms']} ms"
+              f"  p99 {lag['p99_ms']} ms  max {lag['max_ms']} ms")
+        for name, result in entry["tools"].items():
+            print(f"    {name:42} p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms")
+
+def make_baseline(report: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """Reduce a report to the p50 latencies used for regression checks."""
+    baseline = {"threshold": threshold, "p50_ms": {}}
+    for size, entry in report["sizes"].items():
+        for mode in ("in_process", "session"):
+            for name, result in entry.get(mode, {}).items():
+                baseline["p50_ms"][f"{size}/{mode}/{name}"] = result["p50_ms"]
+    return baseline
+
+def check_regressions(report: Dict[str, Any], baseline: Dict[str, Any],
+                      threshold: Optional[float] = None) -> List[str]:
+    """Return a description of every benchmark slower than baseline allows."""
+    threshold = baseline.get("threshold", DEFAULT_THRESHOLD) if threshold is None else threshold
+    current = make_baseline(report, threshold)["p50_ms"]
+    regressions = []
+    for key, expected in baseline["p50_ms"].items():
+        actual = current.get(key)
+        if actual is None:
+            continue
+        # Ignore sub-50µs jitter on very fast calls
+        allowed = max(expected * (1 + threshold), expected + 0.05)
+        if actual > allowed:
+            regressions.append(f"{key}: p50 {actual:.3f} ms > {allowed:.3f} ms (baseline {expected:.3f} ms)")
+    return regressions
+
+def _print_report(report: Dict[str, Any]) -> None:
+    for size, entry in report["sizes"].items():
+        print(f"\n📏 {size} prompts (indexes built in {entry['build_ms']} ms, peak {entry['build_peak_kib']} KiB)")
+        for mode in ("in_process", "session"):
+            if mode not in entry:
+                continue
+            print(f"  {mode}:")
+            for name, result in entry[mode].items():
+                peak = f"  peak {result['peak_kib']:>9} KiB" if "peak_kib" in result else ""
+                print(f"    {name:42} p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms"
+                      f"  {result['throughput_per_s'] or 0:>10.1f}/s  {result['response_bytes']:>10} B{peak}")
+
+def main():
+    """Run the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated registry sizes (up to 1000000)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--no-session", action="store_true", help="skip the in-memory MCP session runs")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=None,
+                        help=f"allowed p50 slowdown as a fraction (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit non-zero on regressions")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure cold start with compiled snapshots of each size instead")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="run this many concurrent sessions against the largest size instead")
+    parser.add_argument("--concurrency-calls", type=int, default=5, help="tool calls per concurrent session")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    if args.startup:
+        print(f"🚀 Measuring cold start with snapshots of {sizes} prompts")
+        report = bench_startup(sizes, args.startup_runs)
+        _print_startup(report)
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "startup": report}, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+        return 0
+
+    if args.concurrency:
+        print(f"🚀 Running {args.concurrency} concurrent sessions against {max(sizes)} prompts")
+        report = bench_concurrency(max(sizes), args.concurrency, args.concurrency_calls)
+        _print_concurrency(report)
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "concurrency": report}, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+        return 0
+
+    print(f"🚀 Benchmarking registry sizes {sizes}")
+    report = run_benchmarks(sizes, args.iterations, session=not args.no_session)
+    _print_report(report)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results written to {args.output}")
+
+    if args.update_baseline:
+        threshold = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+        with open(args.baseline, "w") as f:
+            json.dump(make_baseline(report, threshold), f, indent=2)
+        print(f"💾 Baseline written to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check_regressions(report, baseline, args.threshold)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            return 1
+        print(f"✅ No regressions against {args.baseline}")
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Awesome Copilot MCP Server over streamable HTTP
+
+Opens a number of concurrent MCP client sessions against a running server
+(or one it starts itself with --spawn) and keeps each of them calling a mix
+of tools for a fixed duration. All sessions share one pooled HTTP client,
+so connections are kept alive between requests. Reports requests per
+second and p50/p99 latency per tool.
+
+Usage:
+    python awesome_copilot_mcp_server.py serve --workers 4 &
+    python loadgen_mcp_server.py --concurrency 64 --duration 15
+    python loadgen_mcp_server.py --spawn --workers 4 --concurrency 256
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+
+DEFAULT_URL = "http://127.0.0.1:8000/mcp"
+DEFAULT_CONCURRENCY = 32
+DEFAULT_DURATION = 10.0
+
+async def _workload(client: ClientSession, seed: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Tool calls to cycle through, built from the server's own registry."""
+    rng = random.Random(seed)
+    result = await client.call_tool("list_prompts", {"page_size": 500, "fields": ["id", "title", "tools"]})
+    prompts = json.loads(result.content[0].text)["items"]
+    tools = sorted({tool for prompt in prompts for tool in prompt["tools"]})
+
+    calls = []
+    for _ in range(64):
+        prompt = rng.choice(prompts)
+        words = prompt["title"].lower().split()
+        calls += [
+            ("search_prompts", {"query": " ".join(rng.sample(words, min(len(words), 2))), "limit": 10}),
+            ("get_prompts_by_tools", {"required_tools": rng.sample(tools, min(len(tools), 2)), "limit": 10}),
+            ("get_prompt_installation_instructions", {"prompt_id": prompt["id"]}),
+            ("find_similar_prompts", {"prompt_ids": [prompt["id"]], "limit": 5}),
+            ("list_prompts", {"page_size": 20, "fields": ["id", "title"]}),
+        ]
+    rng.shuffle(calls)
+    return calls
+
+async def _virtual_client(url: str, http: httpx.AsyncClient, calls: List[Tuple[str, Dict[str, Any]]],
+                          deadline: float, offset: int, latencies: Dict[str, List[float]],
+                          errors: Dict[str, int]) -> None:
+    async with streamable_http_client(url, http_client=http) as (read, write, _):
+        async with ClientSession(read, write) as client:
+            await client.initialize()
+            index = offset
+            while time.perf_counter() < deadline:
+                name, args = calls[index % len(calls)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    result = await client.call_tool(name, args)
+                    failed = result.isError
+                except Exception:
+                    failed = True
+                latencies.setdefault(name, []).append(time.perf_counter() - start)
+                if failed:
+                    errors[name] = errors.get(name, 0) + 1
+
+async def run_load(url: str, concurrency: int = DEFAULT_CONCURRENCY,
+                   duration: float = DEFAULT_DURATION, seed: int = 0) -> Dict[str, Any]:
+    """Run `concurrency` sessions against `url` for `duration` seconds."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(30.0, read=300.0)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as http:
+        async with streamable_http_client(url, http_client=http) as (read, write, _):
+            async with ClientSession(read, write) as client:
+                await client.initialize()
+                calls = await _workload(client, seed)
+
+        latencies: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(
+            _virtual_client(url, http, calls, deadline, i * 7, latencies, errors)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    def percentile(values, p):
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    tools = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        tools[name] = {
+            "calls": len(values),
+            "errors": errors.get(name, 0),
+            "requests_per_s": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(values) * 1000, 2),
+        }
+    total = sum(entry["calls"] for entry in tools.values())
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "errors": sum(errors.values()),
+        "requests_per_s": round(total / elapsed, 1),
+        "tools": tools,
+    }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def spawn_server(port: int, workers: int, timeout: float = 60.0) -> subprocess.Popen:
+    """Start `awesome_copilot_mcp_server.py serve` and wait until it accepts connections."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "awesome_copilot_mcp_server.py")
+    process = subprocess.Popen(
+        [sys.executable, script, "serve", "--port", str(port), "--workers", str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not start listening on port {port} within {timeout} s")
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"\n📈 {report['requests']} requests in {report['duration_s']} s from {report['concurrency']} "
+          f"sessions: {report['requests_per_s']} req/s, {report['errors']} errors")
+    for name, entry in report["tools"].items():
+        print(f"    {name:40} {entry['requests_per_s']:>9.1f} req/s  p50 {entry['p50_ms']:>8.2f} ms"
+              f"  p99 {entry['p99_ms']:>8.2f} ms  errors {entry['errors']}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Generate load from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL, help="streamable HTTP endpoint of the server")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="number of concurrent MCP sessions")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds of load")
+    parser.add_argument("--spawn", action="store_true", help="start a local server on a free port")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for --spawn")
+    parser.add_argument("--output", default=None, help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    process = None
+    url = args.url
+    if args.spawn:
+        port = _free_port()
+        print(f"🚀 Starting a server with {args.workers} worker(s) on port {port}")
+        process = spawn_server(port, args.workers)
+        url = f"http://127.0.0.1:{port}/mcp"
+    try:
+        print(f"🔥 {args.concurrency} sessions against {url} for {args.duration} s")
+        report = asyncio.run(run_load(url, args.concurrency, args.duration))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    _print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -5,32 +5,23 @@ Test script for the Awesome Copilot MCP Server
 
 import json
 import asyncio
+import os
+import tempfile
+import threading
+import subprocess
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
 from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_connected_server_and_client_session
+
+import awesome_copilot_mcp_server as server
 
 # Create the test server
 test_mcp = FastMCP("Test Server")
 
 # Import the prompts registry from our server
-PROMPTS_REGISTRY = {
-    "create-spring-boot-java-project": {
-        "title": "Create Spring Boot Java project prompt",
-        "description": "Create Spring Boot Java project skeleton",
-        "category": "development",
-        "tools": ["changes", "codebase", "editFiles", "findTestFiles", "problems", "runCommands", "runTests", "search", "searchResults", "terminalLastCommand", "testFailure", "usages"]
-    },
-    "csharp-nunit": {
-        "title": "NUnit Best Practices",
-        "description": "Get best practices for NUnit unit testing, including data-driven tests",
-        "category": "testing",
-        "tools": ["changes", "codebase", "editFiles", "problems", "search"]
-    },
-    "create-llms": {
-        "title": "Create LLMs.txt File from Repository Structure",
-        "description": "Create an llms.txt file from scratch based on repository structure following the llms.txt specification at https://llmstxt.org/",
-        "category": "documentation",
-        "tools": ["changes", "codebase", "editFiles", "extensions", "fetch", "githubRepo", "openSimpleBrowser", "problems", "runTasks", "search", "searchResults", "terminalLastCommand", "terminalSelection", "testFailure", "usages", "vscodeAPI"]
-    }
-}
+PROMPTS_REGISTRY = server.PROMPTS_REGISTRY
 
 def test_prompts_registry():
     """Test the prompts registry structure"""
@@ -64,24 +55,185 @@ def test_search_functionality():
     """Test search logic"""
     print("\n🧪 Testing Search Functionality...")
     
-    # Test search by keyword
-    query = "spring"
-    matches = []
-    for prompt_id, metadata in PROMPTS_REGISTRY.items():
-        if (query.lower() in metadata["title"].lower() or 
-            query.lower() in metadata["description"].lower()):
-            matches.append(prompt_id)
-    
-    print(f"✅ Search for '{query}' found {len(matches)} matches: {matches}")
+    # The indexed search must find every prompt a brute-force scan finds
+    for query in ["spring", "xunit", "readme"]:
+        expected = sorted(
+            prompt_id for prompt_id, metadata in PROMPTS_REGISTRY.items()
+            if query in metadata["title"].lower() or query in metadata["description"].lower()
+        )
+        matches = sorted(result["id"] for result in server.search_prompts(query, limit=len(PROMPTS_REGISTRY))["items"])
+        assert matches == expected, (query, matches, expected)
+        print(f"✅ Search for '{query}' found {len(matches)} matches: {matches}")
     
     # Test category filter
     category = "testing"
-    category_matches = [
+    category_matches = sorted(
         prompt_id for prompt_id, metadata in PROMPTS_REGISTRY.items() 
         if metadata["category"] == category
-    ]
+    )
+    listed = sorted(prompt["id"] for prompt in json.loads(server.get_prompts_by_category(category)))
+    assert category_matches and listed == category_matches
+    filtered = server.search_prompts("test", category=category, limit=len(PROMPTS_REGISTRY))["items"]
+    assert filtered and all(PROMPTS_REGISTRY[result["id"]]["category"] == category for result in filtered)
     print(f"✅ Category '{category}' has {len(category_matches)} prompts: {category_matches}")
 
+def test_ranked_search():
+    """Test the inverted-index search engine"""
+    print("\n🧪 Testing Ranked Search...")
+    
+    results = server.search_prompts("xunit")["items"]
+    assert results[0]["id"] == "csharp-xunit"
+    print(f"✅ Exact term search ranks csharp-xunit first")
+    
+    results = server.search_prompts("test", category="testing")["items"]
+    assert results and all(r["category"] == "testing" for r in results)
+    assert results == sorted(results, key=lambda r: -r["score"])
+    print(f"✅ Prefix search within a category returns {len(results)} ranked results")
+    
+    results = server.search_prompts("kotlin spring")["items"]
+    assert [r["id"] for r in results] == ["create-spring-boot-kotlin-project"]
+    print(f"✅ Multi-term search requires every term to match")
+    
+    assert len(server.search_prompts("", limit=3)["items"]) == 3
+    assert server.search_prompts("no-such-term-anywhere")["items"] == []
+    print(f"✅ Limit and empty results handled")
+    
+    snapshot = server.get_snapshot()
+    assert snapshot.index("search") is snapshot.index("search")
+    print(f"✅ Search index built once for registry version {snapshot.version}")
+
+def test_fuzzy_search():
+    """Test typo-tolerant search over the trigram index"""
+    print("\n🧪 Testing Fuzzy Search...")
+    
+    results = server.search_prompts("kotln sprng")["items"]
+    assert results[0]["id"] == "create-spring-boot-kotlin-project"
+    print(f"✅ Misspelled query falls back to fuzzy matching")
+    
+    results = server.search_prompts("dockerfile multistage")["items"]
+    assert results[0]["id"] == "multi-stage-dockerfile"
+    print(f"✅ Joined words match hyphenated ones")
+    
+    assert server.search_prompts("xunit") == server.search_prompts("xunit", fuzzy=False)
+    assert server.search_prompts("kotln", fuzzy=False)["items"] == []
+    results = server.search_prompts("tesing", category="testing", fuzzy=True)["items"]
+    assert results and all(r["category"] == "testing" for r in results)
+    print(f"✅ Exact matches win, and fuzzy matching can be forced or disabled")
+    
+    assert server.search_prompts("qqqqqq")["items"] == []
+    assert server._edit_distance("kotlin", "kotln", 1) == 1
+    assert server._edit_distance("kotlin", "java", 1) == 2
+    print(f"✅ Unrelated queries match nothing")
+
+def test_checkout_loader():
+    """Test building the registry from a local checkout"""
+    print("\n🧪 Testing Checkout Loader...")
+    
+    with tempfile.TemporaryDirectory() as checkout:
+        prompts_dir = os.path.join(checkout, "prompts")
+        os.makedirs(prompts_dir)
+        for prompt_id in ("csharp-xunit", "new-pytest-helper"):
+            with open(os.path.join(prompts_dir, f"{prompt_id}.prompt.md"), "w") as f:
+                f.write(f"---\nmode: 'agent'\ndescription: 'About {prompt_id}'\ntools: ['codebase', 'editFiles']\n---\n# {prompt_id} title\n")
+        manifest = os.path.join(checkout, "manifest.json")
+        
+        registry, stats = server.PromptCheckoutLoader(checkout, manifest).refresh()
+        assert stats["parsed"] == 2
+        assert registry["csharp-xunit"]["category"] == "testing"
+        assert registry["new-pytest-helper"] == {
+            "title": "new-pytest-helper title",
+            "description": "About new-pytest-helper",
+            "category": "testing",
+            "tools": ["codebase", "editFiles"],
+            "mode": "agent"
+        }
+        print(f"✅ Parsed front matter from {stats['scanned']} prompt files")
+        
+        with open(os.path.join(prompts_dir, "new-pytest-helper.prompt.md"), "a") as f:
+            f.write("More text\n")
+        os.remove(os.path.join(prompts_dir, "csharp-xunit.prompt.md"))
+        loader = server.PromptCheckoutLoader(checkout, manifest)
+        registry, stats = loader.refresh()
+        assert (stats["parsed"], stats["removed"]) == (1, 1)
+        assert list(registry) == ["new-pytest-helper"]
+        assert loader.refresh()[1]["parsed"] == 0
+        print(f"✅ Restart with the manifest only re-parses changed files")
+
+class _PromptHTTPHandler(BaseHTTPRequestHandler):
+    """Local stand-in for raw.githubusercontent.com"""
+    requests_seen = []
+    
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.path != "/prompts/csharp-xunit.prompt.md":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b"# XUnit Best Practices\n"
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+def test_prompt_content_cache():
+    """Test prompt body fetching, caching and revalidation"""
+    print("\n🧪 Testing Prompt Content Cache...")
+    
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _PromptHTTPHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    _PromptHTTPHandler.requests_seen.clear()
+    
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = server.PromptContentCache(cache_dir, base_url, ttl=60, offline=False)
+            first = cache.get("csharp-xunit")
+            assert first["source"] == "network" and first["content"].startswith("# XUnit")
+            assert cache.get("csharp-xunit")["source"] == "cache"
+            assert len(_PromptHTTPHandler.requests_seen) == 1
+            print(f"✅ Body fetched once, then served from the cache within the TTL")
+            
+            cache.ttl = 0
+            assert cache.get("csharp-xunit")["source"] == "revalidated"
+            assert _PromptHTTPHandler.requests_seen[-1][1] == '"v1"'
+            print(f"✅ Expired entries are revalidated with If-None-Match")
+            
+            offline = server.PromptContentCache(cache_dir, base_url, ttl=0, offline=True)
+            assert offline.get("csharp-xunit")["sha256"] == first["sha256"]
+            assert "error" in offline.get("csharp-nunit")
+            assert "error" in cache.get("csharp-nunit")
+            assert len(_PromptHTTPHandler.requests_seen) == 3
+            print(f"✅ Offline mode serves only from the cache")
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_compact_registry():
+    """Test the interned, compact registry representation"""
+    print("\n🧪 Testing Compact Registry...")
+    
+    snapshot = server.RegistrySnapshot(PROMPTS_REGISTRY)
+    xunit = snapshot.get("csharp-xunit")
+    nunit = snapshot.get("csharp-nunit")
+    assert xunit.tools is nunit.tools
+    assert xunit.category_code == nunit.category_code
+    assert snapshot.category(xunit) == "testing"
+    assert not hasattr(xunit, "__dict__")
+    print(f"✅ Records share interned tool lists and category codes")
+    
+    for record in snapshot.records:
+        decoded = [snapshot.tools[code] for code in server._iter_bits(record.tool_mask)]
+        assert sorted(decoded) == sorted(PROMPTS_REGISTRY[record.id]["tools"])
+    print(f"✅ Tool bitmasks agree with {len(snapshot.tools)} interned tool names")
+
 def test_tool_filtering():
     """Test tool-based filtering"""
     print("\n🧪 Testing Tool Filtering...")
@@ -94,8 +246,1074 @@ def test_tool_filtering():
         if set(required_tools).issubset(prompt_tools):
             matches.append(prompt_id)
     
+    results = server.get_prompts_by_tools(required_tools)["items"]
+    assert sorted(result["id"] for result in results) == sorted(matches)
+    assert all(result["matching_tools"] == sorted(required_tools) for result in results)
     print(f"✅ Tools {required_tools} found in {len(matches)} prompts: {matches}")
 
+def test_tool_index():
+    """Test the bitset tool index behind get_prompts_by_tools"""
+    print("\n🧪 Testing Tool Index...")
+    
+    required_tools = ["codebase", "editFiles", "runTests"]
+    expected = [
+        prompt_id for prompt_id, metadata in server.PROMPTS_REGISTRY.items()
+        if set(required_tools).issubset(metadata["tools"])
+    ]
+    results = server.get_prompts_by_tools(required_tools)["items"]
+    assert [r["id"] for r in results] == expected
+    assert all(r["matching_tools"] == required_tools for r in results)
+    print(f"✅ All-of match agrees with a linear subset scan ({len(expected)} prompts)")
+    
+    results = server.get_prompts_by_tools(["runTests", "fetch", "get_issue"], match="any", min_overlap=2)["items"]
+    overlaps = [len(r["matching_tools"]) for r in results]
+    assert results and min(overlaps) >= 2 and overlaps == sorted(overlaps, reverse=True)
+    print(f"✅ Any-of match with min_overlap=2 ranks {len(results)} prompts by overlap")
+    
+    assert server.get_prompts_by_tools(["noSuchTool"])["items"] == []
+    print(f"✅ Unknown tools match nothing")
+
+def test_pagination_and_projection():
+    """Test cursor pagination and field projection"""
+    print("\n🧪 Testing Pagination and Projection...")
+    
+    seen = []
+    cursor = None
+    while True:
+        page = server.list_prompts(cursor=cursor, page_size=10, fields=["id"])
+        assert all(list(item) == ["id"] for item in page["items"])
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(PROMPTS_REGISTRY)
+    print(f"✅ Paged through {len(seen)} prompts, 10 at a time")
+    
+    page = server.list_prompts(category="testing", page_size=3)
+    assert page["total"] == 4 and len(page["items"]) == 3
+    try:
+        server.list_prompts(category="documentation", cursor=page["next_cursor"])
+        assert False, "cursor reused for another query"
+    except ValueError:
+        pass
+    print(f"✅ Category pages and cursor/query binding work")
+    
+    results = server.search_prompts("xunit", fields=["id", "score"])["items"]
+    assert list(results[0]) == ["id", "score"]
+    results = server.get_prompts_by_tools(["search"], fields=["id", "matching_tools"])["items"]
+    assert all(r["matching_tools"] == ["search"] for r in results)
+    print(f"✅ Field projection applied to search and tool filters")
+
+    for call, full in (
+            (lambda c: server.search_prompts("test", limit=2, cursor=c),
+             server.search_prompts("test", limit=100)),
+            (lambda c: server.get_prompts_by_tools(["codebase"], limit=7, cursor=c),
+             server.get_prompts_by_tools(["codebase"]))):
+        walked, cursor = [], None
+        while True:
+            result = call(cursor)
+            assert result["total"] == full["total"]
+            walked.extend(result["items"])
+            cursor = result["next_cursor"]
+            if cursor is None:
+                break
+        assert walked == full["items"] and full["next_cursor"] is None
+    first = server.search_prompts("test", limit=2)
+    try:
+        server.search_prompts("spring", limit=2, cursor=first["next_cursor"])
+        assert False, "search cursor reused for another query"
+    except ValueError:
+        pass
+    print(f"✅ Search and tool results paged with cursors bound to their query")
+    
+    try:
+        server.publish_registry({"only-one": dict(PROMPTS_REGISTRY["csharp-xunit"])})
+        server.list_prompts(category="testing", cursor=page["next_cursor"])
+        assert False, "cursor survived a registry change"
+    except ValueError:
+        print(f"✅ Cursors expire when the registry version changes")
+    finally:
+        server.publish_registry(PROMPTS_REGISTRY)
+
+def test_resource_snapshots():
+    """Test pre-rendered resource payloads and revalidation"""
+    print("\n🧪 Testing Resource Snapshots...")
+    
+    listing = server.list_all_prompts()
+    assert listing is server.list_all_prompts()
+    assert len(json.loads(listing)) == len(server.PROMPTS_REGISTRY)
+    print(f"✅ copilot-prompts://list is rendered once and served from the snapshot")
+    
+    version = json.loads(server.get_registry_version())
+    etag = version["etags"]["copilot-prompts://list"]
+    result = server.revalidate_resource("copilot-prompts://list", etag)
+    assert result["modified"] is False and "content" not in result
+    print(f"✅ Revalidating with the current ETag returns no content")
+    
+    result = server.revalidate_resource("copilot-prompts://testing", "stale")
+    assert result["modified"] is True
+    assert [p["id"] for p in json.loads(result["content"])] == ["csharp-mstest", "csharp-nunit", "csharp-xunit", "javascript-typescript-jest"]
+    assert "error" in server.revalidate_resource("copilot-prompts://prompt/nope")
+    print(f"✅ Stale and unknown resources handled")
+
+def test_usage_guide_fragments():
+    """Test the fragment-cached usage guide"""
+    print("\n🧪 Testing Usage Guide Fragments...")
+    
+    guide = server.generate_prompt_usage_guide()
+    assert guide is server.generate_prompt_usage_guide()
+    assert guide.startswith("# Awesome GitHub Copilot Prompts Usage Guide")
+    assert guide.index("## Best-Practices Prompts") < guide.index("## Testing Prompts")
+    print(f"✅ Full guide rendered once per registry version ({len(guide)} characters)")
+    
+    testing = server.generate_prompt_usage_guide("testing")
+    assert testing.count("### ") == 4 and "**ID:** `csharp-xunit`" in testing
+    print(f"✅ Category guide assembled from cached fragments")
+    
+    short = server.generate_prompt_usage_guide(max_chars=3000)
+    assert len(short) <= 3000 and short.endswith("get_prompt_usage_guide_chunks to read the rest._")
+    assert server.generate_prompt_usage_guide(max_chars=10**6) == guide
+    try:
+        server.generate_prompt_usage_guide(max_chars=50)
+        assert False, "Expected a budget smaller than the header to be rejected"
+    except ValueError:
+        pass
+    print(f"✅ Size budget cuts the guide at a prompt boundary")
+    
+    chunks, cursor = [], None
+    while True:
+        page = server.get_prompt_usage_guide_chunks(cursor=cursor, max_chars=4000)
+        chunks.append(page["chunk"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert "\n".join(chunks) == guide and all(len(chunk) <= 4000 for chunk in chunks)
+    print(f"✅ Guide streamed in {len(chunks)} chunks")
+
+def test_benchmark_suite():
+    """Smoke test the benchmark suite on a small synthetic registry"""
+    print("\n🧪 Testing Benchmark Suite...")
+    import bench_mcp_server
+    
+    registry = bench_mcp_server.generate_registry(200, seed=1)
+    assert len(registry) == 200
+    assert {meta["category"] for meta in registry.values()} <= {meta["category"] for meta in PROMPTS_REGISTRY.values()}
+    print(f"✅ Generated a synthetic registry of {len(registry)} prompts")
+    
+    original = server.get_snapshot()
+    report = bench_mcp_server.run_benchmarks([200], iterations=3)
+    assert server.get_snapshot() is original
+    results = report["sizes"]["200"]
+    assert set(results["in_process"]) == set(results["session"])
+    assert results["in_process"]["search_prompts"]["calls"] == 3
+    print(f"✅ Ran {len(results['in_process'])} benchmarks in-process and over an MCP session")
+    
+    baseline = bench_mcp_server.make_baseline(report, 0.5)
+    assert bench_mcp_server.check_regressions(report, baseline) == []
+    baseline["p50_ms"] = {key: -1.0 for key in baseline["p50_ms"]}
+    assert bench_mcp_server.check_regressions(report, baseline)
+    print(f"✅ Regression check flags benchmarks slower than the baseline")
+
+def test_metrics():
+    """Test per-endpoint metrics recorded through an MCP session"""
+    print("\n🧪 Testing Metrics...")
+    
+    search = server.METRICS.endpoint("tool", "search_prompts")
+    tools = server.METRICS.endpoint("tool", "get_prompts_by_tools")
+    calls, tool_errors = search.calls, tools.errors
+    server.search_prompts("xunit")
+    assert search.calls == calls
+    
+    async def exercise():
+        async with create_connected_server_and_client_session(server.mcp._mcp_server) as client:
+            for query in ("xunit", "test", "documentation"):
+                await client.call_tool("search_prompts", {"query": query})
+            await client.call_tool("get_prompts_by_tools", {"required_tools": ["fetch"], "match": "bogus"})
+            result = await client.read_resource("copilot-prompts://metrics")
+            return json.loads(result.contents[0].text)
+    
+    metrics = asyncio.run(exercise())
+    assert search.calls == calls + 3 and tools.errors == tool_errors + 1
+    endpoint = next(e for e in metrics["endpoints"] if e["name"] == "search_prompts")
+    assert endpoint["calls"] == search.calls and endpoint["latency_ms"]["p99"] is not None
+    print(f"✅ Session calls counted, direct calls ignored, errors recorded")
+    
+    text = server.METRICS.to_prometheus()
+    assert 'awesome_copilot_mcp_latency_seconds_bucket{kind="tool",name="search_prompts",le="+Inf"}' in text
+    print(f"✅ Prometheus exposition rendered ({len(text.splitlines())} lines)")
+
+def test_batch_lookups():
+    """Test batch detail and installation lookups"""
+    print("\n🧪 Testing Batch Lookups...")
+    
+    ids = ["csharp-xunit", "no-such-prompt", "create-llms"]
+    details = server.get_prompt_details_batch(ids)
+    assert details["version"] == server.get_snapshot().version
+    assert details["missing"] == ["no-such-prompt"]
+    assert details["results"][0] == json.loads(server.get_prompt_details("csharp-xunit"))
+    assert "error" in details["results"][1]
+    print(f"✅ Details batch matches single lookups and reports missing ids per item")
+    
+    instructions = server.get_prompt_installation_instructions_batch(ids)
+    assert [r.get("prompt_id") for r in instructions["results"]] == ["csharp-xunit", None, "create-llms"]
+    assert instructions["results"][2] == server.get_prompt_installation_instructions("create-llms")
+    print(f"✅ Installation batch returns {len(instructions['results'])} results in request order")
+
+def test_similar_prompts():
+    """Test TF-IDF nearest-neighbour lookups"""
+    print("\n🧪 Testing Similar Prompts...")
+    
+    result = server.find_similar_prompts(["csharp-xunit", "no-such-prompt"], limit=2)
+    similar = [item["id"] for item in result["results"][0]["similar"]]
+    assert similar == ["csharp-mstest", "csharp-nunit"]
+    assert result["results"][1]["error"] and result["missing"] == ["no-such-prompt"]
+    print(f"✅ csharp-xunit is closest to {similar}")
+    
+    result = server.find_similar_prompts(["create-spring-boot-kotlin-project"], category="testing")
+    assert all(item["category"] == "testing" for item in result["results"][0]["similar"])
+    result = server.find_similar_prompts(["csharp-xunit"], limit=50, fields=["id", "score"])
+    scores = [item["score"] for item in result["results"][0]["similar"]]
+    assert scores == sorted(scores, reverse=True) and all(0 < score <= 1 for score in scores)
+    assert "csharp-xunit" not in [item["id"] for item in result["results"][0]["similar"]]
+    print(f"✅ Category filter, ordering and self-exclusion respected")
+    
+    snapshot = server.get_snapshot()
+    index = snapshot.index("similar")
+    seeds = list(range(len(snapshot)))
+    block = index.scores(np.array(seeds))
+    assert np.allclose(np.diag(block), 1, atol=1e-5)
+    assert np.allclose(block, block.T, atol=1e-5)
+    precomputed = server.SimilarityIndex.build(snapshot, top_k=5)
+    for exact, cached in zip(index.neighbours(seeds, 5), precomputed.neighbours(seeds, 5)):
+        assert [doc for doc, _ in exact] == [doc for doc, _ in cached]
+    print(f"✅ Batched scores are symmetric cosines, and precomputed top-k agrees")
+    
+    # Prompts whose every term is too common to keep have no neighbours
+    registry = {
+        prompt_id: {"title": title, "description": "", "category": "testing", "tools": []}
+        for prompt_id, title in [("a", "foo bar"), ("b", "foo"), ("c", "foo")]
+    }
+    sparse = server.RegistrySnapshot(registry)
+    for top_k in (0, 5):
+        assert server.SimilarityIndex.build(sparse, top_k=top_k).neighbours([0, 1, 2], 5) == [[], [], []]
+    with tempfile.TemporaryDirectory() as directory:
+        server.compile_snapshot(sparse, os.path.join(directory, "sparse.snapshot"))
+    print(f"✅ Prompts left without terms build an index with no neighbours")
+
+def test_compiled_snapshot():
+    """Test writing and loading a compiled registry snapshot"""
+    print("\n🧪 Testing Compiled Snapshot...")
+    
+    original = server.get_snapshot()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "registry.snapshot")
+        result = server.compile_snapshot(server.RegistrySnapshot(PROMPTS_REGISTRY), path)
+        assert result["version"] == original.version and "search" in result["indexes"]
+        
+        loaded = server.load_snapshot(path)
+        assert loaded.version == original.version and list(loaded.ids) == original.ids
+        assert [_record_fields(record) for record in loaded.records] == [_record_fields(record) for record in original.records]
+        assert sorted(loaded._stored) == sorted(result["indexes"]) and not loaded._indexes
+        print(f"✅ {result['bytes']} byte snapshot loads with its indexes still encoded")
+        
+        # Records, id lookups and resource bodies are read from the mapped file
+        assert isinstance(loaded.records, server.MappedRecords)
+        assert all(loaded.positions[prompt_id] == doc for prompt_id, doc in original.positions.items())
+        assert "no-such-prompt" not in loaded and loaded.get("no-such-prompt") is None
+        assert loaded.payload("list", dict).etag == server._list_payload(original).etag
+        category = original.categories[0]
+        assert loaded.payload(f"category:{category}", dict).text == server._category_payload(original, category).text
+        assert loaded.payload("list", dict) is loaded.payload("list", dict)
+        assert server._prompt_payload(loaded, "csharp-xunit") is server._prompt_payload(loaded, "csharp-xunit")
+        assert server._prompt_payload(loaded, "csharp-xunit").text == server._prompt_payload(original, "csharp-xunit").text
+        print(f"✅ Records and resource bodies come from the mapping, decoded once per process")
+        
+        try:
+            server.publish_snapshot(loaded)
+            assert server.search_prompts("kotln sprng")["items"][0]["id"] == "create-spring-boot-kotlin-project"
+            assert server.search_prompts("xunit")["items"][0]["id"] == "csharp-xunit"
+            assert server.get_prompts_by_tools(["codebase"])["total"] == len(
+                [meta for meta in PROMPTS_REGISTRY.values() if "codebase" in meta["tools"]])
+            similar = server.find_similar_prompts(["csharp-xunit"], limit=2)["results"][0]["similar"]
+            assert [item["id"] for item in similar] == ["csharp-mstest", "csharp-nunit"]
+            assert "search" not in loaded._stored and "guide" not in loaded._stored
+            assert server.generate_prompt_usage_guide("testing").startswith(server.GUIDE_HEADER)
+        finally:
+            server.publish_snapshot(original)
+        print(f"✅ Stored indexes decode on first use; missing ones are built")
+        
+        partial = os.path.join(directory, "partial.snapshot")
+        server.compile_snapshot(original, partial, indexes=[])
+        assert server.load_snapshot(partial).index("tools").postings == original.index("tools").postings
+        with open(path, "r+b") as f:
+            f.seek(8)
+            f.write(b"\xff")
+        try:
+            server.load_snapshot(path)
+            assert False, "Expected an unsupported format error"
+        except ValueError:
+            pass
+        print(f"✅ Snapshots without indexes and of other formats handled")
+        
+        env = dict(os.environ, AWESOME_COPILOT_SNAPSHOT=os.path.join(directory, "cli.snapshot"))
+        subprocess.run([sys.executable, server.__file__, "compile"], env=env, check=True,
+                       capture_output=True)
+        check = "import awesome_copilot_mcp_server as s; print(s.get_snapshot().version)"
+        output = subprocess.run([sys.executable, "-c", check], env=env, check=True,
+                                capture_output=True, text=True, cwd=os.path.dirname(server.__file__))
+        assert output.stdout.strip() == original.version
+        print(f"✅ compile command output is picked up via AWESOME_COPILOT_SNAPSHOT")
+
+def test_hot_reload():
+    """Test publishing a reloaded registry to connected sessions"""
+    print("\n🧪 Testing Hot Reload...")
+    import signal
+    
+    original = server.get_snapshot()
+    original.index("search")
+    notifications = []
+    
+    async def on_message(message):
+        if getattr(getattr(message, "root", None), "method", None) == "notifications/resources/list_changed":
+            notifications.append(message)
+    
+    async def exercise():
+        async with create_connected_server_and_client_session(
+                server.mcp._mcp_server, message_handler=on_message) as client:
+            before = await client.call_tool("search_prompts", {"query": "xunit"})
+            server.PROMPTS_REGISTRY["hot-reload-check"] = {
+                "title": "Hot Reload Check", "description": "Added while the server is running",
+                "category": "testing", "tools": ["codebase"]}
+            reload = await client.call_tool("refresh_registry", {})
+            for _ in range(50):
+                if notifications:
+                    break
+                await asyncio.sleep(0.01)
+            after = await client.call_tool("search_prompts", {"query": "hot reload"})
+            resource = await client.read_resource("copilot-prompts://categories")
+            return before, json.loads(reload.content[0].text), after, resource
+    
+    try:
+        before, reload, after, resource = asyncio.run(exercise())
+        assert before.meta["registry_version"] == original.version
+        assert reload["changed"] and reload["version"] != original.version
+        assert after.meta["registry_version"] == resource.meta["registry_version"] == reload["version"]
+        assert json.loads(after.content[0].text)["items"][0]["id"] == "hot-reload-check"
+        assert notifications, "Expected a resources/list_changed notification"
+        assert "search" in server.get_snapshot()._indexes
+        print(f"✅ Reload published {reload['version']} with its indexes built; session notified")
+        
+        assert server.refresh_registry()["changed"] is False
+        # A reload from a request pinned to an older version compares
+        # against the published one, and leaves the body index alone
+        token = server._request_snapshot.set(original)
+        server._body_index_checked = True
+        try:
+            assert server.reload_registry()["changed"] is False
+            assert server._body_index_checked
+        finally:
+            server._request_snapshot.reset(token)
+        del server.PROMPTS_REGISTRY["hot-reload-check"]
+        previous = signal.getsignal(server.RELOAD_SIGNAL)
+        try:
+            server.install_reload_triggers(0)
+            os.kill(os.getpid(), server.RELOAD_SIGNAL)
+            for _ in range(500):
+                if server.get_snapshot().version == original.version:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            signal.signal(server.RELOAD_SIGNAL, previous)
+        assert server.get_snapshot().version == original.version
+        print(f"✅ Reload signal rebuilt the registry in the background")
+    finally:
+        server.PROMPTS_REGISTRY.pop("hot-reload-check", None)
+        server.publish_snapshot(original)
+
+def test_result_cache():
+    """Test the versioned result cache for repeated queries"""
+    print("\n🧪 Testing Result Cache...")
+    
+    cache = server.RESULT_CACHE
+    server.search_prompts("xunit tests")
+    hits, misses = cache.hits, cache.misses
+    assert server.search_prompts("XUnit, tests!") is server.search_prompts("xunit tests")
+    server.get_prompts_by_tools(["codebase", "codebase"])
+    assert server.get_prompts_by_tools(["codebase"]) == server.get_prompts_by_tools(["codebase"], "all")
+    assert server.generate_prompt_usage_guide("testing") is server.generate_prompt_usage_guide("testing")
+    server.search_prompts("xunit tests", limit=1)
+    assert cache.hits == hits + 5 and cache.misses == misses + 3
+    print(f"✅ Normalised repeats of a query are cache hits")
+    
+    original = server.get_snapshot()
+    registry = dict(PROMPTS_REGISTRY)
+    registry.pop("csharp-xunit")
+    try:
+        server.publish_registry(registry)
+        assert cache.stats()["entries"] == 0
+        assert "csharp-xunit" not in [item["id"] for item in server.search_prompts("xunit tests")["items"]]
+    finally:
+        server.publish_snapshot(original)
+    assert server.search_prompts("xunit tests")["items"][0]["id"] == "csharp-xunit"
+    print(f"✅ Publishing a new registry version invalidates cached results")
+    
+    small = server.ResultCache(max_bytes=100, ttl=60)
+    for i in range(10):
+        small.put(i, "x" * 30)
+    assert small.bytes <= 100 and small.stats()["entries"] == 3 and small.evictions == 7
+    assert small.get_or_compute(9, lambda: "recomputed") == "x" * 30
+    assert small.get_or_compute(0, lambda: "recomputed") == "recomputed"
+    expiring = server.ResultCache(max_bytes=100, ttl=0.05)
+    expiring.put("key", "value")
+    threading.Event().wait(0.06)
+    assert expiring.get_or_compute("key", lambda: "fresh") == "fresh" and expiring.expirations == 1
+    print(f"✅ Byte budget evicts least recently used entries; TTL expires them")
+    
+    assert server.METRICS.to_dict()["result_cache"]["hits"] == cache.hits
+    assert 'awesome_copilot_mcp_result_cache_lookups_total{result="hit"}' in server.METRICS.to_prometheus()
+    print(f"✅ Hit/miss counters exposed in the metrics")
+
+def test_faceted_search():
+    """Test faceted search counts"""
+    print("\n🧪 Testing Faceted Search...")
+    
+    def brute_force_tools(ids):
+        counts = {}
+        for prompt_id in ids:
+            for tool in PROMPTS_REGISTRY[prompt_id]["tools"]:
+                counts[tool] = counts.get(tool, 0) + 1
+        return counts
+    
+    matches = [item["id"] for item in server.search_prompts("code", limit=1000)["items"]]
+    result = server.search_prompts_faceted("code", limit=5)
+    assert result["version"] == server.get_snapshot().version and result["total"] == len(matches)
+    assert [item["id"] for item in result["results"]] == matches[:5]
+    assert sum(result["facets"]["categories"].values()) == len(matches)
+    assert result["facets"]["tools"] == brute_force_tools(matches)
+    counts = list(result["facets"]["tools"].values())
+    assert counts == sorted(counts, reverse=True)
+    print(f"✅ {result['total']} matches counted over {len(result['facets']['categories'])} categories and {len(counts)} tools")
+    
+    narrowed = server.search_prompts_faceted("code", category="documentation")
+    in_category = [prompt_id for prompt_id in matches if PROMPTS_REGISTRY[prompt_id]["category"] == "documentation"]
+    assert narrowed["total"] == len(in_category) == result["facets"]["categories"]["documentation"]
+    assert narrowed["facets"]["categories"] == result["facets"]["categories"]
+    assert narrowed["facets"]["tools"] == brute_force_tools(in_category)
+    print(f"✅ Category filter narrows results and tool counts, not category counts")
+    
+    everything = server.search_prompts_faceted("", limit=0)
+    assert everything["total"] == len(PROMPTS_REGISTRY) and everything["results"] == []
+    assert everything["facets"]["categories"] == json.loads(server.list_prompt_categories())
+    assert server.search_prompts_faceted("kotln sprng")["total"] == 1
+    print(f"✅ Empty queries use registry-wide counts; misspelled ones fall back to fuzzy matching")
+
+def test_query_planner():
+    """Test query_prompts combining text, category and tool filters"""
+    print("\n🧪 Testing Query Planner...")
+    
+    def ids(items):
+        return [item["id"] for item in items]
+    
+    assert ids(server.query_prompts("test", limit=100)["items"]) == ids(server.search_prompts("test", limit=100)["items"])
+    assert ids(server.query_prompts(all_tools=["codebase", "fetch"], limit=100)["items"]) == ids(
+        server.get_prompts_by_tools(["codebase", "fetch"])["items"])
+    combined = server.query_prompts("code", categories=["documentation"], fields=["id", "score"])
+    assert combined["items"] == server.search_prompts("code", category="documentation", fields=["id", "score"])["items"]
+    print(f"✅ Single filters agree with search_prompts and get_prompts_by_tools")
+    
+    result = server.query_prompts(categories=["testing", "documentation"], any_tools=["search", "fetch"],
+                                  exclude_tools=["editFiles"], sort="id", limit=100)
+    expected = sorted(
+        prompt_id for prompt_id, meta in PROMPTS_REGISTRY.items()
+        if meta["category"] in ("testing", "documentation")
+        and {"search", "fetch"} & set(meta["tools"]) and "editFiles" not in meta["tools"])
+    assert ids(result["items"]) == expected and result["total"] == len(expected)
+    matches = [step["matches"] for step in result["plan"]]
+    assert matches == sorted(matches, reverse=True)
+    print(f"✅ Filters combined most selective first: {[step['step'] for step in result['plan']]}")
+    
+    probed = server.query_prompts("github", all_tools=["get_issue"], limit=100)
+    assert probed["plan"][-1]["strategy"] == "probe"
+    assert ids(probed["items"]) == [
+        item["id"] for item in server.search_prompts("github", limit=100)["items"]
+        if "get_issue" in PROMPTS_REGISTRY[item["id"]]["tools"]]
+    assert server.query_prompts("test", all_tools=["no-such-tool"])["plan"][-1]["matches"] == 0
+    print(f"✅ Text postings probed for a small filtered set; empty filters stop early")
+    
+    pages, cursor = [], None
+    while True:
+        page = server.query_prompts(any_tools=["codebase"], sort="title", limit=7, cursor=cursor)
+        pages.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    titles = [item["title"].lower() for item in pages]
+    assert len(pages) == page["total"] and titles == sorted(titles)
+    try:
+        server.query_prompts(any_tools=["fetch"], cursor=server.query_prompts(any_tools=["codebase"], limit=1)["next_cursor"])
+        assert False, "Expected a cursor mismatch error"
+    except ValueError:
+        pass
+    print(f"✅ {len(pages)} prompts paged by title with cursors bound to the query")
+    
+    # Results are cached under the query itself, so even colliding cursor
+    # hashes cannot hand one query another's results
+    query_key = server._query_key
+    server._query_key = lambda *parts: "00000000"
+    try:
+        testing = server.query_prompts(categories=["testing"], sort="id", limit=100)
+        documentation = server.query_prompts(categories=["documentation"], sort="id", limit=100)
+    finally:
+        server._query_key = query_key
+    assert {PROMPTS_REGISTRY[prompt_id]["category"] for prompt_id in ids(testing["items"])} == {"testing"}
+    assert {PROMPTS_REGISTRY[prompt_id]["category"] for prompt_id in ids(documentation["items"])} == {"documentation"}
+
+def test_offloaded_tools():
+    """Test slow tools running on worker threads behind per-tool limits"""
+    print("\n🧪 Testing Offloaded Tools...")
+    import time
+    import bench_mcp_server
+    
+    app = server.InstrumentedFastMCP("offload-test")
+    threads = []
+    
+    @app.tool(offload=True)
+    def slow_tool(delay: float) -> str:
+        threads.append(threading.current_thread())
+        time.sleep(delay)
+        return "done"
+    
+    limiter = server.OFFLOAD_LIMITERS["slow_tool"]
+    limiter.limiter.total_tokens = 2
+    
+    async def exercise():
+        lags = []
+        async def probe():
+            for _ in range(20):
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - start)
+        async with create_connected_server_and_client_session(app._mcp_server) as client:
+            calls = [client.call_tool("slow_tool", {"delay": 0.1}) for _ in range(4)]
+            results = await asyncio.gather(probe(), *calls)
+        return lags, results[1:]
+    
+    try:
+        lags, results = asyncio.run(exercise())
+    finally:
+        del server.OFFLOAD_LIMITERS["slow_tool"]
+    assert all(result.content[0].text == "done" for result in results)
+    assert threads and threading.main_thread() not in threads
+    assert max(lags) < 0.09, f"event loop blocked for {max(lags):.3f}s"
+    stats = limiter.to_dict()
+    assert stats["calls"] == 4 and stats["limit"] == 2 and stats["max_waiting"] >= 2
+    print(f"✅ 4 slow calls ran on worker threads, 2 at a time, loop lag {max(lags) * 1000:.1f} ms")
+    
+    assert "search_prompts" in server.METRICS.to_dict()["offload"]
+    assert "awesome_copilot_mcp_offload_waiting" in server.METRICS.to_prometheus()
+    
+    original = server.get_snapshot()
+    report = bench_mcp_server.bench_concurrency(200, sessions=8, calls_per_session=2)
+    assert server.get_snapshot() is original and server.OFFLOAD_ENABLED
+    for mode in ("offload", "event_loop"):
+        assert report[mode]["tools"] and report[mode]["loop_lag"]["p99_ms"] >= 0
+    print(f"✅ Concurrency harness ran 8 sessions with and without offloading")
+
+def test_workspace_recommendations():
+    """Test recommending prompts from a scanned workspace"""
+    print("\n🧪 Testing Workspace Recommendations...")
+    
+    with tempfile.TemporaryDirectory() as workspace:
+        def write(path, text=""):
+            path = os.path.join(workspace, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+        
+        write(".gitignore", "bin/\n*.log\n/generated\n")
+        write("Api/Api.csproj", '<Project Sdk="Microsoft.NET.Sdk.Web"></Project>')
+        write("Api/Program.cs")
+        write("Api/bin/Debug/Tool.java")
+        write("Api.Tests/Api.Tests.csproj", '<PackageReference Include="xunit" Version="2.9.0" />')
+        write("Api.Tests/.gitignore", "*.cs\n!Keep.cs\n")
+        write("Api.Tests/Tests.cs")
+        write("Api.Tests/Keep.cs")
+        write("generated/App.kt")
+        write("docs/generated/Other.java")
+        write("node_modules/left-pad/index.js")
+        write("infra/main.bicep")
+        write("Dockerfile")
+        write("build.log")
+        
+        scan = server.scan_workspace(workspace)
+        assert not scan["partial"]
+        assert scan["stacks"] == {"dotnet": 2, "csharp": 4, "aspnet": 1, "xunit": 1, "java": 1,
+                                  "bicep": 1, "azure": 1, "docker": 1}
+        print(f"✅ Fingerprinted {scan['files_scanned']} files, honouring .gitignore: {sorted(scan['stacks'])}")
+        
+        assert server.scan_workspace(workspace, max_files=1)["partial"]
+        try:
+            server.scan_workspace(os.path.join(workspace, "missing"))
+            assert False, "Expected a missing directory to be rejected"
+        except ValueError:
+            pass
+        
+        async def recommend():
+            progress = []
+            async def on_progress(value, total, message):
+                progress.append(message)
+            async with create_connected_server_and_client_session(server.mcp._mcp_server) as client:
+                result = await client.call_tool("recommend_prompts_for_workspace",
+                                                {"path": workspace, "limit": 8}, progress_callback=on_progress)
+            return json.loads(result.content[0].text), progress
+        
+        every = server.WORKSPACE_PROGRESS_EVERY
+        server.WORKSPACE_PROGRESS_EVERY = 1
+        try:
+            result, progress = asyncio.run(recommend())
+        finally:
+            server.WORKSPACE_PROGRESS_EVERY = every
+    
+    ids = [item["id"] for item in result["results"]]
+    assert result["files_scanned"] == scan["files_scanned"] and len(ids) == 8
+    assert {"csharp-xunit", "aspnet-minimal-api-openapi", "update-avm-modules-in-bicep", "multi-stage-dockerfile"} <= set(ids)
+    assert "xunit" in result["results"][ids.index("csharp-xunit")]["stacks"]
+    assert progress and all("files" in message for message in progress)
+    print(f"✅ Recommended {ids[:4]} with {len(progress)} progress updates")
+    assert server.OFFLOAD_LIMITERS["recommend_prompts_for_workspace"].calls >= 1
+    
+    # Every stack the signal tables can emit has a query to recommend from
+    emitted = {stack for stacks in server.STACK_FILE_SIGNALS.values() for stack in stacks}
+    emitted |= {stack for signals in server.STACK_MANIFEST_SIGNALS.values() for _, stack in signals}
+    assert emitted <= set(server.STACK_QUERIES), emitted - set(server.STACK_QUERIES)
+    snapshot = server.get_snapshot()
+    for stack in sorted(emitted):
+        assert snapshot.index("search").scores(server.STACK_QUERIES[stack]), f"No prompts for {stack}"
+    with tempfile.TemporaryDirectory() as workspace:
+        for name in ("src/app.py", "pyproject.toml", "requirements.txt"):
+            os.makedirs(os.path.dirname(os.path.join(workspace, name)), exist_ok=True)
+            open(os.path.join(workspace, name), "w").close()
+        python = asyncio.run(server.recommend_prompts_for_workspace(workspace))
+    assert python["stacks"] == {"python": 3}
+    assert "comment-code-generate-a-tutorial" in [item["id"] for item in python["results"]]
+    print(f"✅ All {len(emitted)} detectable stacks have recommendation queries")
+    
+    # Scans are confined to the configured roots, and need them over HTTP
+    roots, serving_http = server.WORKSPACE_ROOTS, server._serving_http
+    with tempfile.TemporaryDirectory() as allowed, tempfile.TemporaryDirectory() as other:
+        os.makedirs(os.path.join(allowed, "project"))
+        os.symlink(other, os.path.join(allowed, "escape"))
+        try:
+            server._serving_http = True
+            for path in (allowed, other):
+                try:
+                    asyncio.run(server.recommend_prompts_for_workspace(path))
+                    assert False, "Expected a scan over HTTP without workspace roots to be rejected"
+                except ValueError:
+                    pass
+            server.WORKSPACE_ROOTS = [allowed]
+            assert asyncio.run(server.recommend_prompts_for_workspace(os.path.join(allowed, "project")))["files_scanned"] == 0
+            for path in (other, os.path.join(allowed, "escape"), os.path.join(allowed, "..")):
+                try:
+                    asyncio.run(server.recommend_prompts_for_workspace(path))
+                    assert False, f"Expected {path} outside the workspace roots to be rejected"
+                except ValueError:
+                    pass
+        finally:
+            server.WORKSPACE_ROOTS, server._serving_http = roots, serving_http
+    print(f"✅ Scans confined to AWESOME_COPILOT_WORKSPACE_ROOTS")
+
+def test_body_search():
+    """Test full-text search over prompt bodies from a local mirror"""
+    print("\n🧪 Testing Body Search...")
+    
+    saved = {key: os.environ.get(key) for key in ("AWESOME_COPILOT_MIRROR", "AWESOME_COPILOT_DIR", "AWESOME_COPILOT_CACHE_DIR")}
+    with tempfile.TemporaryDirectory() as mirror, tempfile.TemporaryDirectory() as cache:
+        prompts_dir = os.path.join(mirror, "prompts")
+        os.makedirs(prompts_dir)
+        bodies = {
+            "csharp-xunit": "---\ndescription: 'xUnit'\n---\n# XUnit\n\nPrefer [Theory] with InlineData.\nUse FluentAssertions for readable asserts.\n",
+            "csharp-nunit": "# NUnit\n\nUse TestCase attributes.\nFluentAssertions work here too.\n",
+            "javascript-typescript-jest": "# Jest\n\nMock modules with jest.mock.\n",
+            "not-in-registry": "# Stray\n\nFluentAssertions everywhere.\n",
+        }
+        for prompt_id, body in bodies.items():
+            with open(os.path.join(prompts_dir, f"{prompt_id}.prompt.md"), "w") as f:
+                f.write(body)
+        
+        try:
+            os.environ.pop("AWESOME_COPILOT_DIR", None)
+            os.environ.pop("AWESOME_COPILOT_MIRROR", None)
+            server._body_index = None
+            assert "error" in server.search_prompt_bodies("theory")
+            
+            os.environ["AWESOME_COPILOT_MIRROR"] = mirror
+            os.environ["AWESOME_COPILOT_CACHE_DIR"] = cache
+            result = server.search_prompt_bodies("theory inlinedata")
+            assert result["total"] == 1
+            match = result["results"][0]
+            assert match["id"] == "csharp-xunit" and match["lines"] == [5, 7]
+            assert "Prefer [Theory] with InlineData." in match["snippet"].splitlines()
+            print(f"✅ Matched csharp-xunit at lines {match['lines']}: {match['snippet']!r}")
+            
+            ids = [item["id"] for item in server.search_prompt_bodies("fluentassertions")["results"]]
+            assert sorted(ids) == ["csharp-nunit", "csharp-xunit"]
+            assert server.search_prompt_bodies("fluentassertions", category="documentation")["total"] == 0
+            assert server.search_prompt_bodies("theory jest")["total"] == 0
+            print(f"✅ Prompts missing from the registry or the category are left out")
+            
+            # A fresh process maps the index written by the first one
+            server._body_index = None
+            index = server.get_body_index()
+            assert isinstance(index.terms, server.StringTable) and len(index.ids) == 4
+            assert [doc for doc, _, _ in index.postings("fluentassertions")] == [0, 1, 3]
+            
+            with open(os.path.join(prompts_dir, "csharp-nunit.prompt.md"), "a") as f:
+                f.write("Parameterize with TestCaseSource and Theory-like data.\n")
+            server.invalidate_body_index()
+            match = server.search_prompt_bodies("theory", fields=["id", "lines"])["results"]
+            assert {"id": "csharp-nunit", "lines": [4, 5]} in match
+            assert server.get_body_index().version != index.version
+            print(f"✅ Index rebuilt after a mirror file changed")
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            server._body_index = None
+
+def test_call_profiling():
+    """Test on-demand profiling captures of sampled and slow calls"""
+    print("\n🧪 Testing Call Profiling...")
+    import signal
+    
+    profiler = server.PROFILER
+    saved, saved_directory = profiler.state(), profiler.directory
+    with tempfile.TemporaryDirectory() as directory:
+        profiler.directory, profiler.keep = directory, 2
+        
+        async def call(tool, args):
+            async with create_connected_server_and_client_session(server.mcp._mcp_server) as client:
+                result = await client.call_tool(tool, args)
+                return json.loads(result.content[0].text) if result.content else None
+        
+        # The tool is only offered to clients with AWESOME_COPILOT_PROFILE_TOOL=1
+        assert not server.PROFILE_TOOL_ENABLED
+        assert "configure_profiling" not in [tool.name for tool in asyncio.run(server.mcp.list_tools())]
+        server.mcp.tool()(server.configure_profiling)
+        try:
+            asyncio.run(call("search_prompts", {"query": "test"}))
+            assert os.listdir(directory) == []
+            
+            state = asyncio.run(call("configure_profiling", {"enabled": True, "sample_rate": 1.0, "slow_ms": 0}))
+            assert state["enabled"] and state["directory"] == directory
+            for query in ("test", "docs", "azure"):
+                asyncio.run(call("search_prompts", {"query": query}))
+            captures = sorted(os.listdir(directory))
+            assert len(captures) == 2 and all("-search_prompts-" in name for name in captures)
+            assert captures[-1].endswith("-" + server.get_snapshot().version)
+            capture = os.path.join(directory, captures[-1])
+            assert set(os.listdir(capture)) == {"profile.pstats", "allocations.tracemalloc", "summary.txt", "meta.json"}
+            with open(os.path.join(capture, "meta.json")) as f:
+                meta = json.load(f)
+            assert meta["name"] == "search_prompts" and meta["reason"] == "sampled"
+            assert meta["arguments_hash"] in captures[-1] and meta["argument_names"][0] == "category"
+            import pstats
+            assert pstats.Stats(os.path.join(capture, "profile.pstats")).total_calls > 0
+            print(f"✅ Sampled calls captured, rotated down to {len(captures)}: {captures[-1]}")
+            
+            asyncio.run(call("configure_profiling", {"sample_rate": 0.0, "slow_ms": 60000, "handlers": ["search_prompts"]}))
+            before = profiler.captures
+            asyncio.run(call("search_prompts", {"query": "kotlin"}))
+            assert profiler.captures == before
+            asyncio.run(call("configure_profiling", {"slow_ms": 0.001, "memory": False}))
+            asyncio.run(call("get_prompts_by_tools", {"required_tools": ["fetch"]}))
+            asyncio.run(call("search_prompts", {"query": "spring"}))
+            assert profiler.captures == before + 1
+            newest = os.path.join(directory, profiler.recent(1)[0])
+            assert "-search_prompts-" in newest and "allocations.tracemalloc" not in os.listdir(newest)
+            try:
+                server.configure_profiling(sample_rate=2)
+                assert False, "Expected a sample rate above 1 to be rejected"
+            except ValueError:
+                pass
+            print(f"✅ Only slow calls of the selected handler captured")
+            
+            previous = signal.getsignal(server.PROFILE_SIGNAL)
+            server.install_profiling_signal()
+            try:
+                os.kill(os.getpid(), server.PROFILE_SIGNAL)
+                assert not profiler.enabled
+                os.kill(os.getpid(), server.PROFILE_SIGNAL)
+                assert profiler.enabled
+            finally:
+                signal.signal(server.PROFILE_SIGNAL, previous)
+            print(f"✅ {server.PROFILE_SIGNAL.name} toggles profiling")
+        finally:
+            server.mcp.remove_tool("configure_profiling")
+            profiler.configure(saved["enabled"], saved["sample_rate"], saved["slow_ms"],
+                               saved["handlers"] or [], saved["memory"])
+            profiler.directory, profiler.keep = saved_directory, saved["keep"]
+
+def test_git_sync():
+    """Test applying git deltas of a checkout to the registry"""
+    print("\n🧪 Testing Git Sync...")
+    
+    def git(*args):
+        subprocess.run(["git", "-C", checkout, "-c", "user.name=Test", "-c", "user.email=test@example.com",
+                        *args], check=True, capture_output=True)
+    
+    def write(prompt_id, description):
+        with open(os.path.join(checkout, "prompts", f"{prompt_id}.prompt.md"), "w") as f:
+            f.write(f"---\ndescription: '{description}'\ntools: ['codebase']\n---\n# {prompt_id} title\n")
+    
+    with tempfile.TemporaryDirectory() as checkout:
+        os.makedirs(os.path.join(checkout, "prompts"))
+        os.makedirs(os.path.join(checkout, "chatmodes"))
+        for i in range(6):
+            write(f"prompt-{i}", f"Prompt number {i}")
+        os.makedirs(os.path.join(checkout, "drafts"))
+        for name in ("draft", "retired"):
+            with open(os.path.join(checkout, "drafts", f"{name}.prompt.md"), "w") as f:
+                f.write(f"---\ndescription: 'A {name} prompt'\n---\n# {name} title\n")
+        git("init", "-q")
+        git("add", "-A")
+        git("commit", "-q", "-m", "initial")
+        manifest = os.path.join(checkout, "manifest.json")
+        
+        loader = server.PromptCheckoutLoader(checkout, manifest)
+        registry, stats = loader.sync()
+        assert stats["full_rebuild"] and stats["parsed"] == 6 and len(registry) == 6
+        print(f"✅ First sync scanned the checkout and recorded commit {stats['commit'][:12]}")
+        
+        write("prompt-1", "Prompt number one, reworded")
+        write("prompt-new", "A brand new prompt")
+        git("mv", "prompts/prompt-2.prompt.md", "prompts/prompt-two.prompt.md")
+        git("rm", "-q", "prompts/prompt-3.prompt.md")
+        git("mv", "drafts/draft.prompt.md", "prompts/draft.prompt.md")
+        git("mv", "prompts/prompt-5.prompt.md", "drafts/prompt-5.prompt.md")
+        with open(os.path.join(checkout, "chatmodes", "mode.chatmode.md"), "w") as f:
+            f.write("# Not a prompt\n")
+        git("add", "-A")
+        git("commit", "-q", "-m", "update")
+        
+        loader = server.PromptCheckoutLoader(checkout, manifest)
+        registry, stats = loader.sync()
+        assert not stats["full_rebuild"]
+        # Renames into prompts/ from elsewhere add prompts; renames out remove them
+        assert (stats["added"], stats["modified"], stats["renamed"], stats["removed"]) == (2, 1, 1, 2)
+        assert stats["parsed"] == 4
+        expected, _ = server.PromptCheckoutLoader(checkout, os.path.join(checkout, "fresh.json")).refresh()
+        assert registry == expected
+        assert registry["prompt-1"]["description"] == "Prompt number one, reworded"
+        assert "prompt-3" not in registry and "prompt-two" in registry and "prompt-2" not in registry
+        assert "draft" in registry and "prompt-5" not in registry
+        print(f"✅ Applied {stats['parsed']} changed files and 2 removals, matching a full scan")
+        
+        # Files are read from the synced commit, not the working tree
+        write("prompt-4", "Committed description")
+        git("commit", "-q", "-am", "describe prompt-4")
+        write("prompt-4", "Uncommitted description")
+        registry, stats = loader.sync()
+        assert stats["modified"] == 1 and registry["prompt-4"]["description"] == "Committed description"
+        git("checkout", "-q", "--", "prompts/prompt-4.prompt.md")
+        expected = registry
+        
+        registry, stats = loader.sync()
+        assert stats["parsed"] == 0 and not stats["full_rebuild"] and registry == expected
+        
+        # A scan of the working tree drops the commit, so uncommitted edits
+        # are not taken as that commit's content by the next sync
+        write("prompt-4", "Scanned description")
+        assert loader.refresh()[0]["prompt-4"]["description"] == "Scanned description"
+        assert loader.commit is None
+        assert server.PromptCheckoutLoader(checkout, manifest).commit is None
+        registry, stats = loader.sync()
+        assert stats["full_rebuild"] and stats["modified"] == 1 and registry == expected
+        git("checkout", "-q", "--", "prompts/prompt-4.prompt.md")
+        assert loader.refresh()[1]["parsed"] == 0 and loader.commit == stats["commit"]
+        print(f"✅ Refreshing from the working tree forgets the synced commit")
+        
+        for i in range(4):
+            write(f"prompt-{i + 10}", f"Bulk prompt {i}")
+        git("add", "-A")
+        git("commit", "-q", "-m", "bulk")
+        registry, stats = loader.sync(max_changes=3)
+        assert stats["full_rebuild"] and stats["added"] == 4 and stats["parsed"] == 4
+        assert len(registry) == len(expected) + 4
+        print(f"✅ Diffs larger than the limit fall back to a full scan")
+        
+        output = subprocess.run(
+            [sys.executable, server.__file__, "sync", "--checkout", checkout],
+            capture_output=True, text=True, env={**os.environ, "AWESOME_COPILOT_CACHE_DIR": checkout})
+        assert output.returncode == 0 and "Synced 10 prompts" in output.stdout, output.stderr
+        print(f"✅ {output.stdout.strip()}")
+        
+        # The CLI shares the server's manifest, so it diffs from the last sync
+        output = subprocess.run(
+            [sys.executable, server.__file__, "sync", "--checkout", checkout],
+            capture_output=True, text=True, env={**os.environ, "AWESOME_COPILOT_MANIFEST": manifest})
+        assert output.returncode == 0 and "(0 added, 0 modified" in output.stdout, output.stderr
+        print(f"✅ CLI sync used AWESOME_COPILOT_MANIFEST: {output.stdout.strip()}")
+
+def test_incremental_reload():
+    """Test patching the previous snapshot and its indexes for small diffs"""
+    print("\n🧪 Testing Incremental Reload...")
+    import bench_mcp_server
+
+    registry = dict(sorted(bench_mcp_server.generate_registry(200, seed=2).items()))
+    previous = server.RegistrySnapshot(registry)
+    names = ("search", "trigrams", "tools", "facets", "similar", "guide")
+    for name in names:
+        previous.index(name)
+    keys = list(registry)
+    updated = dict(registry)
+    updated[keys[10]] = {**registry[keys[10]], "description": "Reworded with quokka words",
+                         "tools": ["codebase", "brandNewTool"]}
+    del updated[keys[50]]
+    updated[keys[120] + "-copy"] = {**registry[keys[3]], "title": "Added xylophone prompt"}
+    updated = dict(sorted(updated.items()))
+
+    def rebuilt(snapshot):
+        raise AssertionError("index rebuilt instead of patched")
+    builders = dict(server._INDEX_BUILDERS)
+    server._INDEX_BUILDERS.update({name: rebuilt for name in names})
+    try:
+        patched = previous.patched(updated, {keys[10], keys[50], keys[120] + "-copy"})
+        indexes = {name: patched.index(name) for name in names}
+    finally:
+        server._INDEX_BUILDERS.update(builders)
+    assert patched.records[patched.positions[keys[11]]] is previous.records[previous.positions[keys[11]]]
+    print(f"✅ Patched {len(indexes)} indexes for 3 changed prompts without rebuilding any")
+
+    fresh = server.RegistrySnapshot(updated)
+    assert patched.version == fresh.version == server._registry_version(updated)
+    assert patched.ids == fresh.ids and patched.categories == fresh.categories
+    for query in ("quokka", "code review", "xylophone", "test"):
+        assert indexes["search"].search(query) == fresh.index("search").search(query)
+        assert indexes["trigrams"].search("quokk xylophon") == fresh.index("trigrams").search("quokk xylophon")
+    for tools in (["codebase"], ["brandNewTool"], ["editFiles", "codebase"]):
+        assert indexes["tools"].match(tools, "any") == fresh.index("tools").match(tools, "any")
+    assert indexes["facets"].category_counts == fresh.index("facets").category_counts
+    assert indexes["facets"].tool_counts == fresh.index("facets").tool_counts
+    seeds = list(range(len(fresh)))
+    assert indexes["similar"].neighbours(seeds, 5) == fresh.index("similar").neighbours(seeds, 5)
+    assert indexes["guide"].render() == fresh.index("guide").render()
+    print(f"✅ Patched indexes answer exactly like a fresh build of version {patched.version}")
+
+    # Changing most of the registry is cheaper to build from scratch
+    rewritten = {key: {**meta, "title": meta["title"] + " v2"} for key, meta in registry.items()}
+    server._INDEX_BUILDERS.update({name: rebuilt for name in names})
+    try:
+        assert not previous.patched(rewritten, set(rewritten))._indexes
+    finally:
+        server._INDEX_BUILDERS.update(builders)
+    print(f"✅ Large diffs fall back to a full build")
+
+    original, loader, version = server.get_snapshot(), server._checkout_loader, server._checkout_version
+    with tempfile.TemporaryDirectory() as checkout:
+        os.makedirs(os.path.join(checkout, "prompts"))
+        for prompt_id in keys[:40]:
+            with open(os.path.join(checkout, "prompts", f"{prompt_id}.prompt.md"), "w") as f:
+                f.write(f"---\ndescription: 'About {prompt_id}'\ntools: ['codebase']\n---\n# {prompt_id}\n")
+        manifest = os.path.join(checkout, "manifest.json")
+        try:
+            server._checkout_loader = server.PromptCheckoutLoader(checkout, manifest)
+            server._checkout_version = None
+            first = server.reload_registry()
+            server.get_snapshot().index("search")
+            with open(os.path.join(checkout, "prompts", f"{keys[5]}.prompt.md"), "w") as f:
+                f.write(f"---\ndescription: 'Now about quokkas'\ntools: ['codebase']\n---\n# {keys[5]}\n")
+            with open(manifest) as f:
+                written = f.read()
+            server._INDEX_BUILDERS["search"] = rebuilt
+            try:
+                result = server.reload_registry()
+            finally:
+                server._INDEX_BUILDERS.update(builders)
+            assert result["changed"] and result["parsed"] == 1 and result["version"] != first["version"]
+            assert server._checkout_loader.changed == {keys[5]}
+            # Only the changed file's record is appended to the journal
+            with open(manifest) as f:
+                assert f.read() == written
+            with open(manifest + ".journal") as f:
+                assert list(json.loads(f.read())["files"]) == [f"{keys[5]}.prompt.md"]
+            reread = server.PromptCheckoutLoader(checkout, manifest)
+            assert reread.files == server._checkout_loader.files and reread.commit is None
+            # A line cut short by a crash is ignored, and the next write
+            # rewrites the manifest rather than appending after it
+            with open(manifest + ".journal", "a") as f:
+                f.write('{"journal": "cut')
+            reread = server.PromptCheckoutLoader(checkout, manifest)
+            assert reread.files == server._checkout_loader.files
+            os.remove(os.path.join(checkout, "prompts", f"{keys[6]}.prompt.md"))
+            assert reread.refresh()[1]["removed"] == 1 and not os.path.exists(manifest + ".journal")
+            assert server.PromptCheckoutLoader(checkout, manifest).files == reread.files
+        finally:
+            server._checkout_loader, server._checkout_version = loader, version
+            server.publish_snapshot(original)
+    print(f"✅ A one-file reload patched the published snapshot and journalled the manifest")
+
+def _record_fields(record):
+    return tuple(getattr(record, name) for name in server.PromptRecord.__slots__)
+
+def test_http_serving():
+    """Test multi-worker streamable HTTP serving and graceful reload"""
+    print("\n🧪 Testing HTTP Serving...")
+    import signal
+    import loadgen_mcp_server as loadgen
+    
+    try:
+        server.serve_http(workers=2, stateless=False)
+        assert False, "Expected stateful multi-worker mode to be rejected"
+    except ValueError:
+        pass
+    
+    # DNS rebinding protection stays on, whatever the bind address
+    saved = os.environ.pop("AWESOME_COPILOT_HTTP_ALLOWED_HOSTS", None)
+    try:
+        try:
+            server.serve_http(host="0.0.0.0")
+            assert False, "Expected binding every interface without allowed hosts to be rejected"
+        except ValueError:
+            pass
+        security = server._http_transport_security("10.1.2.3")
+        assert security.enable_dns_rebinding_protection and "10.1.2.3:*" in security.allowed_hosts
+        os.environ["AWESOME_COPILOT_HTTP_ALLOWED_HOSTS"] = "prompts.example.com:8000"
+        security = server._http_transport_security("0.0.0.0")
+        assert security.allowed_hosts == ["prompts.example.com:8000"]
+        assert "https://prompts.example.com:8000" in security.allowed_origins
+    finally:
+        os.environ.pop("AWESOME_COPILOT_HTTP_ALLOWED_HOSTS", None)
+        if saved is not None:
+            os.environ["AWESOME_COPILOT_HTTP_ALLOWED_HOSTS"] = saved
+    print(f"✅ Allowed hosts come from the bind address or AWESOME_COPILOT_HTTP_ALLOWED_HOSTS")
+    
+    port = loadgen._free_port()
+    process = loadgen.spawn_server(port, workers=2)
+    try:
+        url = f"http://127.0.0.1:{port}/mcp"
+        report = asyncio.run(loadgen.run_load(url, concurrency=4, duration=1.0))
+        assert report["requests"] > 0 and report["errors"] == 0
+        assert "search_prompts" in report["tools"]
+        print(f"✅ 2 workers served {report['requests']} requests from 4 sessions without errors")
+        
+        import httpx
+        response = httpx.post(url, headers={"Host": "attacker.example", "Content-Type": "application/json"},
+                              content="{}")
+        assert response.status_code == 421, response.status_code
+        
+        # SIGHUP replaces the workers one by one while requests keep flowing
+        process.send_signal(signal.SIGHUP)
+        report = asyncio.run(loadgen.run_load(url, concurrency=4, duration=2.0))
+        assert report["requests"] > 0 and report["errors"] == 0
+        assert process.poll() is None
+        print(f"✅ Graceful reload dropped no requests")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
 def test_installation_urls():
     """Test installation URL generation"""
     print("\n🧪 Testing Installation URLs...")
@@ -115,7 +1333,32 @@ def main():
         test_prompts_registry()
         test_resource_urls()
         test_search_functionality()
+        test_ranked_search()
+        test_fuzzy_search()
+        test_checkout_loader()
+        test_compact_registry()
+        test_prompt_content_cache()
         test_tool_filtering()
+        test_tool_index()
+        test_pagination_and_projection()
+        test_resource_snapshots()
+        test_usage_guide_fragments()
+        test_benchmark_suite()
+        test_metrics()
+        test_batch_lookups()
+        test_similar_prompts()
+        test_compiled_snapshot()
+        test_hot_reload()
+        test_result_cache()
+        test_faceted_search()
+        test_query_planner()
+        test_offloaded_tools()
+        test_workspace_recommendations()
+        test_body_search()
+        test_call_profiling()
+        test_git_sync()
+        test_incremental_reload()
+        test_http_serving()
         test_installation_urls()
         
         print("\n🎉 All tests passed! The MCP server structure is valid.")